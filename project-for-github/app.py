@@ -1,140 +1,707 @@
-from flask import Flask, render_template, request, jsonify
-from datetime import datetime
-from schedule_data import (
-    schedule, 
-    get_variant_by_id,
-    get_current_date_time,
-    get_variant_datetime,
-    get_variant_end_datetime,
-    format_datetime,
-    get_duration_minutes
-)
-
-app = Flask(__name__)
-
-@app.route('/')
-def mailbox():
-    """Почтовый ящик"""
-    return render_template('mailbox.html')
-
-@app.route('/letters')
-def letters():
-    """Страница с письмами"""
-    return render_template('letters.html')
-
-@app.route('/api/letters')
-def api_letters():
-    """API для получения всех писем (вариантов)"""
-    # Получаем все варианты из обеих колонок (исключаем специальные письма)
-    all_variants = []
-    for variant in schedule["variants"]:
-        variant_id = variant["id"]
-        # Пропускаем специальные письма
-        if variant.get("special", False):
-            continue
-        if not (variant_id.endswith('a') or variant_id.endswith('b')):
-            continue
-        
-        start_dt = get_variant_datetime(variant)
-        end_dt = get_variant_end_datetime(variant)
-        
-        if not end_dt:
-            continue
-        
-        variant_data = {
-            "id": variant_id,
-            "title": variant["title"],
-            "date": variant["date"],
-            "start_time": variant["start_time"],
-            "duration": variant.get("duration", ""),
-            "end_time": variant.get("end_time", ""),
-            "description": variant.get("description", ""),
-            "image": variant.get("image", "📄"),
-            "start_datetime_str": format_datetime(start_dt),
-            "end_datetime_str": format_datetime(end_dt),
-            "duration_minutes": get_duration_minutes(variant.get("duration", ""))
-        }
-        all_variants.append(variant_data)
-    
-    # Сортируем по времени начала
-    all_variants.sort(key=lambda v: v["start_datetime_str"])
-    
-    return jsonify({
-        "letters": all_variants
-    })
-
-@app.route('/api/letter/<variant_id>')
-def api_letter(variant_id):
-    """API для получения деталей одного письма"""
-    variant = get_variant_by_id(variant_id)
-    if not variant:
-        return jsonify({"error": "Письмо не найдено"}), 404
-    
-    start_dt = get_variant_datetime(variant)
-    end_dt = get_variant_end_datetime(variant)
-    
-    letter_data = {
-        "id": variant["id"],
-        "title": variant["title"],
-        "date": variant["date"],
-        "start_time": variant["start_time"],
-        "duration": variant.get("duration", ""),
-        "end_time": variant.get("end_time", ""),
-        "description": variant.get("description", ""),
-        "image": variant.get("image", "📄"),
-        "start_datetime_str": format_datetime(start_dt),
-        "end_datetime_str": format_datetime(end_dt) if end_dt else None,
-        "duration_minutes": get_duration_minutes(variant.get("duration", ""))
-    }
-    
-    return jsonify(letter_data)
-
-@app.route('/api/current_time')
-def api_current_time():
-    """API для получения текущего времени"""
-    now = datetime.now()
-    date_str, time_str = get_current_date_time()
-    return jsonify({
-        "time": time_str,
-        "date": date_str,
-        "full_date": now.strftime("%d.%m.%Y")
-    })
-
-@app.route('/api/all_letters_with_special')
-def api_all_letters_with_special():
-    """API для получения всех писем включая специальные (для серых меток)"""
-    all_variants = []
-    for variant in schedule["variants"]:
-        variant_id = variant["id"]
-        
-        start_dt = get_variant_datetime(variant)
-        end_dt = get_variant_end_datetime(variant)
-        
-        if not end_dt:
-            continue
-        
-        variant_data = {
-            "id": variant_id,
-            "title": variant["title"],
-            "date": variant["date"],
-            "start_time": variant["start_time"],
-            "duration": variant.get("duration", ""),
-            "end_time": variant.get("end_time", ""),
-            "description": variant.get("description", ""),
-            "image": variant.get("image", "📄"),
-            "start_datetime_str": format_datetime(start_dt),
-            "end_datetime_str": format_datetime(end_dt),
-            "duration_minutes": get_duration_minutes(variant.get("duration", "")),
-            "special": variant.get("special", False),
-            "type": variant.get("type", "")
-        }
-        all_variants.append(variant_data)
-    
-    all_variants.sort(key=lambda v: v["start_datetime_str"])
-    
-    return jsonify({
-        "letters": all_variants
-    })
-
-if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+from flask import Flask, Response, render_template, request, jsonify
+from datetime import datetime
+import hashlib
+import json
+import re
+import metrics  # Первым: при METRICS_ENABLED оборачивает schedule_data таймерами
+import assets
+import offline
+import profiling
+import schedule_snapshot
+import schedule_source
+from schedule_data import (
+    get_schedule_index,
+    get_current_date_time,
+    get_current_schedule_datetime,
+    get_change_log,
+    format_datetime,
+    parse_datetime
+)
+from response_cache import (
+    CACHE_CONTROL, cached_json_response, cached_html_response, conditional_response, default_cache, get_cached_body,
+    get_cached_html,
+)
+from live_stream import close_stream, stream_events, streams_enabled, try_open_stream
+from plan_store import plan_store
+from layout import compute_layout
+from now_snapshots import NOW_MAX_AGE_SECONDS, get_now_snapshots
+from export import export_response
+from itinerary import MAX_ITINERARY_MULTIPLIER, get_itinerary_planner, parse_weights
+from search import MAX_SEARCH_RESULTS_LIMIT, SEARCH_RESULTS_LIMIT, get_search_index, restore_search_index
+
+app = Flask(__name__)
+metrics.init_app(app)
+profiling.init_app(app)
+assets.init_app(app)
+
+@app.route('/')
+def mailbox():
+    """Почтовый ящик"""
+    return render_template('mailbox.html', base_path='')
+
+def render_letters_page(index, base_path):
+    """HTML страницы писем с данными для первого рендера"""
+    return render_template('letters.html', base_path=base_path, initial_data=build_initial_payload(index),
+                           live_stream=streams_enabled())
+
+@app.route('/letters')
+def letters():
+    """Страница с письмами (данные для первого рендера встроены в страницу)"""
+    index = get_schedule_index()
+    return cached_html_response(
+        "page:letters", lambda: render_letters_page(index, ''), version=index.version, revision=index.revision
+    )
+
+def build_letter_list_item(index, variant):
+    """Письмо в виде элемента списка /api/letters или None, если письмо в список не входит"""
+    variant_id = variant["id"]
+    # Пропускаем специальные письма
+    if variant.get("special", False):
+        return None
+    if not (variant_id.endswith('a') or variant_id.endswith('b')):
+        return None
+    
+    start_dt = index.start_of(variant)
+    end_dt = index.end_of(variant)
+    
+    if not end_dt:
+        return None
+    
+    return {
+        "id": variant_id,
+        "title": variant["title"],
+        "date": variant["date"],
+        "start_time": variant["start_time"],
+        "duration": variant.get("duration", ""),
+        "end_time": variant.get("end_time", ""),
+        "description": variant.get("description", ""),
+        "image": variant.get("image", "📄"),
+        "start_datetime_str": format_datetime(start_dt),
+        "end_datetime_str": format_datetime(end_dt),
+        "duration_minutes": index.duration_of(variant)
+    }
+
+def build_letters_payload(index):
+    """Собрать список всех писем (вариантов) для /api/letters"""
+    # Получаем все варианты из обеих колонок (исключаем специальные письма)
+    all_variants = []
+    for variant in index.source_variants:
+        variant_data = build_letter_list_item(index, variant)
+        if variant_data:
+            all_variants.append(variant_data)
+    
+    # Сортируем по времени начала
+    all_variants.sort(key=lambda v: v["start_datetime_str"])
+    
+    return {
+        "letters": all_variants
+    }
+
+# Окно писем: сколько писем отдавать за одну страницу по умолчанию и максимум
+WINDOW_PAGE_SIZE = 100
+MAX_WINDOW_PAGE_SIZE = 500
+WINDOW_BOUND_RE = re.compile(r'^\d{2}\.\d{2} \d{2}:\d{2}$')
+
+def parse_window_bound(value):
+    """Граница окна в формате "ДД.ММ ЧЧ:ММ" (как start_datetime_str) -> datetime"""
+    if not value:
+        return None
+    if not WINDOW_BOUND_RE.match(value):
+        raise ValueError(value)
+    date_str, time_str = value.split(' ')
+    return parse_datetime(date_str, time_str)
+
+def letters_window_response(index):
+    """Письма, пересекающие окно [from, to), постранично (?from=&to=&cursor=&limit=)
+
+    Письма идут в порядке начала из индекса; cursor из next_cursor
+    продолжает выдачу с места, где закончилась предыдущая страница.
+    Курсор привязан к версии расписания: после смены расписания окно
+    нужно запросить заново.
+    """
+    try:
+        from_dt = parse_window_bound(request.args.get("from"))
+        to_dt = parse_window_bound(request.args.get("to"))
+        limit = int(request.args.get("limit", WINDOW_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "Неверные параметры окна: from/to в формате ДД.ММ ЧЧ:ММ, limit - число"}), 400
+    limit = max(1, min(limit, MAX_WINDOW_PAGE_SIZE))
+    
+    slot = 0
+    cursor = request.args.get("cursor")
+    if cursor:
+        version, _, position = cursor.partition(".")
+        if version != index.version:
+            return jsonify({"error": "Расписание изменилось, запросите окно заново"}), 409
+        if not position.isdigit():
+            return jsonify({"error": "Неверный курсор"}), 400
+        slot = int(position)
+    
+    letters = []
+    while slot is not None and len(letters) < limit:
+        requested = limit - len(letters)
+        slots = index.overlapping_slots(from_dt, to_dt, slot, requested)
+        for found in slots:
+            variant_data = build_letter_list_item(index, index.variants[found])
+            if variant_data:
+                letters.append(variant_data)
+        # Меньше, чем просили - окно исчерпано
+        slot = slots[-1] + 1 if len(slots) == requested else None
+    
+    payload = {
+        "letters": letters,
+        "from": request.args.get("from"),
+        "to": request.args.get("to"),
+        "next_cursor": f"{index.version}.{slot}" if slot is not None else None,
+        "version": index.version
+    }
+    body = (app.json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+    return conditional_response(body, hashlib.sha1(body).hexdigest(), "application/json")
+
+def is_window_request():
+    return any(name in request.args for name in ("from", "to", "cursor"))
+
+@app.route('/api/letters')
+def api_letters():
+    """API для получения всех писем (вариантов) или окна писем (?from=&to=&cursor=)"""
+    # Индекс берем один раз: при горячей замене запрос дорабатывает на своей версии
+    index = get_schedule_index()
+    if is_window_request():
+        return letters_window_response(index)
+    return cached_json_response("letters", lambda: build_letters_payload(index), version=index.version)
+
+def build_letter_payload(index, variant):
+    """Собрать детали одного письма для /api/letter/<variant_id>"""
+    start_dt = index.start_of(variant)
+    end_dt = index.end_of(variant)
+    
+    letter_data = {
+        "id": variant["id"],
+        "title": variant["title"],
+        "date": variant["date"],
+        "start_time": variant["start_time"],
+        "duration": variant.get("duration", ""),
+        "end_time": variant.get("end_time", ""),
+        "description": variant.get("description", ""),
+        "image": variant.get("image", "📄"),
+        "start_datetime_str": format_datetime(start_dt),
+        "end_datetime_str": format_datetime(end_dt) if end_dt else None,
+        "duration_minutes": index.duration_of(variant)
+    }
+    
+    return letter_data
+
+@app.route('/api/letter/<variant_id>')
+def api_letter(variant_id):
+    """API для получения деталей одного письма"""
+    index = get_schedule_index()
+    variant = index.get_by_id(variant_id)
+    if not variant:
+        return jsonify({"error": "Письмо не найдено"}), 404
+    
+    return cached_json_response(
+        f"letter:{variant_id}", lambda: build_letter_payload(index, variant), version=index.version
+    )
+
+# Сколько писем можно запросить одним батчем
+MAX_BATCH_IDS = 200
+
+def letters_batch_response(index, cache=None, version=None):
+    """Детали нескольких писем одним ответом (?ids=1a,2b,...)
+
+    Тело собирается из уже сериализованных ответов /api/letter/<id>,
+    поэтому батч не строит и не сериализует письма заново.
+    """
+    requested = [variant_id for variant_id in request.args.get("ids", "").split(",") if variant_id]
+    if len(requested) > MAX_BATCH_IDS:
+        return jsonify({"error": f"Не больше {MAX_BATCH_IDS} писем за запрос"}), 400
+    
+    bodies = []
+    missing = []
+    for variant_id in dict.fromkeys(requested):
+        variant = index.get_by_id(variant_id)
+        if not variant:
+            missing.append(variant_id)
+            continue
+        body, _ = get_cached_body(
+            f"letter:{variant_id}", lambda: build_letter_payload(index, variant), cache, version
+        )
+        bodies.append(body.rstrip(b"\n"))
+    
+    body = (
+        b'{"letters":[' + b",".join(bodies) + b'],"missing":'
+        + json.dumps(missing, separators=(",", ":")).encode("utf-8") + b"}\n"
+    )
+    return conditional_response(body, hashlib.sha1(body).hexdigest(), "application/json")
+
+@app.route('/api/letters/batch')
+def api_letters_batch():
+    """API для получения деталей нескольких писем (?ids=1a,2b,...)"""
+    index = get_schedule_index()
+    return letters_batch_response(index, version=index.version)
+
+def letters_changes_response(index, change_log):
+    """Изменения писем после версии ?since=<номер> или указание загрузить все заново"""
+    since = request.args.get("since", "")
+    if not since.isdigit():
+        return jsonify({"error": "Параметр since должен быть номером версии"}), 400
+    
+    changes = change_log.changes_since(int(since), index.revision)
+    if changes is None:
+        # Журнал уже не помнит эту версию
+        payload = {"revision": index.revision, "full_resync": True}
+    else:
+        letters = []
+        for variant_id in changes["added"] + changes["modified"]:
+            variant = index.get_by_id(variant_id)
+            variant_data = build_letter_list_item(index, variant) if variant else None
+            if variant_data:
+                letters.append(variant_data)
+        payload = {"revision": index.revision, "full_resync": False, "letters": letters, **changes}
+    
+    response = jsonify(payload)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route('/api/letters/changes')
+def api_letters_changes():
+    """API изменений писем после версии since (добавленные, удаленные, измененные)"""
+    return letters_changes_response(get_schedule_index(), get_change_log())
+
+@app.route('/api/current_time')
+def api_current_time():
+    """API для получения текущего времени"""
+    now = datetime.now()
+    date_str, time_str = get_current_date_time()
+    return jsonify({
+        "time": time_str,
+        "date": date_str,
+        "full_date": now.strftime("%d.%m.%Y")
+    })
+
+@app.route('/api/time_sync')
+def api_time_sync():
+    """API синхронизации часов: точное время сервера для расчета смещения на клиенте"""
+    now = datetime.now().astimezone()
+    response = jsonify({
+        "epoch_ms": round(now.timestamp() * 1000, 3),
+        "utc_offset_minutes": int(now.utcoffset().total_seconds() // 60)
+    })
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+def now_response(index):
+    """Письма, доступные прямо сейчас: готовый ответ промежутка между границами"""
+    body, etag, seconds_left = get_now_snapshots(index).get(get_current_schedule_datetime())
+    response = conditional_response(body, etag, "application/json")
+    # Ответ действителен до ближайшей границы расписания
+    max_age = NOW_MAX_AGE_SECONDS if seconds_left is None else min(NOW_MAX_AGE_SECONDS, int(seconds_left))
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    return response
+
+@app.route('/api/now')
+def api_now():
+    """API писем, доступных в текущий момент"""
+    return now_response(get_schedule_index())
+
+def build_all_letters_payload(index):
+    """Собрать список всех писем включая специальные"""
+    all_variants = []
+    for variant in index.source_variants:
+        variant_id = variant["id"]
+        
+        start_dt = index.start_of(variant)
+        end_dt = index.end_of(variant)
+        
+        if not end_dt:
+            continue
+        
+        variant_data = {
+            "id": variant_id,
+            "title": variant["title"],
+            "date": variant["date"],
+            "start_time": variant["start_time"],
+            "duration": variant.get("duration", ""),
+            "end_time": variant.get("end_time", ""),
+            "description": variant.get("description", ""),
+            "image": variant.get("image", "📄"),
+            "start_datetime_str": format_datetime(start_dt),
+            "end_datetime_str": format_datetime(end_dt),
+            "duration_minutes": index.duration_of(variant),
+            "special": variant.get("special", False),
+            "type": variant.get("type", "")
+        }
+        all_variants.append(variant_data)
+    
+    all_variants.sort(key=lambda v: v["start_datetime_str"])
+    
+    return {
+        "letters": all_variants
+    }
+
+@app.route('/api/layout')
+def api_layout():
+    """API готовой раскладки писем (дорожки, узкие письма, промежутки, масштаб)"""
+    index = get_schedule_index()
+    return cached_json_response("layout", lambda: compute_layout(index), version=index.version)
+
+# Поля письма, нужные странице до загрузки окон: шкала, метки и переходы по времени
+TIMELINE_FIELDS = ("id", "start_datetime_str", "end_datetime_str", "duration_minutes", "special", "type")
+
+def build_timeline_payload(index):
+    """Облегченный список всех писем (включая специальные) без названий и описаний"""
+    return [
+        {field: letter[field] for field in TIMELINE_FIELDS}
+        for letter in build_all_letters_payload(index)["letters"]
+    ]
+
+def build_initial_payload(index):
+    """Все данные для первого рендера страницы писем одним объектом
+
+    Содержимое писем сюда не входит: страница подгружает его окнами
+    через /api/letters?from=&to= по мере прокрутки.
+    """
+    return {
+        "revision": index.revision,
+        "timeline": build_timeline_payload(index),
+        "layout": compute_layout(index)
+    }
+
+@app.route('/api/initial')
+def api_initial():
+    """API со шкалой писем и раскладкой одним ответом"""
+    index = get_schedule_index()
+    return cached_json_response(
+        "initial", lambda: build_initial_payload(index), version=index.version, revision=index.revision
+    )
+
+# Через сколько секунд клиенту, получившему отказ в потоке, стоит проверить
+# изменения расписания (как и опрос на странице)
+STREAM_RETRY_AFTER_SECONDS = 300
+
+def event_stream_response(get_index):
+    """Ответ с SSE-потоком событий времени; get_index - текущий индекс расписания
+
+    Потоков не больше STREAM_MAX_CONNECTIONS на процесс; сверх лимита - 503.
+    """
+    if not try_open_stream():
+        response = jsonify({"error": "Поток событий недоступен, проверяйте изменения опросом"})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(STREAM_RETRY_AFTER_SECONDS)
+        return response
+    response = Response(stream_events(get_index), mimetype="text/event-stream")
+    # Место освобождается, когда сервер закрывает ответ (в том числе при обрыве)
+    response.call_on_close(close_stream)
+    response.headers["Cache-Control"] = "no-cache"
+    # Отключаем буферизацию на прокси, иначе события приходят пачками
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+@app.route('/api/stream')
+def api_stream():
+    """SSE-поток: события на границах расписания и периодический тик часов"""
+    return event_stream_response(get_schedule_index)
+
+def search_response(index):
+    """Письма, подходящие под запрос ?q= (по названию и описанию), лучшие первыми"""
+    try:
+        limit = int(request.args.get("limit", SEARCH_RESULTS_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit должен быть числом"}), 400
+    limit = max(1, min(limit, MAX_SEARCH_RESULTS_LIMIT))
+    query = request.args.get("q", "")
+    response = jsonify(get_search_index(index).search_payload(query, limit))
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
+
+@app.route('/api/search')
+def api_search():
+    """API поиска писем по словам из названия и описания"""
+    return search_response(get_schedule_index())
+
+def itinerary_response(index):
+    """Лучший маршрут писем без наложений (?weights=12a:3,4b:0 - множители весов)"""
+    try:
+        weights = parse_weights(request.args.get("weights"))
+    except ValueError:
+        return jsonify({"error": "Неверный параметр weights: id:множитель через запятую, "
+                                 f"множитель от 0 до {MAX_ITINERARY_MULTIPLIER}"}), 400
+    planner = get_itinerary_planner(index)
+    unknown = planner.unknown_ids(weights)
+    if unknown:
+        return jsonify({"error": "Неизвестные письма", "ids": unknown}), 400
+    try:
+        body, etag = planner.plan(weights)
+    except ValueError:
+        return jsonify({"error": "Суммарный вес маршрута слишком велик"}), 400
+    return conditional_response(body, etag, "application/json")
+
+@app.route('/api/itinerary')
+def api_itinerary():
+    """API маршрута на вечер: письма без наложений с наибольшим суммарным весом"""
+    return itinerary_response(get_schedule_index())
+
+@app.route('/api/schedule/report')
+def api_schedule_report():
+    """Отчет компиляции расписания: расхождения end_time и наложения в колонках"""
+    index = get_schedule_index()
+    return cached_json_response("compile-report", lambda: index.report, version=index.version)
+
+@app.route('/api/export.<any(ics, ndjson):export_format>')
+def api_export(export_format):
+    """Выгрузка расписания в календарь (.ics) или построчный JSON (.ndjson)"""
+    return export_response(get_schedule_index(), export_format)
+
+@app.route('/api/all_letters_with_special')
+def api_all_letters_with_special():
+    """API для получения всех писем включая специальные (для серых меток)"""
+    index = get_schedule_index()
+    return cached_json_response(
+        "all_letters_with_special", lambda: build_all_letters_payload(index), version=index.version
+    )
+
+# Планы из PLANS_DIR: те же страницы и API с префиксом /p/<plan_id>
+
+def build_offline_manifest(index, base_path, cache=None):
+    """Манифест предзагрузки: страницы, статика и все письма с хэшами содержимого"""
+    version = index.version
+    mailbox_page = render_template('mailbox.html', base_path=base_path).encode("utf-8")
+    _, letters_page_etag = get_cached_html(
+        "page:letters", lambda: render_letters_page(index, base_path), cache, version, index.revision
+    )
+    _, initial_etag = get_cached_body(
+        "initial", lambda: build_initial_payload(index), cache, version, index.revision
+    )
+    _, letters_etag = get_cached_body("letters", lambda: build_letters_payload(index), cache, version)
+    return offline.build_precache_manifest(version, [
+        (f"{base_path}/", hashlib.sha1(mailbox_page).hexdigest()),
+        (f"{base_path}/letters", letters_page_etag),
+        (f"{base_path}/api/initial", initial_etag),
+        (f"{base_path}/api/letters", letters_etag),
+        *assets.precache_entries(),
+    ])
+
+def offline_manifest_response(index, base_path, cache=None):
+    body, etag = get_cached_body(
+        "offline-manifest", lambda: build_offline_manifest(index, base_path, cache), cache, index.version,
+        index.revision
+    )
+    return offline.manifest_response(body, etag)
+
+@app.route('/offline-manifest.json')
+def offline_manifest():
+    """Манифест предзагрузки для service worker"""
+    return offline_manifest_response(get_schedule_index(), '')
+
+@app.route('/sw.js')
+def service_worker():
+    """Service worker офлайн-режима (scope - весь сайт)"""
+    return offline.service_worker_response()
+
+def plan_not_found():
+    return jsonify({"error": "План не найден"}), 404
+
+@app.route('/p/<plan_id>/')
+def plan_mailbox(plan_id):
+    """Почтовый ящик плана"""
+    if not plan_store.get(plan_id):
+        return plan_not_found()
+    return render_template('mailbox.html', base_path=f'/p/{plan_id}')
+
+@app.route('/p/<plan_id>/letters')
+def plan_letters(plan_id):
+    """Страница с письмами плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return cached_html_response(
+        "page:letters", lambda: render_letters_page(plan.index, f'/p/{plan_id}'), plan.responses, plan.index.version,
+        plan.index.revision
+    )
+
+@app.route('/p/<plan_id>/api/letters')
+def plan_api_letters(plan_id):
+    """API писем плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    if is_window_request():
+        return letters_window_response(plan.index)
+    return cached_json_response(
+        "letters", lambda: build_letters_payload(plan.index), plan.responses, plan.index.version
+    )
+
+@app.route('/p/<plan_id>/api/letter/<variant_id>')
+def plan_api_letter(plan_id, variant_id):
+    """API деталей одного письма плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    variant = plan.index.get_by_id(variant_id)
+    if not variant:
+        return jsonify({"error": "Письмо не найдено"}), 404
+    return cached_json_response(
+        f"letter:{variant_id}", lambda: build_letter_payload(plan.index, variant), plan.responses, plan.index.version
+    )
+
+@app.route('/p/<plan_id>/api/letters/batch')
+def plan_api_letters_batch(plan_id):
+    """API деталей нескольких писем плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return letters_batch_response(plan.index, plan.responses, plan.index.version)
+
+@app.route('/p/<plan_id>/api/letters/changes')
+def plan_api_letters_changes(plan_id):
+    """API изменений писем плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return letters_changes_response(plan.index, plan.change_log)
+
+@app.route('/p/<plan_id>/api/all_letters_with_special')
+def plan_api_all_letters_with_special(plan_id):
+    """API всех писем плана включая специальные"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return cached_json_response(
+        "all_letters_with_special", lambda: build_all_letters_payload(plan.index), plan.responses, plan.index.version
+    )
+
+@app.route('/p/<plan_id>/api/layout')
+def plan_api_layout(plan_id):
+    """API раскладки писем плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return cached_json_response(
+        "layout", lambda: compute_layout(plan.index), plan.responses, plan.index.version
+    )
+
+@app.route('/p/<plan_id>/api/initial')
+def plan_api_initial(plan_id):
+    """API с данными для первого рендера страницы плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return cached_json_response(
+        "initial", lambda: build_initial_payload(plan.index), plan.responses, plan.index.version,
+        plan.index.revision
+    )
+
+@app.route('/p/<plan_id>/api/now')
+def plan_api_now(plan_id):
+    """API писем плана, доступных в текущий момент"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return now_response(plan.index)
+
+@app.route('/p/<plan_id>/api/search')
+def plan_api_search(plan_id):
+    """API поиска писем плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return search_response(plan.index)
+
+@app.route('/p/<plan_id>/api/itinerary')
+def plan_api_itinerary(plan_id):
+    """API маршрута на вечер по плану"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return itinerary_response(plan.index)
+
+@app.route('/p/<plan_id>/api/schedule/report')
+def plan_api_schedule_report(plan_id):
+    """Отчет компиляции плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return cached_json_response("compile-report", lambda: plan.index.report, plan.responses, plan.index.version)
+
+@app.route('/p/<plan_id>/api/export.<any(ics, ndjson):export_format>')
+def plan_api_export(plan_id, export_format):
+    """Выгрузка расписания плана в календарь (.ics) или построчный JSON (.ndjson)"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return export_response(plan.index, export_format, f"{plan_id}.{export_format}")
+
+@app.route('/p/<plan_id>/offline-manifest.json')
+def plan_offline_manifest(plan_id):
+    """Манифест предзагрузки плана"""
+    plan = plan_store.get(plan_id)
+    if not plan:
+        return plan_not_found()
+    return offline_manifest_response(plan.index, f'/p/{plan_id}', plan.responses)
+
+@app.route('/p/<plan_id>/sw.js')
+def plan_service_worker(plan_id):
+    """Service worker плана (scope - страницы плана)"""
+    if not plan_store.get(plan_id):
+        return plan_not_found()
+    return offline.service_worker_response()
+
+@app.route('/p/<plan_id>/api/stream')
+def plan_api_stream(plan_id):
+    """SSE-поток событий времени плана"""
+    if not plan_store.get(plan_id):
+        return plan_not_found()
+
+    def get_plan_index():
+        plan = plan_store.get(plan_id)
+        return plan.index if plan else None
+
+    return event_stream_response(get_plan_index)
+
+# Расписание из SCHEDULE_FILE: новая версия компилируется и прогревается в
+# фоне, запросы переключаются на нее только когда все готово
+
+WARM_PAYLOADS = (
+    ("letters", build_letters_payload),
+    ("all_letters_with_special", build_all_letters_payload),
+    ("layout", compute_layout),
+)
+# Ответы с номером ревизии: кэшируются вместе с ним (см. ResponseCache.get_body)
+WARM_REVISION_PAYLOADS = (
+    ("initial", build_initial_payload),
+)
+# Ответы, которые зависят только от содержимого расписания (в /api/initial
+# есть номер ревизии) - их можно брать из снимка
+SNAPSHOT_PAYLOADS = ("letters", "all_letters_with_special", "layout")
+
+def warm_schedule(index):
+    """Готовит основные ответы нового расписания до того, как оно станет текущим
+
+    Если индекс пришел из снимка, ответы и индекс поиска берутся оттуда же;
+    свежескомпилированный индекс после прогрева сохраняется в снимок.
+    Ответы /api/now строятся лениво, по промежуткам, и в снимок не входят.
+    """
+    extras = schedule_snapshot.loaded_extras(index)
+    if extras is not None:
+        default_cache.preload(index.version, extras["responses"])
+        restore_search_index(index, extras["search"])
+    with app.app_context():
+        for key, build_payload in WARM_PAYLOADS:
+            get_cached_body(key, lambda: build_payload(index), version=index.version)
+        for key, build_payload in WARM_REVISION_PAYLOADS:
+            get_cached_body(key, lambda: build_payload(index), version=index.version, revision=index.revision)
+        search_index = get_search_index(index)
+    if extras is None:
+        schedule_snapshot.save(index, {
+            "responses": default_cache.entries(index.version, SNAPSHOT_PAYLOADS),
+            "search": search_index,
+        })
+
+schedule_watcher = schedule_source.init_app(app, on_compiled=warm_schedule)
+if schedule_watcher is None:
+    # Встроенное расписание: прогрев заодно сохраняет (или подхватывает) снимок
+    warm_schedule(get_schedule_index())
+schedule_snapshot.report_ready()
+
+if __name__ == '__main__':
+    app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,329 @@
+# Сборка статики: минификация, отпечатки в именах и предварительное сжатие
+#
+# letters.css и letters.js минифицируются, получают хэш содержимого в имени
+# (letters.<хэш>.js) и заранее сжимаются в .gz (и .br, если установлен
+# пакет Brotli). Результат лежит в static/dist вместе с manifest.json.
+# Шаблоны ссылаются на файлы через asset_url(), а /assets/<имя> отдает
+# готовые байты из памяти с годовым immutable-кэшем и выбором
+# Content-Encoding по Accept-Encoding - без сжатия на каждый запрос.
+#
+# Сборка запускается при старте приложения, если исходники поменялись,
+# или вручную: python assets.py
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import abort, current_app, request, url_for
+
+try:
+    import brotli
+except ImportError:  # Brotli необязателен: без него отдаем gzip
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+
+# Исходники, которые проходят через сборку (пути относительно static/)
+ASSET_SOURCES = ["css/letters.css", "js/letters.js"]
+
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# filename исходника -> имя собранного файла в dist
+_manifest = {}
+# имя собранного файла -> {"identity": байты, "gzip": байты, "br": байты, "mimetype": ...}
+_built = {}
+
+
+def _skip_string(source, i, quote):
+    """Индекс сразу после строки, начинающейся с кавычки в позиции i"""
+    i += 1
+    while i < len(source):
+        if source[i] == "\\":
+            i += 2
+            continue
+        if source[i] == quote:
+            return i + 1
+        i += 1
+    return i
+
+
+def _skip_template(source, i):
+    """Индекс сразу после шаблонного литерала в позиции i
+
+    Внутри ${...} - код со своими строками, скобками и вложенными
+    шаблонами: обратная кавычка в нем литерал не закрывает.
+    """
+    i += 1
+    while i < len(source):
+        if source[i] == "\\":
+            i += 2
+            continue
+        if source[i] == "`":
+            return i + 1
+        if source.startswith("${", i):
+            i = _skip_substitution(source, i + 2)
+            continue
+        i += 1
+    return i
+
+
+def _skip_substitution(source, i):
+    """Индекс сразу после } подстановки ${...}, код которой начинается в позиции i"""
+    depth = 1
+    while i < len(source):
+        ch = source[i]
+        if ch in "\"'":
+            i = _skip_string(source, i, ch)
+            continue
+        if ch == "`":
+            i = _skip_template(source, i)
+            continue
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def minify_css(source):
+    """Убирает комментарии и лишние пробелы из CSS (строки не трогает)"""
+    out = []
+    i = 0
+    pending_space = False
+    while i < len(source):
+        ch = source[i]
+        if source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            i = len(source) if end == -1 else end + 2
+            pending_space = True
+            continue
+        if ch in "\"'":
+            end = _skip_string(source, i, ch)
+            if pending_space and out and out[-1] not in "{};,>(":
+                out.append(" ")
+            pending_space = False
+            out.append(source[i:end])
+            i = end
+            continue
+        if ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+        if ch in "{};,>":
+            # Пробелы вокруг этих символов не значимы
+            if ch == "}" and out and out[-1] == ";":
+                out.pop()
+            out.append(ch)
+            pending_space = False
+            i += 1
+            continue
+        if pending_space and out and out[-1] not in "{};,>":
+            out.append(" ")
+        pending_space = False
+        out.append(ch)
+        i += 1
+    return "".join(out).strip() + "\n"
+
+
+def minify_js(source):
+    """Консервативная минификация JS: убирает комментарии, отступы и пустые строки
+
+    Переводы строк сохраняются, чтобы не зависеть от автоматической
+    расстановки точек с запятой; строки и шаблонные литералы не меняются.
+    """
+    out = []
+    i = 0
+    line = []
+
+    def end_line():
+        text = "".join(line).strip()
+        if text:
+            out.append(text)
+        line.clear()
+
+    prev_significant = ""
+    while i < len(source):
+        ch = source[i]
+        if source.startswith("//", i):
+            end = source.find("\n", i)
+            i = len(source) if end == -1 else end
+            continue
+        if source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            i = len(source) if end == -1 else end + 2
+            line.append(" ")
+            continue
+        if ch in "\"'`":
+            end = _skip_template(source, i) if ch == "`" else _skip_string(source, i, ch)
+            line.append(source[i:end])
+            prev_significant = ch
+            i = end
+            continue
+        if ch == "/" and (prev_significant == "" or prev_significant in "(,=:[!&|?{};"):
+            # Литерал регулярного выражения: копируем как есть до закрывающего /
+            end = i + 1
+            in_class = False
+            while end < len(source) and source[end] != "\n":
+                if source[end] == "\\":
+                    end += 2
+                    continue
+                if source[end] == "[":
+                    in_class = True
+                elif source[end] == "]":
+                    in_class = False
+                elif source[end] == "/" and not in_class:
+                    break
+                end += 1
+            line.append(source[i:end + 1])
+            prev_significant = "/"
+            i = end + 1
+            continue
+        if ch == "\n":
+            end_line()
+            i += 1
+            continue
+        if ch in " \t\r":
+            # Несколько пробелов подряд внутри строки кода схлопываем в один
+            if line and line[-1] != " ":
+                line.append(" ")
+            i += 1
+            continue
+        line.append(ch)
+        prev_significant = ch
+        i += 1
+    end_line()
+    return "\n".join(out) + "\n"
+
+
+def _minify(filename, source):
+    if filename.endswith(".css"):
+        return minify_css(source)
+    if filename.endswith(".js"):
+        return minify_js(source)
+    return source
+
+
+def _hashed_name(filename, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest}{ext}"
+
+
+def _source_fingerprint():
+    """Хэш исходников, чтобы не пересобирать при каждом старте"""
+    digest = hashlib.sha256()
+    for filename in ASSET_SOURCES:
+        with open(os.path.join(STATIC_DIR, filename), "rb") as f:
+            digest.update(filename.encode("utf-8"))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build_assets():
+    """Собирает статику в static/dist и записывает manifest.json"""
+    manifest = {"source_fingerprint": _source_fingerprint(), "files": {}}
+    for filename in ASSET_SOURCES:
+        with open(os.path.join(STATIC_DIR, filename), encoding="utf-8") as f:
+            content = _minify(filename, f.read()).encode("utf-8")
+        hashed = _hashed_name(filename, content)
+        target = os.path.join(DIST_DIR, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+
+        with open(target, "wb") as f:
+            f.write(content)
+        with open(f"{target}.gz", "wb") as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(f"{target}.br", "wb") as f:
+                f.write(brotli.compress(content, quality=11))
+        manifest["files"][filename] = hashed
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_assets():
+    """Читает собранную статику в память, при необходимости пересобирая ее"""
+    manifest = None
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            manifest = json.load(f)
+    if manifest is None or manifest.get("source_fingerprint") != _source_fingerprint():
+        manifest = build_assets()
+
+    _manifest.clear()
+    _built.clear()
+    for filename, hashed in manifest["files"].items():
+        target = os.path.join(DIST_DIR, hashed)
+        with open(target, "rb") as f:
+            identity = f.read()
+        variants = {
+            "identity": identity,
+            "mimetype": mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        }
+        for encoding, suffix in (("gzip", ".gz"), ("br", ".br")):
+            if os.path.exists(target + suffix):
+                with open(target + suffix, "rb") as f:
+                    variants[encoding] = f.read()
+        _manifest[filename] = hashed
+        _built[hashed] = variants
+
+
+def get_built_assets():
+    """Собранные файлы: имя в dist -> содержимое и сжатые варианты"""
+    return _built
+
+
+def asset_url(filename):
+    """URL собранного файла; для файлов вне сборки - обычная статика"""
+    hashed = _manifest.get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('serve_asset', filename=hashed)
+
+
+def precache_entries():
+    """(URL, имя с хэшем) всех собранных файлов - для манифеста офлайн-режима"""
+    return [(url_for('serve_asset', filename=hashed), hashed) for hashed in _manifest.values()]
+
+
+def serve_asset(filename):
+    """Отдает собранный файл с immutable-кэшем и подходящим Content-Encoding"""
+    variants = _built.get(filename)
+    if variants is None:
+        abort(404)
+
+    encoding = "identity"
+    for candidate in ("br", "gzip"):
+        if candidate in variants and request.accept_encodings[candidate] > 0:
+            encoding = candidate
+            break
+
+    response = current_app.response_class(variants[encoding], mimetype=variants["mimetype"])
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = ASSET_CACHE_CONTROL
+    response.set_etag(f"{filename}-{encoding}")
+    return response
+
+
+def init_app(app):
+    """Собирает статику при старте и подключает /assets и asset_url()"""
+    load_assets()
+    app.add_url_rule('/assets/<path:filename>', 'serve_asset', serve_asset)
+    app.jinja_env.globals["asset_url"] = asset_url
+
+
+if __name__ == "__main__":
+    built = build_assets()
+    for source, hashed in built["files"].items():
+        print(f"{source} -> dist/{hashed}")
@@ -0,0 +1 @@
+# Бенчмарки schedule_data и маршрутов приложения на синтетических расписаниях
@@ -0,0 +1,239 @@
+# Запуск бенчмарков schedule_data и маршрутов Flask
+#
+#   python -m benchmarks --sizes 100 1000 10000 --output bench.json
+#   python -m benchmarks --sizes 100 1000 --baseline bench.json --threshold 0.25
+#
+# Результаты пишутся в JSON; в режиме сравнения с базовым файлом процесс
+# завершается с кодом 1, если медиана хоть одного замера выросла больше
+# чем на threshold
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import schedule_data
+from benchmarks.synthetic import generate_schedule
+
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_THRESHOLD = 0.25
+# Сколько секунд тратить на один замер (не меньше MIN_RUNS запусков)
+TARGET_SECONDS = 0.5
+MIN_RUNS = 3
+
+# /api/stream - бесконечный поток, его здесь не измеряем
+API_ROUTES = [
+    "/",
+    "/letters",
+    "/api/initial",
+    "/api/letters",
+    "/api/letters?from=31.12 22:00&to=31.12 23:00",
+    "/api/letters?from=31.12 15:00&limit=50&cursor={cursor}",
+    "/api/letters/batch?ids={batch_ids}",
+    "/api/letters/changes?since={revision}",
+    "/api/all_letters_with_special",
+    "/api/layout",
+    "/api/current_time",
+    "/api/time_sync",
+    "/api/now",
+    "/api/letter/{variant_id}",
+    "/api/search?q=салюты фильм",
+    "/api/itinerary?weights={variant_id}:2",
+    "/api/schedule/report",
+    "/api/export.ics",
+    "/api/export.ndjson",
+    "/offline-manifest.json",
+    "/sw.js",
+]
+# Те же маршруты для плана из PLANS_DIR (у плана нет /api/current_time и /api/time_sync)
+PLAN_ID = "bench"
+ROUTES = API_ROUTES + [
+    f"/p/{PLAN_ID}{route}" for route in API_ROUTES
+    if not route.startswith(("/api/current_time", "/api/time_sync"))
+]
+BATCH_SIZE = 20
+
+
+def measure(func):
+    """Время одного вызова func: медиана и минимум по нескольким запускам"""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < MIN_RUNS or time.perf_counter() - started < TARGET_SECONDS:
+        t0 = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - t0)
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "runs": len(timings),
+    }
+
+
+def bench_schedule_data(size, seed):
+    """Микробенчмарки функций schedule_data на синтетическом расписании"""
+    results = {}
+    generated = generate_schedule(size, seed=seed)
+
+    load_timing = measure(lambda: schedule_data.ScheduleIndex(generated["variants"]))
+    results[f"schedule_data.ScheduleIndex[n={size}]"] = load_timing
+    schedule_data.load_schedule(generated)
+
+    variants = generated["variants"]
+    open_ended = next((v for v in variants if v["end_time"] == "-"), variants[-1])
+    middle = variants[len(variants) // 2]
+
+    results[f"schedule_data.get_variant_end_datetime[n={size}]"] = measure(
+        lambda: schedule_data.get_variant_end_datetime(middle)
+    )
+    results[f"schedule_data.get_variant_end_datetime.open_ended[n={size}]"] = measure(
+        lambda: schedule_data.get_variant_end_datetime(open_ended)
+    )
+    results[f"schedule_data.get_variants_available_at_datetime[n={size}]"] = measure(
+        lambda: schedule_data.get_variants_available_at_datetime("31.12", "23:30")
+    )
+    moments = [("31.12", f"{hour:02d}:{minute:02d}") for hour in range(15, 24) for minute in range(60)]
+    results[f"schedule_data.get_variants_available_at_datetimes[n={size}]"] = measure(
+        lambda: schedule_data.get_variants_available_at_datetimes(moments)
+    )
+    results[f"schedule_data.get_toc[n={size}]"] = measure(schedule_data.get_toc)
+    results[f"schedule_data.get_toc_columns[n={size}]"] = measure(schedule_data.get_toc_columns)
+    results[f"schedule_data.get_duration_minutes[n={size}]"] = measure(
+        lambda: [schedule_data.get_duration_minutes(v["duration"]) for v in variants[:1000]]
+    )
+    return results
+
+
+def clear_caches():
+    """Сбрасывает все, что строится один раз на версию расписания или на план"""
+    import itinerary
+    import now_snapshots
+    import plan_store
+    import response_cache
+    import search
+
+    response_cache.default_cache.clear()
+    now_snapshots.clear_now_snapshots()
+    search.clear_search_indexes()
+    itinerary.clear_itinerary_planners()
+    plan_store.plan_store.clear()
+
+
+def bench_routes(size, seed):
+    """Маршруты приложения через тестовый клиент Flask (без сети)
+
+    Холодный замер сбрасывает кэши ответов, снимки /api/now, индексы поиска,
+    планировщики маршрутов и скомпилированные планы перед каждым запросом.
+    """
+    from app import app
+    import plan_store
+
+    results = {}
+    generated = generate_schedule(size, seed=seed)
+    schedule_data.load_schedule(generated)
+    variants = generated["variants"]
+    variant_id = variants[len(variants) // 2]["id"]
+    index = schedule_data.get_schedule_index()
+    params = {
+        "variant_id": variant_id,
+        "batch_ids": ",".join(variant["id"] for variant in variants[:BATCH_SIZE]),
+        "cursor": f"{index.version}.{len(variants) // 4}",
+        "revision": index.revision,
+    }
+    client = app.test_client()
+
+    store = plan_store.plan_store
+    original_plans_dir = store.plans_dir
+    with tempfile.TemporaryDirectory() as plans_dir:
+        with open(os.path.join(plans_dir, f"{PLAN_ID}.json"), "w", encoding="utf-8") as f:
+            json.dump(generated, f, ensure_ascii=False)
+        store.plans_dir = plans_dir
+        store.clear()
+        try:
+            for route in ROUTES:
+                url = route.format(**params)
+
+                def cold():
+                    clear_caches()
+                    client.get(url, buffered=True)
+
+                def warm():
+                    client.get(url, buffered=True)
+
+                results[f"route.cold {route}[n={size}]"] = measure(cold)
+                results[f"route.warm {route}[n={size}]"] = measure(warm)
+        finally:
+            store.plans_dir = original_plans_dir
+            store.clear()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Замеры, медиана которых выросла относительно baseline больше чем на threshold"""
+    regressions = []
+    for name, timing in sorted(results.items()):
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = timing["median_s"] / base["median_s"] if base["median_s"] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append((name, base["median_s"], timing["median_s"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарки schedule_data и маршрутов")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Размеры синтетических расписаний (от 100 до 1000000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-routes", action="store_true", help="Только schedule_data")
+    parser.add_argument("--output", help="Куда записать результаты (JSON)")
+    parser.add_argument("--baseline", help="JSON с прошлого запуска для сравнения")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Допустимый рост медианы, доля (0.25 = +25%%)")
+    args = parser.parse_args(argv)
+
+    original_schedule = schedule_data.schedule
+    results = {}
+    try:
+        for size in args.sizes:
+            results.update(bench_schedule_data(size, args.seed))
+            if not args.skip_routes:
+                results.update(bench_routes(size, args.seed))
+    finally:
+        schedule_data.load_schedule(original_schedule)
+
+    for name, timing in sorted(results.items()):
+        print(f"{name:75s} {timing['median_s'] * 1000:10.3f} ms  (runs: {timing['runs']})")
+
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"РЕГРЕССИЯ {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms (x{ratio:.2f})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
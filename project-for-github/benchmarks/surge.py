@@ -0,0 +1,414 @@
+# Нагрузочный тест "полночь": все гости открывают страницу в одну минуту
+#
+#   python -m benchmarks.surge --sessions 2000 --concurrency 200
+#   python -m benchmarks.surge --server gunicorn --sessions 5000 --concurrency 400
+#
+# Сессия гостя повторяет то, что делает браузер: почтовый ящик (/),
+# страница писем (/letters), /api/letters и /api/all_letters_with_special,
+# затем несколько кликов по письмам (/api/letter/<id>) с паузами и опрос
+# /api/current_time раз в минуту. Открытая вкладка держит подписку на
+# /api/stream (отдельное соединение на всю сессию, доля таких гостей -
+# --stream-share); отказы сверх STREAM_MAX_CONNECTIONS (503) считаются
+# отдельно, как "/api/stream 503". Начала сессий сгущаются к 00:00.
+#
+# Часы приложения подменяются: время идет с 23:59 до 00:05 за --duration
+# реальных секунд, поэтому сервер видит полночь, когда бы тест ни
+# запускался. Сервер - встроенный в процесс (werkzeug, потоки) или
+# локальный gunicorn с профилем gunicorn.conf.py; в обоих случаях запросы
+# идут по HTTP с keep-alive, по соединению на поток.
+#
+# Результат - пропускная способность и p50/p95/p99 по маршрутам (в
+# консоль и, с --output, в JSON)
+
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Окно подмененных часов: 23:59 - 00:05
+SURGE_CLOCK_START = datetime(2024, 12, 31, 23, 59)
+SURGE_CLOCK_END = datetime(2025, 1, 1, 0, 5)
+# Момент, к которому сгущаются начала сессий
+SURGE_PEAK = datetime(2025, 1, 1, 0, 0)
+
+DEFAULT_SESSIONS = 1000
+DEFAULT_CONCURRENCY = 100
+DEFAULT_DURATION_SECONDS = 60
+# Какая доля гостей приходит в пик (остальные - равномерно по окну)
+PEAK_SHARE = 0.8
+PEAK_SPREAD_SECONDS = 20
+# Клики по письмам и паузы между ними (секунды подмененных часов)
+CLICKS_PER_SESSION = (2, 6)
+THINK_SECONDS = (5, 30)
+# Страница писем опрашивала часы раз в минуту
+CURRENT_TIME_POLL_SECONDS = 60
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def simulated_now(epoch, speed):
+    """Момент подмененных часов: SURGE_CLOCK_START в реальное время epoch, дальше в speed раз быстрее"""
+    elapsed = max(0.0, time.time() - epoch) * speed
+    return SURGE_CLOCK_START + timedelta(seconds=elapsed)
+
+
+def install_simulated_clock(epoch, speed):
+    """Подменяет datetime.now() в app и schedule_data на подмененные часы"""
+    import app as application
+    import schedule_data
+
+    class SimulatedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            moment = simulated_now(epoch, speed)
+            if tz is not None:
+                return moment.astimezone(tz)
+            return moment
+
+    originals = (application.datetime, schedule_data.datetime)
+    application.datetime = SimulatedDatetime
+    schedule_data.datetime = SimulatedDatetime
+    return originals
+
+
+def restore_clock(originals):
+    import app as application
+    import schedule_data
+
+    application.datetime, schedule_data.datetime = originals
+
+
+def create_app():
+    """Приложение с подмененными часами для gunicorn: benchmarks.surge:create_app()
+
+    Начало окна и скорость часов берутся из SURGE_CLOCK_EPOCH и
+    SURGE_CLOCK_SPEED, чтобы все воркеры видели одно и то же время.
+    """
+    from app import app
+
+    install_simulated_clock(float(os.environ["SURGE_CLOCK_EPOCH"]),
+                            float(os.environ["SURGE_CLOCK_SPEED"]))
+    return app
+
+
+class LatencyRecorder:
+    """Время ответов и ошибки по маршрутам (из всех потоков)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}  # маршрут -> [секунды, ...]
+        self.errors = {}  # маршрут -> число ошибок
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def percentile(sorted_values, percent):
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def plan_sessions(count, seed, window_seconds):
+    """Моменты начала сессий (секунды от 23:59), по возрастанию"""
+    rng = random.Random(seed)
+    peak = (SURGE_PEAK - SURGE_CLOCK_START).total_seconds()
+    arrivals = []
+    for _ in range(count):
+        if rng.random() < PEAK_SHARE:
+            offset = rng.gauss(peak, PEAK_SPREAD_SECONDS)
+        else:
+            offset = rng.uniform(0, window_seconds)
+        arrivals.append(min(max(offset, 0.0), window_seconds))
+    arrivals.sort()
+    return arrivals
+
+
+class GuestSession:
+    """Один гость: последовательность запросов по одному keep-alive соединению"""
+
+    def __init__(self, host, port, recorder, rng, speed, stream=False):
+        self.host = host
+        self.port = port
+        self.recorder = recorder
+        self.rng = rng
+        self.speed = speed
+        self.stream = stream
+        self.connection = None
+
+    def _connect(self):
+        self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+    def get(self, path, route=None):
+        """GET path; время пишется под именем route (по умолчанию - сам path)"""
+        route = route or path
+        for attempt in range(2):
+            reused = self.connection is not None
+            if not reused:
+                self._connect()
+            started = time.perf_counter()
+            try:
+                self.connection.request("GET", path)
+                response = self.connection.getresponse()
+                body = response.read()
+            except (ConnectionError, http.client.HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                # Сервер закрыл простаивавшее соединение - повторяем на новом
+                if reused and attempt == 0:
+                    continue
+                self.recorder.record(route, time.perf_counter() - started, False)
+                return None
+            self.recorder.record(route, time.perf_counter() - started, response.status < 400)
+            if response.getheader("Connection", "").lower() == "close":
+                self.connection.close()
+                self.connection = None
+            return body if response.status < 400 else None
+        return None
+
+    def open_stream(self):
+        """Подписка на /api/stream: соединение остается открытым до конца сессии
+
+        Время записывается до заголовков ответа; None - поток не открылся.
+        """
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        started = time.perf_counter()
+        try:
+            connection.request("GET", "/api/stream")
+            response = connection.getresponse()
+        except (ConnectionError, http.client.HTTPException, OSError):
+            connection.close()
+            self.recorder.record("/api/stream", time.perf_counter() - started, False)
+            return None
+        seconds = time.perf_counter() - started
+        if response.status == 503:
+            # Лимит потоков: страница в этом случае переходит на опрос
+            response.read()
+            connection.close()
+            self.recorder.record("/api/stream 503", seconds, True)
+            return None
+        self.recorder.record("/api/stream", seconds, response.status == 200)
+        return connection
+
+    def think(self, simulated_seconds):
+        time.sleep(simulated_seconds / self.speed)
+
+    def run(self):
+        self.get("/")
+        self.get("/letters")
+        stream = self.open_stream() if self.stream else None
+        letters_body = self.get("/api/letters")
+        self.get("/api/all_letters_with_special")
+        self.get("/api/current_time")
+
+        letter_ids = []
+        if letters_body:
+            letter_ids = [letter["id"] for letter in json.loads(letters_body)["letters"]]
+        since_poll = 0.0
+        for _ in range(self.rng.randint(*CLICKS_PER_SESSION)):
+            pause = self.rng.uniform(*THINK_SECONDS)
+            self.think(pause)
+            since_poll += pause
+            if since_poll >= CURRENT_TIME_POLL_SECONDS:
+                self.get("/api/current_time")
+                since_poll = 0.0
+            if letter_ids:
+                self.get(f"/api/letter/{self.rng.choice(letter_ids)}", "/api/letter/<id>")
+        if self.connection is not None:
+            self.connection.close()
+        if stream is not None:
+            stream.close()
+
+
+def run_load(host, port, args, epoch, speed):
+    """Гонит сессии по расписанию начал; возвращает (recorder, секунд, опоздавших сессий)"""
+    window_seconds = (SURGE_CLOCK_END - SURGE_CLOCK_START).total_seconds()
+    arrivals = plan_sessions(args.sessions, args.seed, window_seconds)
+    recorder = LatencyRecorder()
+    lock = threading.Lock()
+    state = {"next": 0, "late": 0}
+    started = time.time()
+
+    def worker(thread_number):
+        rng = random.Random(args.seed * 100003 + thread_number)
+        while True:
+            with lock:
+                position = state["next"]
+                if position >= len(arrivals):
+                    return
+                state["next"] += 1
+            delay = epoch + arrivals[position] / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -1:
+                # Все потоки были заняты: гость пришел позже, чем должен был
+                with lock:
+                    state["late"] += 1
+            stream = rng.random() < args.stream_share
+            GuestSession(host, port, recorder, rng, speed, stream).run()
+
+    threads = [
+        threading.Thread(target=worker, args=(number,), name=f"surge-{number}", daemon=True)
+        for number in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Время считается от 23:59 подмененных часов, без ожидания запуска сервера
+    return recorder, time.time() - max(epoch, started), state["late"]
+
+
+def wait_until_up(host, port, timeout_seconds):
+    deadline = time.time() + timeout_seconds
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=5)
+            connection.request("GET", "/api/current_time")
+            connection.getresponse().read()
+            connection.close()
+            return True
+        except (ConnectionError, http.client.HTTPException, OSError):
+            time.sleep(0.2)
+    return False
+
+
+def run_inprocess(args, speed):
+    """Сервер werkzeug в потоке этого же процесса"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import live_stream
+    from app import app
+
+    if args.stream_limit is not None:
+        live_stream.STREAM_MAX_CONNECTIONS = args.stream_limit
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass  # Строка лога на каждый запрос исказила бы замер
+
+    server = make_server("127.0.0.1", args.port, app, threaded=True,
+                         request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, name="surge-server", daemon=True).start()
+    epoch = time.time() + 1
+    originals = install_simulated_clock(epoch, speed)
+    try:
+        return run_load("127.0.0.1", server.server_port, args, epoch, speed)
+    finally:
+        server.shutdown()
+        restore_clock(originals)
+
+
+def run_gunicorn(args, speed):
+    """Локальный gunicorn с gunicorn.conf.py; часы стартуют через --boot-seconds"""
+    port = args.port or 5099
+    epoch = time.time() + args.boot_seconds
+    env = dict(os.environ, PORT=str(port),
+               SURGE_CLOCK_EPOCH=repr(epoch), SURGE_CLOCK_SPEED=repr(speed))
+    if args.stream_limit is not None:
+        env["STREAM_MAX_CONNECTIONS"] = str(args.stream_limit)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "benchmarks.surge:create_app()",
+         "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}"],
+        cwd=PROJECT_DIR, env=env,
+    )
+    try:
+        if not wait_until_up("127.0.0.1", port, args.boot_seconds):
+            raise SystemExit(f"gunicorn не поднялся за {args.boot_seconds} с (увеличьте --boot-seconds)")
+        return run_load("127.0.0.1", port, args, epoch, speed)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summarize(recorder, elapsed):
+    """Сводка по маршрутам: число запросов, ошибки, rps и перцентили в мс"""
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(route, 0),
+            "rps": len(values) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    total = sum(route["requests"] for route in routes.values())
+    return {
+        "requests": total,
+        "errors": sum(route["errors"] for route in routes.values()),
+        "elapsed_s": elapsed,
+        "rps": total / elapsed if elapsed else 0.0,
+        "routes": routes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест полуночного наплыва гостей")
+    parser.add_argument("--server", choices=("inprocess", "gunicorn"), default="inprocess")
+    parser.add_argument("--sessions", type=int, default=DEFAULT_SESSIONS, help="Сколько гостей")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Сколько гостей одновременно (потоков-клиентов)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS,
+                        help="За сколько реальных секунд часы проходят 23:59-00:05")
+    parser.add_argument("--port", type=int, default=0, help="Порт сервера (0 - любой свободный)")
+    parser.add_argument("--boot-seconds", type=float, default=30,
+                        help="Сколько ждать запуска gunicorn")
+    parser.add_argument("--stream-share", type=float, default=1.0,
+                        help="Доля гостей с подпиской на /api/stream")
+    parser.add_argument("--stream-limit", type=int, default=None,
+                        help="STREAM_MAX_CONNECTIONS сервера (по умолчанию - его собственная настройка)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Куда записать результаты (JSON)")
+    args = parser.parse_args(argv)
+
+    speed = (SURGE_CLOCK_END - SURGE_CLOCK_START).total_seconds() / args.duration
+    run = run_gunicorn if args.server == "gunicorn" else run_inprocess
+    recorder, elapsed, late = run(args, speed)
+    summary = summarize(recorder, elapsed)
+
+    print(f"{'маршрут':36s} {'запросов':>9s} {'ошибок':>7s} {'rps':>8s} "
+          f"{'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for route, stats in summary["routes"].items():
+        print(f"{route:36s} {stats['requests']:9d} {stats['errors']:7d} {stats['rps']:8.1f} "
+              f"{stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}")
+    print(f"Всего: {summary['requests']} запросов за {elapsed:.1f} с ({summary['rps']:.1f} rps), "
+          f"ошибок: {summary['errors']}, гостей с опозданием: {late}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "server": args.server,
+                "sessions": args.sessions,
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "stream_share": args.stream_share,
+                "stream_limit": args.stream_limit,
+                "seed": args.seed,
+            },
+            "late_sessions": late,
+            **summary,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
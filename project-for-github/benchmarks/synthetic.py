@@ -0,0 +1,99 @@
+# Генератор синтетических расписаний для бенчмарков
+# Варианты в том же виде, что и schedule["variants"]: строки даты, времени,
+# продолжительности и окончания, открытые варианты (end_time "-") и
+# специальные письма
+
+import random
+
+# Окно расписания: с 15:00 31.12 до 04:00 01.01, в минутах от 00:00 31.12
+WINDOW_START = 15 * 60
+WINDOW_END = 24 * 60 + 4 * 60
+
+DURATIONS = [
+    ("15 минут", 15),
+    ("20 минут", 20),
+    ("30 минут", 30),
+    ("45 минут", 45),
+    ("1 час", 60),
+    ("1.5 часа", 90),
+    ("2 часа", 120),
+    ("1 час+", 60),
+]
+
+WORDS = [
+    "салют", "фильм", "караоке", "ужин", "подарки", "квест", "танцы", "бильярд",
+    "пин-понг", "тост", "куранты", "ёлка", "игры", "прогулка", "фейерверк", "торт",
+]
+
+EMOJI = ["🎄", "🎉", "🎮", "🍾", "🎁", "🎬", "🎤", "🎆"]
+
+
+def _minute_to_date_time(minute):
+    """Минуты от 00:00 31.12 -> ("31.12"/"01.01", "HH:MM")"""
+    date_str = "31.12" if minute < 24 * 60 else "01.01"
+    minute %= 24 * 60
+    return date_str, f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def generate_variants(count, seed=0, open_ended_ratio=0.05, special_count=2):
+    """Сгенерировать count вариантов (включая special_count специальных)"""
+    rng = random.Random(seed)
+    variants = []
+
+    for i in range(min(special_count, count)):
+        minute = WINDOW_START + i * 30
+        date_str, time_str = _minute_to_date_time(minute)
+        _, end_time = _minute_to_date_time(minute + 30)
+        variants.append({
+            "id": f"special_{i}",
+            "date": date_str,
+            "start_time": time_str,
+            "duration": "30 минут",
+            "end_time": end_time,
+            "title": "",
+            "description": "Специальное письмо",
+            "location": "",
+            "tv": "-",
+            "image": "📮",
+            "special": True,
+            "type": "mailbox" if i % 2 == 0 else "gift"
+        })
+
+    for i in range(len(variants), count):
+        minute = rng.randrange(WINDOW_START, WINDOW_END)
+        date_str, time_str = _minute_to_date_time(minute)
+        words = rng.sample(WORDS, 3)
+        variant = {
+            "id": f"{i}{rng.choice('ab')}",
+            "date": date_str,
+            "start_time": time_str,
+            "title": " ".join(words[:2]).capitalize(),
+            "description": f"Синтетическое событие {i}: {', '.join(words)}",
+            "location": "",
+            "tv": "-",
+            "image": rng.choice(EMOJI)
+        }
+        if rng.random() < open_ended_ratio:
+            variant["duration"] = "-"
+            variant["end_time"] = "-"
+        else:
+            duration_str, duration_minutes = rng.choice(DURATIONS)
+            end_date, end_time = _minute_to_date_time(minute + duration_minutes)
+            variant["duration"] = duration_str
+            variant["end_time"] = end_time
+            if end_date != date_str:
+                variant["end_date"] = end_date
+        variants.append(variant)
+
+    return variants
+
+
+def generate_schedule(count, seed=0, **kwargs):
+    """Сгенерировать расписание того же вида, что и schedule_data.schedule"""
+    return {
+        "cover": {
+            "title": f"Синтетическая программа ({count})",
+            "year": "2025"
+        },
+        "variants": generate_variants(count, seed=seed, **kwargs)
+    }
@@ -0,0 +1,191 @@
+# Колоночное хранение расписания в целых минутах
+# Начало и окончание каждого варианта хранятся как int32 минут от якоря
+# плана (00:00 31.12.2024 - та же система годов, что и в parse_datetime),
+# id и названия - в кортежах интернированных строк. Варианты отсортированы
+# по началу.
+#
+# Вопрос "кто идет в момент T" решается деревом отрезков за O(log n + k),
+# а пакетные вопросы по тысячам моментов - векторными сравнениями NumPy.
+# NumPy необязателен: без него те же ответы считаются на чистом Python
+
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # Без NumPy работают запасные реализации на Python
+    np = None
+
+# Якорь плана: минута 0 - это 00:00 31.12.2024
+SCHEDULE_ANCHOR = datetime(2024, 12, 31)
+# Окончание открытого варианта, у которого нет следующего
+OPEN_END = 2 ** 31 - 1
+# Сколько ячеек (моменты x варианты) сравнивать за один шаг NumPy
+VECTOR_CHUNK_CELLS = 8 * 1024 * 1024
+
+
+def vector_chunks(sorted_limits, max_cells=None):
+    """Шаги пакетного сравнения: (первая строка, число строк, ширина маски)
+
+    sorted_limits - неубывающие длины префиксов для каждого момента; ширина
+    шага - наибольшая длина в нем, и строк берется столько, чтобы маска
+    (строки x ширина) не превышала max_cells. Одна строка шире бюджета
+    сравнивается целиком.
+    """
+    if max_cells is None:
+        max_cells = VECTOR_CHUNK_CELLS
+    total = len(sorted_limits)
+    position = 0
+    while position < total:
+        # Наибольшее rows, при котором rows * ширина <= max_cells; ширина
+        # растет вместе с rows, поэтому - двоичный поиск
+        lo, hi = 1, total - position
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if mid * max(1, int(sorted_limits[position + mid - 1])) <= max_cells:
+                lo = mid
+            else:
+                hi = mid - 1
+        yield position, lo, max(1, int(sorted_limits[position + lo - 1]))
+        position += lo
+
+
+def to_minutes(dt):
+    """datetime -> целые минуты от якоря (секунды отбрасываются)"""
+    delta = dt - SCHEDULE_ANCHOR
+    return delta.days * 24 * 60 + delta.seconds // 60
+
+
+def from_minutes(minutes):
+    """Целые минуты от якоря -> datetime; OPEN_END -> None"""
+    if minutes == OPEN_END:
+        return None
+    return SCHEDULE_ANCHOR + timedelta(minutes=minutes)
+
+
+class ColumnarSchedule:
+    """Колонки отсортированного по началу расписания"""
+
+    def __init__(self, start_minutes, end_minutes, ids, titles):
+        self.starts = array('i', start_minutes)
+        self.ends = array('i', end_minutes)
+        self.ids = tuple(sys.intern(variant_id) for variant_id in ids)
+        self.titles = tuple(sys.intern(title) for title in titles)
+
+        # Дерево отрезков с максимумом окончания над вариантами. Письмо
+        # нулевой длины в дереве занимает минуту [start, start + 1): так оно
+        # попадает ровно в одно из соседних окон [lo, hi)
+        self._size = 1
+        while self._size < len(self.starts):
+            self._size *= 2
+        tree = array('i', [-OPEN_END]) * (2 * self._size)
+        tree[self._size:self._size + len(self.ends)] = array('i', (
+            end if end > start else start + 1 for start, end in zip(self.starts, self.ends)
+        ))
+        for node in range(self._size - 1, 0, -1):
+            tree[node] = max(tree[2 * node], tree[2 * node + 1])
+        self._max_end_tree = tree
+
+        # Отсортированные окончания для подсчета активных через два бинпоиска
+        self._sorted_ends = array('i', sorted(self.ends))
+
+        self._attach_views()
+
+    def _attach_views(self):
+        if np is not None:
+            # Представления без копирования поверх тех же буферов
+            self._np_starts = np.frombuffer(self.starts, dtype=np.int32)
+            self._np_ends = np.frombuffer(self.ends, dtype=np.int32)
+            self._np_sorted_ends = np.frombuffer(self._sorted_ends, dtype=np.int32)
+
+    def __getstate__(self):
+        # Представления NumPy при сохранении стали бы копиями, создаем их заново
+        return {name: value for name, value in self.__dict__.items() if not name.startswith("_np_")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach_views()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def active_slots(self, minute):
+        """Позиции вариантов с start <= minute < end, по возрастанию"""
+        limit = bisect_right(self.starts, minute)
+        slots = []
+        if limit:
+            tree = self._max_end_tree
+            stack = [(1, 0, self._size)]
+            while stack:
+                node, lo, hi = stack.pop()
+                if lo >= limit or tree[node] <= minute:
+                    continue
+                if hi - lo == 1:
+                    # Письмо нулевой длины не активно ни в какой момент
+                    if self.ends[lo] > minute:
+                        slots.append(lo)
+                    continue
+                mid = (lo + hi) // 2
+                stack.append((2 * node + 1, mid, hi))
+                stack.append((2 * node, lo, mid))
+        return slots
+
+    def overlapping_slots(self, lo, hi, start_slot=0, max_count=None):
+        """Позиции вариантов, пересекающих окно [lo, hi), начиная с start_slot
+
+        Вариант занимает [start, end), поэтому письмо, закончившееся ровно в
+        lo, в окно не входит и не повторяется в соседних окнах; письмо нулевой
+        длины считается минутой [start, start + 1). max_count ограничивает
+        размер ответа (для постраничной выдачи): обход дерева
+        останавливается, как только набрано столько.
+        """
+        limit = bisect_left(self.starts, hi)
+        slots = []
+        if start_slot < limit:
+            tree = self._max_end_tree
+            stack = [(1, 0, self._size)]
+            while stack:
+                node, node_lo, node_hi = stack.pop()
+                if node_hi <= start_slot or node_lo >= limit or tree[node] <= lo:
+                    continue
+                if node_hi - node_lo == 1:
+                    slots.append(node_lo)
+                    if max_count is not None and len(slots) >= max_count:
+                        break
+                    continue
+                mid = (node_lo + node_hi) // 2
+                stack.append((2 * node + 1, mid, node_hi))
+                stack.append((2 * node, node_lo, mid))
+        return slots
+
+    def active_slots_many(self, minutes):
+        """Для каждого момента из minutes - список позиций активных вариантов"""
+        if np is None or not len(self.starts):
+            return [self.active_slots(minute) for minute in minutes]
+
+        moments = np.asarray(minutes, dtype=np.int64)
+        limits = np.searchsorted(self._np_starts, moments, side='right')
+        result = [None] * len(moments)
+        # Моменты сортируем, чтобы в одном шаге сравнивать короткие префиксы
+        order = np.argsort(moments, kind='stable')
+        for position, rows, width in vector_chunks(limits[order]):
+            chunk = order[position:position + rows]
+            mask = self._np_ends[None, :width] > moments[chunk, None]
+            mask &= np.arange(width)[None, :] < limits[chunk, None]
+            for row, moment_index in enumerate(chunk):
+                result[moment_index] = np.flatnonzero(mask[row]).tolist()
+        return result
+
+    def active_counts_many(self, minutes):
+        """Для каждого момента - число активных вариантов: #(start <= t) - #(end <= t)"""
+        if np is None:
+            return [
+                bisect_right(self.starts, minute) - bisect_right(self._sorted_ends, minute)
+                for minute in minutes
+            ]
+        moments = np.asarray(minutes, dtype=np.int64)
+        started = np.searchsorted(self._np_starts, moments, side='right')
+        ended = np.searchsorted(self._np_sorted_ends, moments, side='right')
+        return (started - ended).tolist()
@@ -0,0 +1,148 @@
+# Выгрузка расписания в iCalendar (/api/export.ics) и NDJSON (/api/export.ndjson)
+# Тело ответа - генератор: варианты идут в порядке начала прямо из индекса
+# (с уже вычисленными окончаниями) и отдаются кусками по EXPORT_CHUNK_BYTES,
+# поэтому память на запрос не зависит от размера плана, а ответ уходит
+# chunked, без Content-Length. ETag - версия расписания: при совпадении
+# If-None-Match тело не строится вовсе
+
+import json
+
+from flask import current_app, request
+
+from response_cache import CACHE_CONTROL
+from schedule_data import format_datetime
+
+# Сколько байт копить перед отдачей очередного куска
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+CALENDAR_NAME = "Новогодние планы"
+CALENDAR_PRODID = "-//newyearplanforall//Новогодние планы//RU"
+# DTSTAMP обязателен в каждом событии; берем постоянный, чтобы одна версия
+# расписания всегда давала одни и те же байты (и тот же ETag)
+CALENDAR_DTSTAMP = "20241231T000000Z"
+# Длина строки iCalendar без CRLF, в октетах (RFC 5545, 3.1)
+ICS_LINE_OCTETS = 75
+
+
+def _chunked(lines):
+    """Склеивает строки (bytes) в куски примерно по EXPORT_CHUNK_BYTES"""
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b"".join(buffer)
+
+
+def _iter_slots(index):
+    """(вариант, начало, окончание или None) в порядке начала"""
+    return zip(index.variants, index.starts, index.ends)
+
+
+def _ndjson_lines(index):
+    for variant, start_dt, end_dt in _iter_slots(index):
+        item = {
+            "id": variant["id"],
+            "title": variant["title"],
+            "description": variant.get("description", ""),
+            "image": variant.get("image", "📄"),
+            "start": start_dt.isoformat(timespec="minutes"),
+            "end": end_dt.isoformat(timespec="minutes") if end_dt else None,
+            "start_datetime_str": format_datetime(start_dt),
+            "end_datetime_str": format_datetime(end_dt) if end_dt else None,
+            "duration": variant.get("duration", ""),
+            "special": variant.get("special", False),
+            "type": variant.get("type", ""),
+        }
+        yield (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def iter_ndjson(index):
+    """Тело /api/export.ndjson: по объекту JSON на вариант"""
+    return _chunked(_ndjson_lines(index))
+
+
+def _ics_escape(text):
+    """Экранирование TEXT-значения iCalendar"""
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\r", "\\n").replace("\n", "\\n")
+    )
+
+
+def _ics_line(text):
+    """Строка iCalendar с CRLF, перенесенная по 75 октетов (не разрывая символы UTF-8)"""
+    data = text.encode("utf-8")
+    if len(data) <= ICS_LINE_OCTETS:
+        return data + b"\r\n"
+    parts = []
+    limit = ICS_LINE_OCTETS
+    while len(data) > limit:
+        cut = limit
+        # Не режем посреди многобайтового символа: байты продолжения - 10xxxxxx
+        while data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        # Продолжение начинается с пробела, он тоже занимает октет
+        limit = ICS_LINE_OCTETS - 1
+    parts.append(data)
+    return b"\r\n ".join(parts) + b"\r\n"
+
+
+def _ics_datetime(dt):
+    # Плавающее локальное время: в календаре событие окажется в том же
+    # часу по местным часам гостя, как и на сайте
+    return dt.strftime("%Y%m%dT%H%M%S")
+
+
+def _ics_lines(index):
+    yield _ics_line("BEGIN:VCALENDAR")
+    yield _ics_line("VERSION:2.0")
+    yield _ics_line(f"PRODID:{CALENDAR_PRODID}")
+    yield _ics_line("CALSCALE:GREGORIAN")
+    yield _ics_line(f"X-WR-CALNAME:{_ics_escape(CALENDAR_NAME)}")
+    for variant, start_dt, end_dt in _iter_slots(index):
+        yield _ics_line("BEGIN:VEVENT")
+        yield _ics_line(f"UID:{variant['id']}-{start_dt.strftime('%Y%m%dT%H%M')}@newyearplanforall")
+        yield _ics_line(f"DTSTAMP:{CALENDAR_DTSTAMP}")
+        yield _ics_line(f"DTSTART:{_ics_datetime(start_dt)}")
+        if end_dt is not None and end_dt > start_dt:
+            yield _ics_line(f"DTEND:{_ics_datetime(end_dt)}")
+        summary = f"{variant.get('image', '📄')} {variant['title']}".strip()
+        yield _ics_line(f"SUMMARY:{_ics_escape(summary)}")
+        if variant.get("description"):
+            yield _ics_line(f"DESCRIPTION:{_ics_escape(variant['description'])}")
+        yield _ics_line("END:VEVENT")
+    yield _ics_line("END:VCALENDAR")
+
+
+def iter_ics(index):
+    """Тело /api/export.ics: календарь с событием на каждый вариант"""
+    return _chunked(_ics_lines(index))
+
+
+EXPORT_FORMATS = {
+    # формат -> (генератор тела, mimetype, имя файла)
+    "ics": (iter_ics, "text/calendar", "newyear-plan.ics"),
+    "ndjson": (iter_ndjson, "application/x-ndjson", "newyear-plan.ndjson"),
+}
+
+
+def export_response(index, export_format, filename=None):
+    """Потоковый ответ с выгрузкой; 304 без тела при совпадении ETag"""
+    build_body, mimetype, default_filename = EXPORT_FORMATS[export_format]
+    etag = f"export-{export_format}-{index.version}"
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(build_body(index), mimetype=mimetype)
+        response.headers["Content-Disposition"] = f'attachment; filename="{filename or default_filename}"'
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
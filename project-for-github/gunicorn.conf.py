@@ -0,0 +1,149 @@
+# Боевой профиль gunicorn: gunicorn app:app -c gunicorn.conf.py
+#
+# Приложение загружается один раз в мастере (preload_app): расписание
+# компилируется, ответы прогреваются, статика читается в память - и только
+# потом процесс форкается на воркеры. Страницы с этими данными воркеры
+# делят с мастером по copy-on-write, пока никто в них не пишет.
+#
+# Пишет в них в первую очередь сборщик мусора: при обходе он меняет
+# служебные поля заголовков всех отслеживаемых объектов, и страница
+# копируется в воркер. Поэтому, как советует документация модуля gc, сборка
+# в мастере отключена, пока загружается приложение; когда мастер готов,
+# все объекты переносятся в постоянное поколение (gc.freeze()) и сборка
+# снова включается - и в мастере, и в воркерах она больше не обходит
+# унаследованные объекты. Перед каждым fork замораживается и то, что мастер
+# создал с тех пор.
+#
+# Режим задается GUNICORN_MODE:
+# - gthread - потоки; по умолчанию, если SSE-потоки (/api/stream) выключены;
+# - gevent - для тысяч одновременных SSE-подключений; по умолчанию, если
+#   они включены (STREAM_MAX_CONNECTIONS > 0), gevent есть в requirements.txt.
+# Лимит потоков на воркер не больше STREAM_CONNECTION_SHARE его потоков
+# (gthread) или подключений (gevent): остальные всегда свободны для обычных
+# запросов.
+# Число воркеров по умолчанию считается от числа доступных процессору ядер,
+# WEB_CONCURRENCY задает его явно.
+
+import gc
+import os
+
+STREAM_MAX_CONNECTIONS = int(os.environ.get("STREAM_MAX_CONNECTIONS", "0"))
+STREAM_CONNECTION_SHARE = 0.5
+GUNICORN_MODE = os.environ.get("GUNICORN_MODE", "gevent" if STREAM_MAX_CONNECTIONS > 0 else "gthread")
+
+if GUNICORN_MODE == "gevent":
+    # Патчим до загрузки приложения: блокировки, созданные при импорте
+    # модулей в мастере, должны быть уже gevent-совместимыми
+    from gevent import monkey
+    monkey.patch_all()
+
+# Сборка мусора в мастере выключена до загрузки приложения (см. when_ready)
+gc.disable()
+
+
+def _cpu_count():
+    """Ядра, доступные процессу (в контейнере их может быть меньше, чем у машины)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+preload_app = True
+
+if GUNICORN_MODE == "gevent":
+    worker_class = "gevent"
+    # Один процесс на ядро: ожидание подключений не занимает процессор
+    workers = _cpu_count()
+    worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "2000"))
+else:
+    worker_class = "gthread"
+    # Каждое SSE-подключение держит поток; лишний воркер сверх ядер
+    # подхватывает запросы, пока другие упираются в GIL
+    workers = max(2, _cpu_count() + 1)
+    threads = int(os.environ.get("GUNICORN_THREADS", "200"))
+
+if os.environ.get("WEB_CONCURRENCY"):
+    workers = int(os.environ["WEB_CONCURRENCY"])
+
+# Лимит читает live_stream при загрузке приложения (после этого файла)
+_worker_capacity = worker_connections if GUNICORN_MODE == "gevent" else threads
+STREAM_MAX_CONNECTIONS = min(STREAM_MAX_CONNECTIONS, int(_worker_capacity * STREAM_CONNECTION_SHARE))
+os.environ["STREAM_MAX_CONNECTIONS"] = str(STREAM_MAX_CONNECTIONS)
+
+# Перезапуск воркера после стольких запросов (с разбросом, чтобы воркеры не
+# уходили на перезапуск одновременно) ограничивает рост памяти от
+# фрагментации и кэшей планов. Новый воркер форкается из мастера и сразу
+# получает скомпилированное расписание
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "5000"))
+max_requests_jitter = max_requests // 10
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Сообщения приложения уровня INFO (перезагрузка расписания, время старта
+# воркера до готовности) - в stderr рядом с логом gunicorn; журнал
+# доступа по-прежнему выключен
+logconfig_dict = {
+    "root": {"level": "INFO", "handlers": ["error_console"]},
+    "loggers": {
+        "gunicorn.error": {"level": "INFO", "handlers": ["error_console"], "propagate": False},
+        "gunicorn.access": {"level": "WARNING", "handlers": ["console"], "propagate": False},
+    },
+}
+
+
+def on_starting(server):
+    """Старт мастера: счетчики метрик прошлого запуска больше не нужны"""
+    import metrics
+
+    metrics.reset_multiproc_dir()
+
+
+def when_ready(server):
+    """Мастер загрузил приложение: докомпилируем все, что строится лениво"""
+    # Модуль приложения уже импортирован preload_app, здесь берется он же
+    import app as application
+    from schedule_data import get_schedule_index
+
+    application.warm_schedule(get_schedule_index())
+    gc.collect()
+    # Дальше мастер живет с обычной сборкой мусора, но без обхода уже загруженного
+    gc.freeze()
+    gc.enable()
+    server.log.info("Расписание скомпилировано до fork (%s воркеров %s, SSE-потоков на воркер: %s)",
+                    workers, worker_class, STREAM_MAX_CONNECTIONS)
+
+
+def pre_fork(server, worker):
+    """Перед каждым fork: новые объекты мастера - тоже в постоянное поколение"""
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """Воркер после перезапуска не должен отдавать устаревшее расписание мастера"""
+    import app as application
+    import schedule_snapshot
+
+    if application.schedule_watcher is not None:
+        try:
+            application.schedule_watcher.check()
+        except Exception:
+            worker.log.exception("Не удалось перечитать расписание в воркере")
+    schedule_snapshot.report_ready()
+
+
+def worker_exit(server, worker):
+    """Последний сброс счетчиков метрик завершающегося воркера (в самом воркере)"""
+    import metrics
+
+    if metrics.METRICS_ENABLED and metrics.METRICS_MULTIPROC_DIR:
+        metrics.flush()
+
+
+def child_exit(server, worker):
+    """Воркер завершился: его счетчики метрик переходят в общий архив"""
+    import metrics
+
+    metrics.archive_worker(worker.pid)
@@ -0,0 +1,202 @@
+# Маршрут на вечер (/api/itinerary): лучшая последовательность писем без
+# наложений. Колонки a и b - это выбор между событиями, идущими в одно
+# время; здесь выбор делается за гостя по весам писем.
+#
+# Вес письма по умолчанию - его длина в минутах (лучший маршрут - самый
+# заполненный вечер); ?weights=12a:3,4b:0 умножает вес отдельных писем,
+# 0 - исключить письмо. Задача - взвешенный выбор интервалов: письма
+# сортируются по окончанию, для каждого бинпоиском находится последнее
+# письмо, закончившееся до его начала, и динамика за один проход дает
+# оптимум - O(n log n) на подготовку (один раз на индекс) и O(n) на набор
+# весов. Ответы для одинаковых наборов весов берутся из ограниченного кэша
+
+import hashlib
+import json
+import math
+import sys
+import threading
+import weakref
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+
+from schedule_data import format_datetime
+
+# Сколько наборов весов помнить на один индекс
+ITINERARY_CACHE_SIZE = 128
+MAX_ITINERARY_WEIGHTS = 1000
+# Больший множитель ничего не добавляет к выбору, а сумма весов с ним
+# может переполниться до inf (и в JSON попадет Infinity)
+MAX_ITINERARY_MULTIPLIER = 1_000_000
+
+
+def parse_weights(value):
+    """"12a:3,4b:0" -> {"12a": 3.0, "4b": 0.0}; ValueError при ошибке формата"""
+    weights = {}
+    for item in filter(None, (value or "").split(",")):
+        variant_id, separator, weight = item.partition(":")
+        if not separator or not variant_id:
+            raise ValueError(item)
+        weight = float(weight)
+        if not math.isfinite(weight) or not 0 <= weight <= MAX_ITINERARY_MULTIPLIER:
+            raise ValueError(item)
+        weights[variant_id] = weight
+    if len(weights) > MAX_ITINERARY_WEIGHTS:
+        raise ValueError(f"не больше {MAX_ITINERARY_WEIGHTS} весов")
+    return weights
+
+
+class ItineraryPlanner:
+    """Письма одного расписания, подготовленные для выбора интервалов"""
+
+    def __init__(self, index):
+        # Слабая ссылка: планировщик лежит в WeakKeyDictionary по этому же индексу
+        self._index = weakref.ref(index)
+        self.version = index.version
+        columns = index.columns
+
+        # Участвуют письма колонок a и b с известным окончанием (как в /api/letters)
+        slots = [
+            slot for slot, (variant, end_dt) in enumerate(zip(index.variants, index.ends))
+            if end_dt is not None and not variant.get("special", False) and variant["id"][-1:] in ("a", "b")
+        ]
+        slots.sort(key=lambda slot: (columns.ends[slot], columns.starts[slot]))
+        self.slots = array('i', slots)
+        self.ends = array('i', (columns.ends[slot] for slot in slots))
+        # predecessors[j] - сколько писем (в порядке окончания) до письма j
+        # закончились не позже его начала: с любым из них письмо j совместимо.
+        # Поиск только среди первых j писем: у письма нулевой длины окончание
+        # равно началу, и без границы оно "совместимо" с самим собой и
+        # следующими, а динамика и обратный проход ссылаются вперед
+        self.predecessors = array('i', (
+            bisect_right(self.ends, columns.starts[slot], 0, position)
+            for position, slot in enumerate(slots)
+        ))
+        self.base_weights = array('d', (
+            max(1, columns.ends[slot] - columns.starts[slot]) for slot in slots
+        ))
+        self.position_by_id = {index.variants[slot]["id"]: position for position, slot in enumerate(slots)}
+
+        self._results = OrderedDict()  # набор весов -> (тело, ETag)
+        self._lock = threading.Lock()
+        # Оценка занимаемой памяти: подготовленные массивы и кэшированные тела
+        self.size_bytes = (
+            sum(map(sys.getsizeof, (self.slots, self.ends, self.predecessors, self.base_weights)))
+            + sys.getsizeof(self.position_by_id)
+            + sum(map(sys.getsizeof, self.position_by_id))
+        )
+
+    def _choose(self, weights):
+        """Позиции (в порядке окончания) писем оптимального маршрута и его вес"""
+        count = len(self.slots)
+        predecessors = self.predecessors
+        best = array('d', bytes(8 * (count + 1)))  # best[j] - оптимум по первым j письмам
+        taken = bytearray(count)
+        for j in range(count):
+            with_letter = weights[j] + best[predecessors[j]]
+            if with_letter > best[j]:
+                best[j + 1] = with_letter
+                taken[j] = 1
+            else:
+                best[j + 1] = best[j]
+
+        chosen = []
+        j = count - 1
+        while j >= 0:
+            if taken[j]:
+                chosen.append(j)
+                j = predecessors[j] - 1
+            else:
+                j -= 1
+        chosen.reverse()
+        return chosen, best[count]
+
+    def _build(self, weights_key):
+        index = self._index()
+        weights = array('d', self.base_weights)
+        for variant_id, multiplier in weights_key:
+            position = self.position_by_id[variant_id]
+            weights[position] *= multiplier
+
+        chosen, total_weight = self._choose(weights)
+        letters = []
+        total_minutes = 0
+        for position in chosen:
+            slot = self.slots[position]
+            variant = index.variants[slot]
+            minutes = index.columns.ends[slot] - index.columns.starts[slot]
+            total_minutes += minutes
+            letters.append({
+                "id": variant["id"],
+                "title": variant["title"],
+                "image": variant.get("image", "📄"),
+                "column": variant["id"][-1],
+                "start_datetime_str": format_datetime(index.starts[slot]),
+                "end_datetime_str": format_datetime(index.ends[slot]),
+                "duration_minutes": minutes,
+                "weight": round(weights[position], 4),
+            })
+        payload = {
+            "version": self.version,
+            "weights": dict(weights_key),
+            "total_weight": round(total_weight, 4),
+            "total_minutes": total_minutes,
+            "letters": letters,
+        }
+        # Бесконечный или NaN вес - ValueError, а не Infinity в ответе
+        body = (json.dumps(payload, ensure_ascii=False, separators=(",", ":"), allow_nan=False) + "\n").encode("utf-8")
+        return body, hashlib.sha1(body).hexdigest()
+
+    def unknown_ids(self, weights):
+        return [variant_id for variant_id in weights if variant_id not in self.position_by_id]
+
+    def plan(self, weights):
+        """(тело, ETag) ответа /api/itinerary для набора весов {id: множитель}
+
+        ValueError, если сумма весов маршрута не конечна.
+        """
+        # Множитель 1 ничего не меняет: такие наборы весов - один ключ кэша
+        weights_key = tuple(sorted((variant_id, weight) for variant_id, weight in weights.items() if weight != 1))
+        with self._lock:
+            entry = self._results.get(weights_key)
+            if entry is not None:
+                self._results.move_to_end(weights_key)
+                return entry
+        entry = self._build(weights_key)
+        with self._lock:
+            if weights_key not in self._results:
+                self.size_bytes += len(entry[0])
+            self._results[weights_key] = entry
+            while len(self._results) > ITINERARY_CACHE_SIZE:
+                _, (dropped, _) = self._results.popitem(last=False)
+                self.size_bytes -= len(dropped)
+        return entry
+
+
+# Планировщик живет, пока жив индекс расписания (как индекс поиска)
+_planners = weakref.WeakKeyDictionary()
+_planners_lock = threading.Lock()
+
+
+def itinerary_planner_size(index):
+    """Сколько байт держит планировщик маршрутов расписания (0, если его еще нет)"""
+    planner = _planners.get(index)
+    return planner.size_bytes if planner is not None else 0
+
+
+def get_itinerary_planner(index):
+    """Планировщик маршрутов для индекса расписания (строится один раз на версию)"""
+    planner = _planners.get(index)
+    if planner is None:
+        with _planners_lock:
+            planner = _planners.get(index)
+            if planner is None:
+                planner = ItineraryPlanner(index)
+                _planners[index] = planner
+    return planner
+
+
+def clear_itinerary_planners():
+    """Забывает планировщики всех индексов (для холодных замеров в бенчмарках)"""
+    with _planners_lock:
+        _planners.clear()
@@ -0,0 +1,123 @@
+# Раскладка писем на столе для страницы писем
+# Считается на сервере один раз на версию расписания: для каждого письма
+# определяется дорожка (по центру, слева или справа), узость, пары a/b,
+# промежутки в колонках и масштаб шкалы. Клиенту остается только
+# расставить готовые прямоугольники по минутам
+
+from schedule_data import find_overlapping_intervals, format_datetime
+
+# Высота письма в минутах, если у варианта не указана продолжительность
+DEFAULT_HEIGHT_MINUTES = 30
+
+
+def _minutes_between(start_dt, end_dt):
+    return (end_dt - start_dt).total_seconds() / 60
+
+
+def _column_gaps(items, min_time):
+    """Промежутки между соседними письмами одной колонки"""
+    gaps = []
+    for prev_item, item in zip(items, items[1:]):
+        if prev_item["end_dt"] < item["start_dt"]:
+            gaps.append({
+                "start_minutes": _minutes_between(min_time, prev_item["end_dt"]),
+                "end_minutes": _minutes_between(min_time, item["start_dt"]),
+            })
+    return gaps
+
+
+def compute_layout(index):
+    """Раскладка писем расписания index (для /api/layout)"""
+    # Шкала строится по всем письмам с известным окончанием, включая специальные
+    scale_starts = []
+    scale_ends = []
+    letters = []
+    for variant in index.source_variants:
+        start_dt = index.start_of(variant)
+        end_dt = index.end_of(variant)
+        if not end_dt:
+            continue
+        scale_starts.append(start_dt)
+        scale_ends.append(end_dt)
+
+        variant_id = variant["id"]
+        if variant.get("special", False):
+            continue
+        if not (variant_id.endswith('a') or variant_id.endswith('b')):
+            continue
+        letters.append({
+            "id": variant_id,
+            "column": variant_id[-1],
+            "start_dt": start_dt,
+            "end_dt": end_dt,
+            "duration_minutes": index.duration_of(variant),
+        })
+
+    if not letters:
+        return {"version": index.version, "min_time": None, "max_time": None,
+                "total_minutes": 0, "boxes": [], "gaps": {"a": [], "b": []}}
+
+    min_time = min(scale_starts)
+    max_time = max(scale_ends)
+
+    # Тот же порядок, что у /api/letters (стабильно по времени начала)
+    letters.sort(key=lambda letter: letter["start_dt"])
+    column_a = [letter for letter in letters if letter["column"] == 'a']
+    column_b = [letter for letter in letters if letter["column"] == 'b']
+
+    # Письмо из колонки a узкое, если накладывается хотя бы на одно письмо из b
+    overlapping_a = find_overlapping_intervals(
+        [(letter["start_dt"], letter["end_dt"]) for letter in column_a],
+        [(letter["start_dt"], letter["end_dt"]) for letter in column_b]
+    )
+    for i, letter in enumerate(column_a):
+        letter["narrow"] = i in overlapping_a
+    for letter in column_b:
+        letter["narrow"] = True
+
+    # Пары a/b одним проходом: узкое письмо a берет первое еще свободное письмо b,
+    # которое идет после него и начинается до его окончания
+    b_positions = [position for position, letter in enumerate(letters) if letter["column"] == 'b']
+    next_b = 0
+    for position, letter in enumerate(letters):
+        if letter["column"] != 'a' or not letter["narrow"]:
+            continue
+        while next_b < len(b_positions) and b_positions[next_b] < position:
+            next_b += 1
+        if next_b < len(b_positions):
+            candidate = letters[b_positions[next_b]]
+            if candidate["start_dt"] < letter["end_dt"]:
+                letter["paired_with"] = candidate["id"]
+                candidate["paired_with"] = letter["id"]
+                next_b += 1
+
+    boxes = []
+    for letter in letters:
+        if letter["column"] == 'b':
+            lane = "right"
+        elif letter["narrow"]:
+            lane = "left"
+        else:
+            lane = "center"
+        boxes.append({
+            "id": letter["id"],
+            "column": letter["column"],
+            "lane": lane,
+            "narrow": letter["narrow"],
+            "paired_with": letter.get("paired_with"),
+            "start_minutes": _minutes_between(min_time, letter["start_dt"]),
+            "end_minutes": _minutes_between(min_time, letter["end_dt"]),
+            "height_minutes": letter["duration_minutes"] or DEFAULT_HEIGHT_MINUTES,
+        })
+
+    return {
+        "version": index.version,
+        "min_time": format_datetime(min_time),
+        "max_time": format_datetime(max_time),
+        "total_minutes": _minutes_between(min_time, max_time),
+        "boxes": boxes,
+        "gaps": {
+            "a": _column_gaps(column_a, min_time),
+            "b": _column_gaps(column_b, min_time),
+        },
+    }
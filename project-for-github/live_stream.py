@@ -0,0 +1,157 @@
+# Поток server-sent events для клиентов страницы писем
+# Вместо опроса /api/current_time раз в минуту клиент подписывается на
+# /api/stream и получает событие только на реальных границах расписания
+# (начало/окончание вариантов) и одно периодическое событие часов.
+# Событие schedule (номер версии) приходит при подключении и после каждой
+# замены расписания: текущий индекс перечитывается при каждом пробуждении,
+# и не реже раза в STREAM_SCHEDULE_CHECK_SECONDS.
+#
+# Каждое подключение долго занимает воркер (в gthread - целый поток),
+# поэтому потоки включаются явно: STREAM_MAX_CONNECTIONS - сколько их может
+# быть открыто в одном процессе одновременно. Сверх лимита (и при 0, по
+# умолчанию) /api/stream отвечает 503, а страница проверяет изменения
+# расписания опросом
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from schedule_data import (
+    format_datetime,
+    get_current_date_time,
+    get_current_schedule_datetime,
+    get_schedule_index,
+)
+
+# Период событий часов, секунд (заодно служит heartbeat для прокси)
+STREAM_TICK_SECONDS = 60
+# Через сколько миллисекунд браузер переподключится после обрыва
+STREAM_RETRY_MS = 5000
+# Как часто проверять, не заменено ли расписание, секунд
+STREAM_SCHEDULE_CHECK_SECONDS = 5
+# Сколько потоков одновременно держит один процесс (0 - потоки выключены)
+STREAM_MAX_CONNECTIONS = int(os.environ.get("STREAM_MAX_CONNECTIONS", "0"))
+
+# Пустой комментарий SSE при каждой проверке расписания
+STREAM_KEEPALIVE = ":\n\n"
+
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+
+def streams_enabled():
+    return STREAM_MAX_CONNECTIONS > 0
+
+
+def try_open_stream():
+    """Занимает место под новый поток; False - лимит исчерпан"""
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= STREAM_MAX_CONNECTIONS:
+            return False
+        _open_streams += 1
+        return True
+
+
+def close_stream():
+    """Освобождает место, занятое try_open_stream"""
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+
+def open_streams():
+    """Сколько потоков открыто в этом процессе"""
+    return _open_streams
+
+
+def format_event(event, data):
+    """Форматирует одно SSE-событие"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def build_tick_data(now):
+    """Данные события часов (тот же формат, что у /api/current_time)"""
+    date_str, time_str = get_current_date_time(now)
+    return {
+        "time": time_str,
+        "date": date_str,
+        "full_date": now.strftime("%d.%m.%Y"),
+        "datetime_str": format_datetime(get_current_schedule_datetime(now)),
+    }
+
+
+def build_slot_data(index, boundary_dt):
+    """Данные события смены слота: какие письма доступны с этого момента"""
+    return {
+        "datetime_str": format_datetime(boundary_dt),
+        "active": [v["id"] for v in index.available_at(boundary_dt)],
+    }
+
+
+def build_schedule_data(index):
+    """Данные события замены расписания"""
+    return {"revision": index.revision, "version": index.version}
+
+
+def stream_events(get_index=get_schedule_index, tick_seconds=STREAM_TICK_SECONDS,
+                  check_seconds=STREAM_SCHEDULE_CHECK_SECONDS, clock=datetime.now,
+                  sleep=time.sleep, monotonic=time.monotonic):
+    """Генератор SSE: спит до ближайшей границы расписания или тика часов
+
+    get_index возвращает текущий индекс расписания (None - расписания
+    больше нет, поток завершается); он вызывается при каждом пробуждении,
+    поэтому после горячей замены события идут уже по новому расписанию.
+    """
+    index = get_index()
+    if index is None:
+        return
+
+    yield f"retry: {STREAM_RETRY_MS}\n\n"
+
+    now = clock()
+    yield format_event("tick", build_tick_data(now))
+    yield format_event("schedule", build_schedule_data(index))
+    next_tick = monotonic() + tick_seconds
+    last_boundary = None
+
+    while True:
+        current = get_index()
+        if current is None:
+            return
+        if current is not index:
+            index = current
+            last_boundary = None
+            yield format_event("schedule", build_schedule_data(index))
+
+        now = clock()
+        schedule_now = get_current_schedule_datetime(now)
+        search_from = schedule_now
+        if last_boundary is not None and schedule_now < last_boundary <= schedule_now + timedelta(seconds=1):
+            # Проснулись чуть раньше границы - не повторяем уже отправленное событие
+            search_from = last_boundary
+        boundary_dt = index.next_boundary_after(search_from)
+
+        wait_tick = max(0.0, next_tick - monotonic())
+        if boundary_dt is not None:
+            wait_boundary = (boundary_dt - schedule_now).total_seconds()
+        else:
+            wait_boundary = None
+
+        if wait_boundary is not None and wait_boundary <= min(wait_tick, check_seconds):
+            sleep(wait_boundary)
+            last_boundary = boundary_dt
+            yield format_event("slot", build_slot_data(index, boundary_dt))
+        elif wait_tick <= check_seconds:
+            sleep(wait_tick)
+            yield format_event("tick", build_tick_data(clock()))
+            next_tick = monotonic() + tick_seconds
+        else:
+            # До события далеко: просыпаемся проверить, не заменено ли расписание.
+            # Комментарий SSE клиент пропускает, а закрытое подключение на нем
+            # обрывается - и место в STREAM_MAX_CONNECTIONS освобождается сразу
+            sleep(check_seconds)
+            yield STREAM_KEEPALIVE
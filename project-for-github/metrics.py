@@ -0,0 +1,361 @@
+# Метрики в текстовом формате Prometheus (/metrics)
+# Включаются переменной окружения METRICS_ENABLED=1; без нее не ставится ни
+# одного хука и ни одной обертки, поэтому выключенные метрики ничего не стоят.
+#
+# Считается по маршрутам: число запросов, гистограммы времени ответа и
+# размера тела, попадания в ETag (304) среди условных запросов; а также
+# время вызовов функций schedule_data.
+#
+# Несколько воркеров gunicorn: если задан METRICS_MULTIPROC_DIR, каждый
+# воркер раз в секунду сбрасывает свои счетчики в собственный файл
+# metrics-<pid>-<метка запуска>.json в этой папке (метка - чтобы воркер с
+# повторно выданным pid не затер файл прежнего), а /metrics суммирует файлы
+# всех воркеров. Когда воркер завершается, мастер переносит его счетчики в
+# metrics-archive.json (хук child_exit) - счетчики не уменьшаются, а при
+# старте мастер очищает папку от прошлого запуска (хук on_starting)
+
+import functools
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+from flask import Response, g, request
+
+import schedule_data
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "") not in ("", "0", "false")
+METRICS_MULTIPROC_DIR = os.environ.get("METRICS_MULTIPROC_DIR", "")
+FLUSH_INTERVAL_SECONDS = 1.0
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Функции schedule_data, время которых измеряется
+TIMED_INDEX_METHODS = (
+    "__init__", "available_at", "available_at_many", "starting_after", "starting_at",
+    "start_of", "end_of", "duration_of", "get_by_id", "next_boundary_after",
+)
+TIMED_FUNCTIONS = (
+    "get_variants_available_at_datetime",
+    "get_variants_available_at_datetimes",
+    "get_next_variants_after_datetime",
+    "get_variants_by_datetime",
+    "get_toc",
+    "get_toc_columns",
+    "get_duration_minutes",
+    "find_overlapping_intervals",
+)
+
+HELP = {
+    "http_requests_total": ("counter", "Число HTTP-запросов по маршрутам"),
+    "http_request_duration_seconds": ("histogram", "Время обработки запроса, секунд"),
+    "http_response_size_bytes": ("histogram", "Размер тела ответа, байт"),
+    "http_conditional_requests_total": ("counter", "Запросы с If-None-Match: hit - ответ 304"),
+    "schedule_data_call_duration_seconds": ("histogram", "Время вызова функций schedule_data, секунд"),
+}
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы одного процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}  # (имя, метки) -> значение
+        self.histograms = {}  # (имя, метки) -> [счетчики корзин..., сумма, количество]
+        self.buckets = {}  # имя гистограммы -> границы корзин
+        self.dirty = False
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.dirty = True
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self._lock:
+            state = self.histograms.get(key)
+            if state is None:
+                state = [0] * len(buckets) + [0.0, 0]
+                self.histograms[key] = state
+                self.buckets[name] = buckets
+            # Значения больше последней границы попадают только в +Inf (= количество)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+            self.dirty = True
+
+    def snapshot(self):
+        """Состояние в виде, пригодном для JSON"""
+        with self._lock:
+            self.dirty = False
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                "histograms": [[name, list(labels), list(state)] for (name, labels), state in self.histograms.items()],
+                "buckets": {name: list(bounds) for name, bounds in self.buckets.items()},
+            }
+
+
+registry = MetricsRegistry()
+_flusher_pid = None
+_process_file = None  # (pid, файл счетчиков этого процесса)
+
+WORKER_FILES_PATTERN = "metrics-[0-9]*-*.json"
+ARCHIVE_FILENAME = "metrics-archive.json"
+
+
+def _labels(**labels):
+    return tuple(sorted(labels.items()))
+
+
+def _timed(name, func):
+    """Обертка, записывающая время вызова func в гистограмму schedule_data"""
+    labels = _labels(function=name)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            registry.observe("schedule_data_call_duration_seconds", labels,
+                             time.perf_counter() - started, LATENCY_BUCKETS)
+    return wrapper
+
+
+def instrument_schedule_data():
+    """Оборачивает методы индекса и функции schedule_data таймерами"""
+    index_class = schedule_data.ScheduleIndex
+    for method in TIMED_INDEX_METHODS:
+        setattr(index_class, method, _timed(f"ScheduleIndex.{method}", getattr(index_class, method)))
+    for name in TIMED_FUNCTIONS:
+        setattr(schedule_data, name, _timed(name, getattr(schedule_data, name)))
+
+
+def _flush_path():
+    """Файл счетчиков этого процесса (после fork - новый)"""
+    global _process_file
+    pid = os.getpid()
+    if _process_file is None or _process_file[0] != pid:
+        _process_file = (pid, os.path.join(METRICS_MULTIPROC_DIR, f"metrics-{pid}-{time.time_ns()}.json"))
+    return _process_file[1]
+
+
+def _write_json(path, data):
+    # Свой временный файл на каждую запись: файл воркера пишут и /metrics, и
+    # фоновый сброс, и с общим именем один мог подменить недописанный файл другого
+    with tempfile.NamedTemporaryFile(
+        "w", encoding="utf-8", dir=os.path.dirname(path),
+        prefix=f"{os.path.basename(path)}.", suffix=".tmp", delete=False,
+    ) as f:
+        tmp_path = f.name
+        try:
+            json.dump(data, f)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    """Содержимое файла или None, если его нет или он как раз перезаписывается"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Сбрасывает счетчики этого процесса в общий файл (атомарно)"""
+    _write_json(_flush_path(), registry.snapshot())
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL_SECONDS)
+        if registry.dirty:
+            flush()
+
+
+def _ensure_flusher():
+    """Фоновый сброс в файл; запускается в каждом воркере после fork"""
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid != pid:
+        _flusher_pid = pid
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _collect():
+    """Суммарные счетчики: из файлов всех воркеров или только этого процесса"""
+    if not METRICS_MULTIPROC_DIR:
+        return [registry.snapshot()]
+    flush()
+    snapshots = {}
+    for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, WORKER_FILES_PATTERN)):
+        snapshot = _read_json(path)
+        if snapshot is not None:
+            snapshots[os.path.basename(path)] = snapshot
+    # Архив читается после файлов воркеров: файл завершившегося воркера
+    # удаляется только после записи архива, поэтому каждый воркер
+    # учитывается ровно один раз - либо по своему файлу, либо по архиву
+    archive = _read_json(os.path.join(METRICS_MULTIPROC_DIR, ARCHIVE_FILENAME))
+    if archive is not None:
+        for filename in archive["files"]:
+            snapshots.pop(filename, None)
+        snapshots[ARCHIVE_FILENAME] = archive
+    return list(snapshots.values())
+
+
+def _merge(snapshots):
+    """Сумма состояний нескольких процессов: (счетчики, гистограммы, корзины)"""
+    counters = {}
+    histograms = {}
+    buckets = {}
+    for snapshot in snapshots:
+        buckets.update({name: tuple(bounds) for name, bounds in snapshot["buckets"].items()})
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, state in snapshot["histograms"]:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(state))
+            for i, value in enumerate(state):
+                total[i] += value
+    return counters, histograms, buckets
+
+
+def reset_multiproc_dir():
+    """Удаляет счетчики прошлого запуска (мастер gunicorn, хук on_starting)"""
+    if not (METRICS_ENABLED and METRICS_MULTIPROC_DIR):
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    for pattern in (WORKER_FILES_PATTERN, ARCHIVE_FILENAME, "metrics-*.tmp"):
+        for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, pattern)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def archive_worker(pid):
+    """Переносит счетчики завершившегося воркера в архив (мастер, хук child_exit)"""
+    if not (METRICS_ENABLED and METRICS_MULTIPROC_DIR):
+        return
+    paths = glob.glob(os.path.join(METRICS_MULTIPROC_DIR, f"metrics-{pid}-*.json"))
+    if not paths:
+        return
+    archive_path = os.path.join(METRICS_MULTIPROC_DIR, ARCHIVE_FILENAME)
+    archive = _read_json(archive_path) or {"files": []}
+    snapshots = [archive] if "counters" in archive else []
+    archived = []
+    for path in paths:
+        snapshot = _read_json(path)
+        if snapshot is not None:
+            snapshots.append(snapshot)
+            archived.append(os.path.basename(path))
+    counters, histograms, buckets = _merge(snapshots)
+    # Имена файлов нужны, только пока файлы еще не удалены
+    files = [
+        filename for filename in archive["files"]
+        if os.path.exists(os.path.join(METRICS_MULTIPROC_DIR, filename))
+    ] + archived
+    _write_json(archive_path, {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), state] for (name, labels), state in histograms.items()],
+        "buckets": {name: list(bounds) for name, bounds in buckets.items()},
+        "files": files,
+    })
+    for path in paths:
+        os.remove(path)
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in pairs) + "}"
+
+
+def render_metrics():
+    """Текст для /metrics в формате Prometheus"""
+    counters, histograms, buckets = _merge(_collect())
+
+    lines = []
+    for metric, (kind, help_text) in HELP.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        if kind == "counter":
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f"{metric}{_format_labels(labels)} {value}")
+        else:
+            for (name, labels), state in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets[name], state):
+                    cumulative += count
+                    lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {state[-1]}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {state[-2]}")
+                lines.append(f"{metric}_count{_format_labels(labels)} {state[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _before_request():
+    if METRICS_MULTIPROC_DIR:
+        _ensure_flusher()
+    g.metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    route_labels = _labels(route=route)
+
+    registry.inc("http_requests_total", _labels(route=route, method=request.method, status=response.status_code))
+    registry.observe("http_request_duration_seconds", route_labels,
+                     time.perf_counter() - started, LATENCY_BUCKETS)
+    if not response.is_streamed:
+        registry.observe("http_response_size_bytes", route_labels,
+                         response.calculate_content_length() or 0, SIZE_BUCKETS)
+    if request.if_none_match:
+        result = "hit" if response.status_code == 304 else "miss"
+        registry.inc("http_conditional_requests_total", _labels(route=route, result=result))
+    return response
+
+
+def init_app(app):
+    """Подключает метрики к приложению, если они включены"""
+    if not METRICS_ENABLED:
+        return
+    if METRICS_MULTIPROC_DIR:
+        os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.route('/metrics')
+    def metrics():
+        """Метрики в формате Prometheus"""
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+# Обертки ставятся при импорте: app.py импортирует metrics раньше остальных
+# модулей, чтобы и они получили функции schedule_data уже с таймерами
+if METRICS_ENABLED:
+    instrument_schedule_data()
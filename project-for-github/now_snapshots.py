@@ -0,0 +1,135 @@
+# Готовые ответы "что идет сейчас" для /api/now
+# Набор доступных писем меняется только на границах расписания (начала и
+# окончания вариантов), поэтому между соседними границами ответ один и тот
+# же. Каждое письмо сериализуется один раз (фрагмент JSON), а тело ответа
+# промежутка склеивается из фрагментов при первом запросе в нем и держится
+# в небольшом LRU-кэше: в полночь все запросы приходятся на один-два
+# промежутка и получают готовые байты, а память не растет с числом
+# промежутков, умноженным на число одновременно идущих писем
+
+import hashlib
+import threading
+import weakref
+from bisect import bisect_right
+from collections import OrderedDict
+
+from flask import current_app
+
+from schedule_data import format_datetime
+
+# Сколько готовых тел промежутков держать на одно расписание
+NOW_BODY_CACHE_INTERVALS = 32
+# Больше минуты ответ не кэшируется, даже если до границы далеко
+NOW_MAX_AGE_SECONDS = 60
+# Заглушка на месте списка писем при сериализации остальной части ответа
+LETTERS_PLACEHOLDER = "\x00letters\x00"
+
+
+def build_now_letter(index, variant):
+    """Письмо в ответе /api/now"""
+    end_dt = index.end_of(variant)
+    return {
+        "id": variant["id"],
+        "title": variant["title"],
+        "image": variant.get("image", "📄"),
+        "start_datetime_str": format_datetime(index.start_of(variant)),
+        "end_datetime_str": format_datetime(end_dt) if end_dt else None,
+        "special": variant.get("special", False),
+    }
+
+
+def _dumps(data):
+    return current_app.json.dumps(data, separators=(",", ":"))
+
+
+class NowSnapshots:
+    """Ответы /api/now одного расписания по промежуткам между границами
+
+    Промежуток 0 - до первой границы (ничего еще не началось),
+    промежуток i - от boundaries[i - 1] до boundaries[i].
+    """
+
+    def __init__(self, index):
+        # Слабая ссылка: снимки лежат в WeakKeyDictionary по этому же индексу
+        self._index = weakref.ref(index)
+        self.version = index.version
+        self.boundaries = index.boundaries
+        self._fragments = {}  # позиция варианта в индексе -> JSON письма в байтах
+        self._bodies = OrderedDict()  # промежуток -> (тело, ETag)
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+
+    def interval_of(self, moment):
+        """Номер промежутка, в который попадает moment"""
+        return bisect_right(self.boundaries, moment)
+
+    def _fragment(self, index, variant):
+        slot = index.slot_of(variant)
+        fragment = self._fragments.get(slot)
+        if fragment is None:
+            fragment = _dumps(build_now_letter(index, variant)).encode("utf-8")
+            self._fragments[slot] = fragment
+            self.size_bytes += len(fragment)
+        return fragment
+
+    def _serialize(self, index, position):
+        since = self.boundaries[position - 1] if position > 0 else None
+        until = self.boundaries[position] if position < len(self.boundaries) else None
+        active = index.available_at(since) if since is not None else []
+        envelope = _dumps({
+            "version": self.version,
+            "since": format_datetime(since) if since else None,
+            "until": format_datetime(until) if until else None,
+            "letters": LETTERS_PLACEHOLDER,
+        }).encode("utf-8")
+        letters = b"[" + b",".join(self._fragment(index, variant) for variant in active) + b"]"
+        body = envelope.replace(_dumps(LETTERS_PLACEHOLDER).encode("utf-8"), letters, 1) + b"\n"
+        return body, hashlib.sha1(body).hexdigest()
+
+    def get(self, moment):
+        """(тело, ETag, секунд до следующей границы или None) для момента moment"""
+        position = self.interval_of(moment)
+        with self._lock:
+            entry = self._bodies.get(position)
+            if entry is not None:
+                self._bodies.move_to_end(position)
+            else:
+                entry = self._serialize(self._index(), position)
+                self._bodies[position] = entry
+                self.size_bytes += len(entry[0])
+                while len(self._bodies) > NOW_BODY_CACHE_INTERVALS:
+                    _, (dropped, _) = self._bodies.popitem(last=False)
+                    self.size_bytes -= len(dropped)
+        if position < len(self.boundaries):
+            return entry[0], entry[1], (self.boundaries[position] - moment).total_seconds()
+        return entry[0], entry[1], None
+
+
+# Снимки живут, пока жив индекс: при перезагрузке расписания или вытеснении
+# плана из кэша они уходят вместе с ним
+_snapshots = weakref.WeakKeyDictionary()
+_snapshots_lock = threading.Lock()
+
+
+def clear_now_snapshots():
+    """Забывает снимки всех индексов (для холодных замеров в бенчмарках)"""
+    with _snapshots_lock:
+        _snapshots.clear()
+
+
+def now_snapshots_size(index):
+    """Сколько байт держат снимки /api/now индекса (0, если их еще нет)"""
+    snapshots = _snapshots.get(index)
+    return snapshots.size_bytes if snapshots is not None else 0
+
+
+def get_now_snapshots(index):
+    """Снимки /api/now для индекса (создаются один раз на индекс)"""
+    snapshots = _snapshots.get(index)
+    if snapshots is None:
+        with _snapshots_lock:
+            snapshots = _snapshots.get(index)
+            if snapshots is None:
+                snapshots = NowSnapshots(index)
+                _snapshots[index] = snapshots
+    return snapshots
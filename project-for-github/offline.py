@@ -0,0 +1,53 @@
+# Офлайн-режим: манифест предзагрузки и service worker
+# В новогоднюю ночь мобильная сеть перегружена, поэтому страница, открытая
+# один раз, дальше работает из кэша браузера. Service worker
+# (static/js/sw.js, отдается как <base>/sw.js, чтобы его scope покрывал
+# страницы плана) кэширует все записи манифеста <base>/offline-manifest.json:
+# страницы, собранную статику и полный список писем, у каждой - хэш
+# содержимого. Версия манифеста - хэш всех записей; service worker скачивает
+# заново только записи, у которых хэш изменился
+
+import hashlib
+import json
+import os
+
+from assets import STATIC_DIR, minify_js
+from response_cache import conditional_response
+
+SERVICE_WORKER_SOURCE = os.path.join(STATIC_DIR, "js", "sw.js")
+# Манифест и service worker браузер перепроверяет при каждом запросе (ETag)
+OFFLINE_CACHE_CONTROL = "no-cache"
+
+_service_worker = None  # (тело, ETag)
+
+
+def build_precache_manifest(schedule_version, entries):
+    """Манифест предзагрузки из пар (адрес, хэш содержимого)"""
+    entries = [{"url": url, "revision": revision} for url, revision in entries]
+    digest = hashlib.sha1(json.dumps(entries, sort_keys=True).encode("utf-8"))
+    return {"version": digest.hexdigest(), "schedule_version": schedule_version, "entries": entries}
+
+
+def _no_cache(response):
+    response.headers["Cache-Control"] = OFFLINE_CACHE_CONTROL
+    return response
+
+
+def manifest_response(body, etag):
+    """Ответ с манифестом предзагрузки"""
+    return _no_cache(conditional_response(body, etag, "application/json"))
+
+
+def _load_service_worker():
+    global _service_worker
+    if _service_worker is None:
+        with open(SERVICE_WORKER_SOURCE, encoding="utf-8") as f:
+            body = minify_js(f.read()).encode("utf-8")
+        _service_worker = (body, hashlib.sha1(body).hexdigest())
+    return _service_worker
+
+
+def service_worker_response():
+    """Скрипт service worker; обновляется браузером при изменении байтов"""
+    body, etag = _load_service_worker()
+    return _no_cache(conditional_response(body, etag, "text/javascript"))
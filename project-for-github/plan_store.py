@@ -0,0 +1,192 @@
+# Хранилище планов: несколько расписаний в одном процессе
+# Каждый план - JSON-файл в PLANS_DIR того же вида, что и schedule
+# ({"cover": {...}, "variants": [...]}). Скомпилированные планы (индекс,
+# разобранные времена, готовые ответы) лежат в LRU-кэше, ограниченном
+# по памяти; холодный план компилируется при первом обращении, а
+# одновременные первые запросы к одному плану ждут одну компиляцию и
+# получают ее результат. Не чаще раза в PLAN_CHECK_SECONDS обращение к плану
+# сверяет mtime и размер файла: измененный план компилируется заново.
+# Сломанный файл плана (не JSON, неверная структура) дает 404; ошибка пишется
+# в лог один раз, и файл не перечитывается, пока он не изменится
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from itinerary import itinerary_planner_size
+from now_snapshots import now_snapshots_size
+from response_cache import ResponseCache
+from schedule_data import ScheduleChangeLog, ScheduleIndex, log_compile_report
+from schedule_source import validate_schedule
+from search import search_index_size
+
+PLANS_DIR = os.environ.get(
+    "PLANS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "plans")
+)
+# Бюджет памяти на скомпилированные планы, байт
+PLAN_CACHE_MAX_BYTES = int(os.environ.get("PLAN_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Во сколько раз скомпилированный план больше своего JSON-файла (грубая оценка
+# для dict-ов вариантов, datetime и индекса)
+COMPILED_SIZE_FACTOR = 6
+# Как часто сверять файл скомпилированного плана с диском, секунд
+PLAN_CHECK_SECONDS = float(os.environ.get("PLAN_CHECK_SECONDS", "2"))
+
+# Только безопасные идентификаторы, чтобы plan_id не мог выйти из PLANS_DIR
+PLAN_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledPlan:
+    """Скомпилированный план: исходное расписание, индекс, кэш ответов и журнал изменений"""
+
+    def __init__(self, plan_id, schedule, source_size, stamp=None):
+        self.plan_id = plan_id
+        self.schedule = schedule
+        # (mtime, размер) файла, из которого скомпилирован план, и когда его сверяли
+        self.stamp = stamp
+        self.checked_at = time.monotonic()
+        self.index = ScheduleIndex(schedule["variants"])
+        log_compile_report(self.index.report, f"плана {plan_id}")
+        self.responses = ResponseCache()
+        # План не перезагружается на лету, журнал нужен для общего /api/letters/changes
+        self.change_log = ScheduleChangeLog()
+        self._base_size = source_size * COMPILED_SIZE_FACTOR
+
+    @property
+    def size_bytes(self):
+        """Оценка занимаемой памяти вместе с готовыми ответами и кэшами по индексу
+        (ответы /api/now, индекс поиска, планировщик маршрутов)"""
+        return (self._base_size + self.responses.size_bytes + now_snapshots_size(self.index)
+                + search_index_size(self.index) + itinerary_planner_size(self.index))
+
+
+class _Compilation:
+    """Идущая компиляция плана: ожидающие запросы получают ее результат"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.plan = None
+
+
+class PlanStore:
+    """LRU-кэш скомпилированных планов с вытеснением по памяти"""
+
+    def __init__(self, plans_dir=PLANS_DIR, max_bytes=PLAN_CACHE_MAX_BYTES, check_seconds=PLAN_CHECK_SECONDS):
+        self.plans_dir = plans_dir
+        self.max_bytes = max_bytes
+        self.check_seconds = check_seconds
+        self._plans = OrderedDict()
+        # Учтенный в бюджете размер каждого плана: кэш ответов плана растет
+        # уже после компиляции, прирост учитывается при следующих обращениях
+        self._sizes = {}
+        self._total_bytes = 0
+        self._compiling = {}  # plan_id -> _Compilation
+        self._broken = {}  # plan_id -> (mtime, размер) файла, который не скомпилировался
+        self._lock = threading.Lock()
+
+    def plan_path(self, plan_id):
+        return os.path.join(self.plans_dir, f"{plan_id}.json")
+
+    def get(self, plan_id):
+        """Получить скомпилированный план или None, если такого плана нет"""
+        if not PLAN_ID_RE.fullmatch(plan_id):
+            return None
+
+        with self._lock:
+            plan = self._plans.get(plan_id)
+            if plan is not None and self._changed(plan):
+                # Файл плана изменился или удален - компилируем заново
+                self._plans.pop(plan_id)
+                self._total_bytes -= self._sizes.pop(plan_id)
+                plan = None
+            if plan is not None:
+                self._plans.move_to_end(plan_id)
+                if plan.size_bytes != self._sizes[plan_id]:
+                    self._account(plan_id, plan)
+                    self._evict()
+                return plan
+            pending = self._compiling.get(plan_id)
+            compiling = pending is None
+            if compiling:
+                # Этот запрос компилирует план, остальные ждут его результат:
+                # план мог быть уже вытеснен, пока они просыпались
+                pending = self._compiling[plan_id] = _Compilation()
+
+        if not compiling:
+            pending.done.wait()
+            return pending.plan
+
+        try:
+            plan = pending.plan = self._compile(plan_id)
+            with self._lock:
+                if plan is not None:
+                    self._plans[plan_id] = plan
+                    self._account(plan_id, plan)
+                    self._evict()
+        finally:
+            with self._lock:
+                del self._compiling[plan_id]
+            pending.done.set()
+        return plan
+
+    def _changed(self, plan):
+        """Изменился ли файл плана с компиляции (сверяется не чаще раза в check_seconds)"""
+        now = time.monotonic()
+        if now - plan.checked_at < self.check_seconds:
+            return False
+        plan.checked_at = now
+        try:
+            stat = os.stat(self.plan_path(plan.plan_id))
+        except OSError:
+            return True
+        return (stat.st_mtime_ns, stat.st_size) != plan.stamp
+
+    def _compile(self, plan_id):
+        """Читает JSON плана с диска и строит индекс; None - нет файла или он сломан"""
+        path = self.plan_path(plan_id)
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                if self._broken.get(plan_id) == stamp:
+                    return None
+                raw = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            schedule = json.loads(raw.decode("utf-8"))
+            validate_schedule(schedule)
+            plan = CompiledPlan(plan_id, schedule, len(raw), stamp)
+        except (ValueError, KeyError, TypeError, UnicodeDecodeError) as error:
+            logger.error("План %s не загружен (%s): %s", plan_id, path, error)
+            self._broken[plan_id] = stamp
+            return None
+        self._broken.pop(plan_id, None)
+        return plan
+
+    def _account(self, plan_id, plan):
+        size = plan.size_bytes
+        self._total_bytes += size - self._sizes.get(plan_id, 0)
+        self._sizes[plan_id] = size
+
+    def _evict(self):
+        """Вытесняет давно не использованные планы, пока не уложимся в бюджет"""
+        # Последний использованный план не вытесняем, даже если он один больше бюджета
+        while self._total_bytes > self.max_bytes and len(self._plans) > 1:
+            evicted_id, _ = self._plans.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(evicted_id)
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+            self._sizes.clear()
+            self._total_bytes = 0
+            self._broken.clear()
+
+
+plan_store = PlanStore()
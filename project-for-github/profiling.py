@@ -0,0 +1,188 @@
+# Профилирование запросов по выбору и журнал медленных запросов
+# Включается переменными окружения; без них init_app ничего не подключает,
+# и выключенное профилирование стоит одну проверку флага при старте.
+#
+# PROFILE_SAMPLE_RATE=0.01 - доля запросов, которые выполняются под cProfile.
+# Статистика копится по маршрутам и после каждого такого запроса
+# записывается в PROFILE_DIR/<маршрут>-<pid>.pstats; файлы всех воркеров
+# одного маршрута можно смотреть вместе:
+#   python -c "import glob, pstats; pstats.Stats(*glob.glob('profiles/api_letters-*.pstats')).sort_stats('cumtime').print_stats(20)"
+#
+# SLOW_REQUEST_MS=500 - запросы дольше порога попадают в журнал (лог
+# приложения и PROFILE_DIR/slow-requests-<pid>.jsonl) с маршрутом,
+# параметрами и самыми горячими функциями. Для запросов под cProfile
+# функции берутся из его статистики, для остальных - из выборки стеков:
+# фоновый поток раз в STACK_SAMPLE_INTERVAL_SECONDS смотрит, какая функция
+# выполняется в потоке запроса (потоки gthread; под gevent выборка стеков
+# не видит гринлеты, и горячие функции есть только у запросов под cProfile)
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILING_ENABLED = PROFILE_SAMPLE_RATE > 0 or SLOW_REQUEST_MS > 0
+
+STACK_SAMPLE_INTERVAL_SECONDS = 0.005
+# Сколько горячих функций писать в журнал медленных запросов
+TOP_FUNCTIONS = 10
+
+logger = logging.getLogger(__name__)
+
+
+def _function_label(filename, lineno, name):
+    """Функция в том же виде, что и в выводе pstats: файл:строка(имя)"""
+    return f"{os.path.basename(filename)}:{lineno}({name})"
+
+
+def _route_slug(route):
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+class StackSampler:
+    """Выборка стеков потоков, в которых сейчас выполняются запросы"""
+
+    def __init__(self, interval=STACK_SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.active = {}  # id потока -> Counter функций
+        self._thread_pid = None
+
+    def _ensure_thread(self):
+        """Фоновый поток выборки; запускается в каждом воркере после fork"""
+        pid = os.getpid()
+        if self._thread_pid != pid:
+            self._thread_pid = pid
+            self.active.clear()
+            threading.Thread(target=self._sample_loop, name="profiling-stacks", daemon=True).start()
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in list(self.active.items()):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    code = frame.f_code
+                    samples[_function_label(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+
+    def start(self, thread_id):
+        self._ensure_thread()
+        self.active[thread_id] = Counter()
+
+    def stop(self, thread_id):
+        """Собранные выборки потока: функция -> число попаданий"""
+        return self.active.pop(thread_id, None) or Counter()
+
+
+sampler = StackSampler()
+_route_stats = {}  # маршрут -> накопленная pstats.Stats
+_stats_lock = threading.Lock()
+
+
+def _dump_route_profile(route, profiler):
+    """Добавляет профиль запроса к статистике маршрута и перезаписывает ее файл"""
+    path = os.path.join(PROFILE_DIR, f"{_route_slug(route)}-{os.getpid()}.pstats")
+    with _stats_lock:
+        stats = _route_stats.get(route)
+        if stats is None:
+            stats = pstats.Stats(profiler)
+            _route_stats[route] = stats
+        else:
+            stats.add(profiler)
+        stats.dump_stats(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+
+def _profile_hot_functions(profiler):
+    """Самые долгие функции профиля cProfile (собственное время, мс)"""
+    stats = pstats.Stats(profiler).stats
+    top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+    return [
+        {"function": _function_label(*key), "calls": nc, "self_ms": round(tt * 1000, 3),
+         "cumulative_ms": round(ct * 1000, 3)}
+        for key, (cc, nc, tt, ct, callers) in top
+    ]
+
+
+def _sampled_hot_functions(samples):
+    """Функции, чаще всего попадавшие в выборку стеков (примерное время, мс)"""
+    interval_ms = STACK_SAMPLE_INTERVAL_SECONDS * 1000
+    return [
+        {"function": label, "samples": count, "approx_ms": round(count * interval_ms, 1)}
+        for label, count in samples.most_common(TOP_FUNCTIONS)
+    ]
+
+
+def _log_slow_request(route, duration_ms, hot_functions, source):
+    entry = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "route": route,
+        "method": request.method,
+        "path": request.path,
+        "view_args": request.view_args or {},
+        "args": request.args.to_dict(flat=False),
+        "duration_ms": round(duration_ms, 3),
+        "hot_functions_source": source,
+        "hot_functions": hot_functions,
+    }
+    line = json.dumps(entry, ensure_ascii=False)
+    logger.warning("Медленный запрос: %s", line)
+    with open(os.path.join(PROFILE_DIR, f"slow-requests-{os.getpid()}.jsonl"), "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def _before_request():
+    g.profiling_started = time.perf_counter()
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Другой профилировщик уже активен (Python 3.12+) - этот запрос без профиля
+            profiler = None
+        g.profiler = profiler
+    if g.get("profiler") is None and SLOW_REQUEST_MS > 0:
+        sampler.start(threading.get_ident())
+
+
+def _teardown_request(exc):
+    started = g.pop("profiling_started", None)
+    if started is None:
+        return
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+    duration_ms = (time.perf_counter() - started) * 1000
+    samples = sampler.stop(threading.get_ident()) if SLOW_REQUEST_MS > 0 else None
+
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    if profiler is not None:
+        _dump_route_profile(route, profiler)
+    if SLOW_REQUEST_MS > 0 and duration_ms >= SLOW_REQUEST_MS:
+        if profiler is not None:
+            _log_slow_request(route, duration_ms, _profile_hot_functions(profiler), "cprofile")
+        else:
+            _log_slow_request(route, duration_ms, _sampled_hot_functions(samples), "stack_samples")
+
+
+def init_app(app):
+    """Подключает профилирование к приложению, если оно включено"""
+    if not PROFILING_ENABLED:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,131 @@
+# Кэш готовых JSON-ответов для API писем
+# Тела ответов сериализуются один раз на версию расписания и отдаются
+# с сильным ETag; повторный запрос с If-None-Match получает 304 без тела
+
+import hashlib
+from collections import OrderedDict
+
+from flask import current_app, request
+
+from schedule_data import get_schedule_version
+
+CACHE_CONTROL = "public, max-age=60"
+# Сколько версий расписания держать одновременно: при горячей замене запросы,
+# начатые на старой версии, дорабатывают, не сбрасывая кэш новой
+MAX_CACHED_VERSIONS = 2
+
+
+def _serialize(payload):
+    """Сериализует данные так же, как jsonify (компактно, с переводом строки)"""
+    body = current_app.json.dumps(payload, separators=(",", ":")) + "\n"
+    return body.encode("utf-8")
+
+
+class ResponseCache:
+    """Готовые тела ответов по версиям расписания: key -> (тело в байтах, ETag)"""
+
+    def __init__(self):
+        self._versions = OrderedDict()  # версия -> {key: (тело, ETag)}
+        # (версия, key) -> номер ревизии, с которым построено тело; только для
+        # ответов, в которых кроме содержимого есть номер ревизии расписания
+        self._revisions = {}
+        self.version = None  # Последняя запрошенная версия
+        self.size_bytes = 0
+
+    def get(self, key, build_payload, version, revision=None):
+        """Получить (тело, ETag) JSON-ответа, при промахе построить через build_payload"""
+        return self.get_body(key, lambda: _serialize(build_payload()), version, revision)
+
+    def get_body(self, key, build_body, version, revision=None):
+        """Получить (тело, ETag) любого ответа; build_body возвращает байты
+
+        revision - номер ревизии расписания, если он есть в теле: версия
+        (хэш содержимого) после перезагрузки может вернуться прежней, а
+        ревизия уже другая, и такое тело строится заново.
+        """
+        bodies = self._versions.get(version)
+        if bodies is None:
+            # Новая версия расписания; самые старые версии больше не нужны
+            bodies = {}
+            self._versions[version] = bodies
+            while len(self._versions) > MAX_CACHED_VERSIONS:
+                dropped_version, dropped = self._versions.popitem(last=False)
+                self.size_bytes -= sum(len(body) for body, _ in dropped.values())
+                for dropped_key in dropped:
+                    self._revisions.pop((dropped_version, dropped_key), None)
+        self.version = version
+
+        entry = bodies.get(key)
+        if entry is not None and revision is not None and self._revisions.get((version, key)) != revision:
+            self.size_bytes -= len(entry[0])
+            entry = None
+        if entry is None:
+            body = build_body()
+            etag = hashlib.sha1(body).hexdigest()
+            entry = (body, etag)
+            bodies[key] = entry
+            self.size_bytes += len(body)
+            if revision is not None:
+                self._revisions[(version, key)] = revision
+        return entry
+
+    def entries(self, version, keys):
+        """Готовые (тело, ETag) версии по ключам keys - для снимка расписания"""
+        bodies = self._versions.get(version, {})
+        return {key: bodies[key] for key in keys if key in bodies}
+
+    def preload(self, version, entries):
+        """Кладет в кэш версии готовые (тело, ETag), например из снимка расписания"""
+        for key, (body, etag) in entries.items():
+            self.get_body(key, lambda body=body: body, version)
+
+    def clear(self):
+        self._versions = OrderedDict()
+        self._revisions = {}
+        self.version = None
+        self.size_bytes = 0
+
+
+# Кэш ответов основного расписания из schedule_data
+default_cache = ResponseCache()
+
+
+def get_cached_body(key, build_payload, cache=None, version=None, revision=None):
+    """Получить (тело, ETag); по умолчанию - из кэша основного расписания"""
+    if cache is None:
+        cache = default_cache
+    if version is None:
+        version = get_schedule_version()
+    return cache.get(key, build_payload, version, revision)
+
+
+def conditional_response(body, etag, mimetype):
+    """Ответ с ETag и Cache-Control; 304 без тела при совпадении If-None-Match"""
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
+
+
+def cached_json_response(key, build_payload, cache=None, version=None, revision=None):
+    """Ответ с закэшированным JSON, ETag и Cache-Control; 304 при совпадении ETag"""
+    body, etag = get_cached_body(key, build_payload, cache, version, revision)
+    return conditional_response(body, etag, "application/json")
+
+
+def get_cached_html(key, render_page, cache=None, version=None, revision=None):
+    """Получить (тело, ETag) HTML-страницы; render_page возвращает строку"""
+    if cache is None:
+        cache = default_cache
+    if version is None:
+        version = get_schedule_version()
+    return cache.get_body(key, lambda: render_page().encode("utf-8"), version, revision)
+
+
+def cached_html_response(key, render_page, cache=None, version=None, revision=None):
+    """Ответ с закэшированной HTML-страницей; render_page возвращает строку"""
+    body, etag = get_cached_html(key, render_page, cache, version, revision)
+    return conditional_response(body, etag, "text/html")
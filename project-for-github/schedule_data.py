@@ -2,7 +2,18 @@
 # Каждый вариант имеет свое время начала и окончания с учетом дат
 # События до 00:00 - 31 декабря, после 00:00 - 1 января
 
+import hashlib
+import json
+import logging
+import re
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
 from datetime import datetime, timedelta
+from functools import lru_cache
+
+import schedule_snapshot
+from columnar import OPEN_END, ColumnarSchedule, to_minutes
 
 def parse_datetime(date_str, time_str):
     """Парсит дату и время и возвращает datetime объект"""
@@ -34,26 +45,37 @@ def format_time(minutes):
     mins = minutes % 60
     return f"{hours:02d}:{mins:02d}"
 
+HOURS_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+MINUTES_NUMBER_RE = re.compile(r'\d+')
+
+@lru_cache(maxsize=1024)
+def parse_duration(duration_str):
+    """Продолжительность в минутах или None, если строку не удалось разобрать
+
+    Понимает "1.5 часа" (часы могут быть дробными), "1 час+" (окончание
+    открыто, считается за час) и "30 минут". Строк продолжительности в
+    расписании немного, поэтому разбор каждой кэшируется.
+    """
+    text = duration_str.lower()
+    if 'час' in text:
+        if '+' in text:
+            return 60
+        match = HOURS_NUMBER_RE.search(text)
+        return int(float(match.group()) * 60) if match else None
+    if 'минут' in text:
+        match = MINUTES_NUMBER_RE.search(text)
+        return int(match.group()) if match else None
+    return None
+
+def get_duration_minutes(duration_str):
+    """Получить продолжительность в минутах из строки (0, если не разобрать)"""
+    if not duration_str:
+        return 0
+    return parse_duration(duration_str) or 0
+
 def add_duration_to_datetime(start_dt, duration_str):
     """Добавляет продолжительность к datetime"""
-    # Парсим продолжительность
-    duration_minutes = 0
-    if 'час' in duration_str.lower():
-        if '+' in duration_str:
-            duration_minutes = 60
-        else:
-            import re
-            hours_match = re.search(r'(\d+(?:\.\d+)?)', duration_str)
-            if hours_match:
-                hours = float(hours_match.group(1))
-                duration_minutes = int(hours * 60)
-    elif 'минут' in duration_str.lower():
-        import re
-        mins_match = re.search(r'(\d+)', duration_str)
-        if mins_match:
-            duration_minutes = int(mins_match.group(1))
-    
-    return start_dt + timedelta(minutes=duration_minutes)
+    return start_dt + timedelta(minutes=get_duration_minutes(duration_str))
 
 schedule = {
     "cover": {
@@ -263,76 +285,402 @@ schedule = {
     ]
 }
 
+class ScheduleIndex:
+    """Неизменяемый индекс расписания, строится один раз при загрузке.
+
+    Варианты отсортированы по времени начала, для каждого заранее разобраны
+    datetime начала и окончания (у открытых вариантов окончание уже найдено)
+    и продолжительность в минутах, поэтому запросы отвечают через bisect за
+    O(log n + k) без парсинга строк. Для запросов по времени те же данные
+    лежат в колоночном виде в целых минутах (self.columns), см. columnar.py.
+    Заодно строится отчет компиляции (self.report): расхождения end_time с
+    duration и наложения внутри колонок a/b, см. build_compile_report.
+    """
+
+    def __init__(self, variants):
+        variants = list(variants)
+        # Версия расписания - хэш содержимого, меняется только вместе с данными
+        self.version = hashlib.sha1(
+            json.dumps(variants, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
+        # Номер версии: растет с каждой заменой расписания (см. load_schedule)
+        self.revision = 1
+        parsed_starts = [parse_datetime(v["date"], v["start_time"]) for v in variants]
+        # Стабильная сортировка: при равном начале сохраняется порядок из расписания
+        order = sorted(range(len(variants)), key=lambda i: parsed_starts[i])
+
+        self.source_variants = tuple(variants)  # Порядок как в расписании
+        self.variants = tuple(variants[i] for i in order)
+        self.positions = tuple(order)  # Позиция варианта в исходном списке
+        self.starts = tuple(parsed_starts[i] for i in order)
+        self.durations = tuple(get_duration_minutes(v.get("duration", "")) for v in self.variants)
+        self.ends = tuple(
+            self._resolve_end(variant, start_dt, duration)
+            for variant, start_dt, duration in zip(self.variants, self.starts, self.durations)
+        )
+
+        self._slot_by_object = {id(v): slot for slot, v in enumerate(self.variants)}
+        self._by_id = {}
+        for variant in variants:
+            self._by_id.setdefault(variant["id"], variant)
+
+        known_ends = [end_dt for end_dt in self.ends if end_dt is not None]
+        self.max_end = max(known_ends) if known_ends else None
+        # Все моменты, в которые меняется набор доступных вариантов
+        self.boundaries = tuple(sorted(set(self.starts) | set(known_ends)))
+
+        # Колонки в целых минутах: дерево отрезков для одиночных запросов
+        # и векторные запросы по многим моментам сразу
+        self.columns = ColumnarSchedule(
+            [to_minutes(start_dt) for start_dt in self.starts],
+            [to_minutes(end_dt) if end_dt is not None else OPEN_END for end_dt in self.ends],
+            [v["id"] for v in self.variants],
+            [v["title"] for v in self.variants],
+        )
+        self.report = build_compile_report(self)
+
+    def __getstate__(self):
+        # Ключи _slot_by_object - id() вариантов, после загрузки снимка они другие
+        state = self.__dict__.copy()
+        del state["_slot_by_object"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._slot_by_object = {id(v): slot for slot, v in enumerate(self.variants)}
+
+    def _resolve_end(self, variant, start_dt, duration_minutes=None):
+        """Вычисляет окончание варианта при построении индекса"""
+        if variant.get("end_date"):
+            return parse_datetime(variant["end_date"], variant["end_time"])
+        elif variant["end_time"] != "-" and variant["end_time"]:
+            if duration_minutes is None:
+                duration_minutes = get_duration_minutes(variant["duration"])
+            return start_dt + timedelta(minutes=duration_minutes)
+        # Нет времени окончания - заканчивается с началом следующего варианта
+        return self.next_start_after(start_dt)
+
+    def next_start_after(self, target_dt):
+        """Время начала первого варианта, начинающегося строго после target_dt"""
+        slot = bisect_right(self.starts, target_dt)
+        if slot < len(self.starts):
+            return self.starts[slot]
+        return None
+
+    def next_boundary_after(self, target_dt):
+        """Ближайшая граница (начало или окончание варианта) строго после target_dt"""
+        position = bisect_right(self.boundaries, target_dt)
+        if position < len(self.boundaries):
+            return self.boundaries[position]
+        return None
+
+    def slot_of(self, variant):
+        """Позиция варианта в индексе или None, если вариант не из этого расписания"""
+        slot = self._slot_by_object.get(id(variant))
+        if slot is not None and self.variants[slot] is variant:
+            return slot
+        return None
+
+    def get_by_id(self, variant_id):
+        return self._by_id.get(variant_id)
+
+    def start_of(self, variant):
+        slot = self.slot_of(variant)
+        if slot is None:
+            return parse_datetime(variant["date"], variant["start_time"])
+        return self.starts[slot]
+
+    def end_of(self, variant):
+        slot = self.slot_of(variant)
+        if slot is not None:
+            return self.ends[slot]
+        if variant.get("end_date") or (variant["end_time"] != "-" and variant["end_time"]):
+            return self._resolve_end(variant, parse_datetime(variant["date"], variant["start_time"]))
+        return self.next_start_after(parse_datetime(variant["date"], variant["start_time"]))
+
+    def duration_of(self, variant):
+        """Продолжительность варианта в минутах (0, если не указана)"""
+        slot = self.slot_of(variant)
+        if slot is None:
+            return get_duration_minutes(variant.get("duration", ""))
+        return self.durations[slot]
+
+    def _in_schedule_order(self, slots):
+        """Возвращает варианты в порядке исходного расписания"""
+        slots.sort(key=lambda slot: self.positions[slot])
+        return [self.variants[slot] for slot in slots]
+
+    def starting_at(self, target_dt, date_str, time_str):
+        """Варианты, которые начинаются ровно в указанную дату и время"""
+        lo = bisect_left(self.starts, target_dt)
+        hi = bisect_right(self.starts, target_dt, lo)
+        slots = [
+            slot for slot in range(lo, hi)
+            if self.variants[slot]["date"] == date_str and self.variants[slot]["start_time"] == time_str
+        ]
+        return self._in_schedule_order(slots)
+
+    def available_at(self, target_dt):
+        """Варианты, для которых start <= target_dt < end (открытые - только по началу)"""
+        # Границы вариантов - целые минуты, поэтому секунды момента можно отбросить
+        return self._in_schedule_order(self.columns.active_slots(to_minutes(target_dt)))
+
+    def available_at_many(self, target_dts):
+        """available_at для нескольких моментов сразу (векторно, если есть NumPy)"""
+        slots_by_moment = self.columns.active_slots_many([to_minutes(dt) for dt in target_dts])
+        return [self._in_schedule_order(slots) for slots in slots_by_moment]
+
+    def overlapping_slots(self, from_dt, to_dt, start_slot=0, max_count=None):
+        """Позиции (в порядке начала) вариантов, пересекающих окно [from_dt, to_dt)
+
+        None вместо границы - окно не ограничено с этой стороны.
+        """
+        lo = to_minutes(from_dt) if from_dt is not None else -OPEN_END
+        hi = to_minutes(to_dt) if to_dt is not None else OPEN_END
+        return self.columns.overlapping_slots(lo, hi, start_slot, max_count)
+
+    def starting_after(self, target_dt):
+        """Варианты, которые начинаются после target_dt, отсортированные по началу"""
+        return list(self.variants[bisect_right(self.starts, target_dt):])
+
+
+# Сколько примеров каждой проблемы хранить в отчете компиляции
+REPORT_MAX_ITEMS = 50
+REPORT_ISSUE_KINDS = ("unparsed_duration", "invalid_end_time", "end_time_mismatch", "column_overlap")
+
+logger = logging.getLogger(__name__)
+
+def build_compile_report(index):
+    """Отчет компиляции расписания: что в данных противоречит само себе
+
+    - unparsed_duration: продолжительность не разобрана (считается за 0;
+      "-" - не указана, это не ошибка);
+    - invalid_end_time: end_time не в формате ЧЧ:ММ;
+    - end_time_mismatch: end_time не совпадает с началом плюс duration
+      (used - что из двух индекс взял за окончание);
+    - column_overlap: варианты одной колонки (a или b) накладываются
+      друг на друга - выбирать гостю полагается между колонками.
+
+    Для каждой проблемы - число случаев и первые REPORT_MAX_ITEMS примеров.
+    """
+    issues = {kind: {"count": 0, "items": []} for kind in REPORT_ISSUE_KINDS}
+
+    def note(kind, make_item):
+        issue = issues[kind]
+        issue["count"] += 1
+        if len(issue["items"]) < REPORT_MAX_ITEMS:
+            issue["items"].append(make_item())
+
+    # Самое позднее окончание в каждой колонке на текущий момент прохода:
+    # варианты идут по началу, поэтому наложение - это начало раньше него
+    column_sizes = {"a": 0, "b": 0}
+    latest = {}  # колонка -> (окончание в минутах, позиция)
+    columns = index.columns
+    for slot, (variant, start_dt, end_dt) in enumerate(zip(index.variants, index.starts, index.ends)):
+        variant_id = variant["id"]
+        duration_str = variant.get("duration") or ""
+        duration = parse_duration(duration_str)
+        if duration_str not in ("", "-") and duration is None:
+            note("unparsed_duration", lambda: {"id": variant_id, "duration": duration_str})
+
+        end_time = variant.get("end_time") or ""
+        if end_time != "-" and end_time:
+            try:
+                end_minutes = parse_time(end_time)
+            except (ValueError, IndexError):
+                note("invalid_end_time", lambda: {"id": variant_id, "end_time": end_time})
+                end_minutes = None
+            # "1 час+" - окончание открыто, сверять не с чем
+            if end_minutes is not None and duration is not None and '+' not in duration_str:
+                expected_end = start_dt + timedelta(minutes=duration)
+                if variant.get("end_date"):
+                    consistent = end_dt == expected_end
+                else:
+                    consistent = end_minutes == expected_end.hour * 60 + expected_end.minute
+                if not consistent:
+                    note("end_time_mismatch", lambda: {
+                        "id": variant_id,
+                        "start": format_datetime(start_dt),
+                        "duration": duration_str,
+                        "end_time": end_time,
+                        "expected_end_time": expected_end.strftime("%H:%M"),
+                        "used": "end_date" if variant.get("end_date") else "duration",
+                    })
+
+        column = variant_id[-1:]
+        if column not in column_sizes or variant.get("special", False) or end_dt is None:
+            continue
+        column_sizes[column] += 1
+        start, end = columns.starts[slot], columns.ends[slot]
+        previous = latest.get(column)
+        if previous is not None and start < previous[0]:
+            note("column_overlap", lambda: {
+                "column": column,
+                "ids": [index.variants[previous[1]]["id"], variant_id],
+                "start": format_datetime(start_dt),
+                "overlap_minutes": min(end, previous[0]) - start,
+            })
+        if previous is None or end > previous[0]:
+            latest[column] = (end, slot)
+
+    return {
+        "version": index.version,
+        "variants": len(index.variants),
+        "columns": column_sizes,
+        "ok": not any(issue["count"] for issue in issues.values()),
+        "issues": issues,
+    }
+
+def log_compile_report(report, source):
+    """Пишет в лог сводку отчета компиляции (по строке на вид проблемы)"""
+    for kind, issue in report["issues"].items():
+        if issue["count"]:
+            logger.warning(
+                "Расписание %s: %s - %d, например: %s", source, kind, issue["count"],
+                json.dumps(issue["items"][:3], ensure_ascii=False),
+            )
+
+# Сколько замен расписания помнит журнал изменений
+CHANGE_LOG_MAX_ENTRIES = 50
+
+class ScheduleChangeLog:
+    """Ограниченный журнал изменений: какие варианты добавлены, удалены и изменены"""
+
+    def __init__(self, max_entries=CHANGE_LOG_MAX_ENTRIES):
+        # (прежний номер, новый номер, добавленные id, удаленные id, измененные id)
+        self.entries = deque(maxlen=max_entries)
+
+    def record(self, old_index, new_index):
+        old_by_id = old_index._by_id
+        new_by_id = new_index._by_id
+        added = {variant_id for variant_id in new_by_id if variant_id not in old_by_id}
+        removed = {variant_id for variant_id in old_by_id if variant_id not in new_by_id}
+        modified = {
+            variant_id for variant_id, variant in new_by_id.items()
+            if variant_id in old_by_id and old_by_id[variant_id] != variant
+        }
+        self.entries.append((old_index.revision, new_index.revision, added, removed, modified))
+
+    def changes_since(self, since, revision):
+        """Суммарные изменения после версии since или None, если журнал ее уже не покрывает"""
+        if since == revision:
+            return {"added": [], "removed": [], "modified": []}
+        # Номера версий идут не подряд (например, время изменения файла),
+        # поэтому покрытие проверяем по прежнему номеру самой старой записи
+        if since > revision or not self.entries or self.entries[0][0] > since:
+            return None
+        # Накладываем изменения по порядку: добавленный и затем удаленный
+        # вариант исчезает из ответа, удаленный и снова добавленный - изменен
+        added, removed, modified = set(), set(), set()
+        for _, entry_revision, entry_added, entry_removed, entry_modified in self.entries:
+            # Записи новее revision относятся к уже следующей замене расписания
+            if entry_revision <= since or entry_revision > revision:
+                continue
+            for variant_id in entry_added:
+                if variant_id in removed:
+                    removed.discard(variant_id)
+                    modified.add(variant_id)
+                else:
+                    added.add(variant_id)
+            for variant_id in entry_removed:
+                if variant_id in added:
+                    added.discard(variant_id)
+                else:
+                    modified.discard(variant_id)
+                    removed.add(variant_id)
+            modified.update(variant_id for variant_id in entry_modified if variant_id not in added)
+        return {"added": sorted(added), "removed": sorted(removed), "modified": sorted(modified)}
+
+
+def _compile_builtin_schedule():
+    """Индекс встроенного расписания: из снимка, если он есть, иначе компиляцией"""
+    with open(__file__, "rb") as f:
+        key = schedule_snapshot.source_key(f.read())
+    snapshot = schedule_snapshot.load(key)
+    if snapshot is not None:
+        compiled_schedule, index = snapshot
+    else:
+        started = time.perf_counter()
+        compiled_schedule, index = schedule, ScheduleIndex(schedule["variants"])
+        schedule_snapshot.remember_source(index, key, schedule)
+        schedule_snapshot.report_schedule("компиляция", time.perf_counter() - started)
+    log_compile_report(index.report, "schedule_data.py")
+    return compiled_schedule, index
+
+
+# Индекс строится (или читается из снимка) один раз при загрузке модуля
+schedule, _schedule_index = _compile_builtin_schedule()
+_change_log = ScheduleChangeLog()
+
+def load_schedule(new_schedule, index=None, revision=None):
+    """Заменить текущее расписание и перестроить индекс
+
+    Готовый index можно построить заранее (вне обработки запросов); замена -
+    одно присваивание, поэтому запросы видят либо старый, либо новый индекс.
+    revision - номер новой версии (например, время изменения файла); он
+    всегда больше предыдущего.
+    """
+    global schedule, _schedule_index
+    if index is None:
+        index = ScheduleIndex(new_schedule["variants"])
+    previous = _schedule_index
+    index.revision = next_revision(revision)
+    _change_log.record(previous, index)
+    schedule = new_schedule
+    _schedule_index = index
+
+def next_revision(revision=None):
+    """Номер версии, который получит следующее загруженное расписание"""
+    return max(_schedule_index.revision + 1, revision or 0)
+
+def get_schedule_index():
+    """Получить индекс текущего расписания"""
+    return _schedule_index
+
+def get_schedule_version():
+    """Получить версию текущего расписания (хэш содержимого)"""
+    return _schedule_index.version
+
+def get_change_log():
+    """Журнал изменений основного расписания"""
+    return _change_log
+
 def get_variant_by_id(variant_id):
     """Получить вариант по ID"""
-    for variant in schedule["variants"]:
-        if variant["id"] == variant_id:
-            return variant
-    return None
+    return _schedule_index.get_by_id(variant_id)
 
 def get_variant_datetime(variant):
     """Получить datetime начала варианта"""
-    return parse_datetime(variant["date"], variant["start_time"])
+    return _schedule_index.start_of(variant)
 
 def get_variant_end_datetime(variant):
     """Получить datetime окончания варианта"""
-    if variant.get("end_date"):
-        return parse_datetime(variant["end_date"], variant["end_time"])
-    elif variant["end_time"] != "-" and variant["end_time"]:
-        start_dt = get_variant_datetime(variant)
-        return add_duration_to_datetime(start_dt, variant["duration"])
-    else:
-        # Если нет времени окончания, ищем следующий вариант, который начинается после этого
-        start_dt = get_variant_datetime(variant)
-        next_variants = get_next_variants_after_datetime(variant["date"], variant["start_time"])
-        if next_variants:
-            # Берем время начала следующего варианта как время окончания текущего
-            next_variant = next_variants[0]
-            return get_variant_datetime(next_variant)
-        return None
+    # Если нет времени окончания, окончанием считается начало следующего варианта
+    return _schedule_index.end_of(variant)
 
 def get_variants_by_datetime(date_str, time_str):
     """Получить все варианты, которые начинаются в указанную дату и время"""
-    return [v for v in schedule["variants"] if v["date"] == date_str and v["start_time"] == time_str]
+    return _schedule_index.starting_at(parse_datetime(date_str, time_str), date_str, time_str)
 
 def get_variants_available_at_datetime(date_str, time_str):
     """Получить все варианты, доступные в указанную дату и время"""
-    target_dt = parse_datetime(date_str, time_str)
-    available = []
-    
-    for variant in schedule["variants"]:
-        start_dt = get_variant_datetime(variant)
-        end_dt = get_variant_end_datetime(variant)
-        
-        if end_dt is None:
-            # Если нет времени окончания, проверяем только начало
-            if start_dt <= target_dt:
-                available.append(variant)
-        else:
-            # Проверяем, попадает ли время в интервал (время окончания исключительно)
-            # start_dt <= target_dt < end_dt (не включая end_dt)
-            if start_dt <= target_dt < end_dt:
-                available.append(variant)
-    
-    return available
+    # Время окончания исключительно: start_dt <= target_dt < end_dt
+    return _schedule_index.available_at(parse_datetime(date_str, time_str))
+
+def get_variants_available_at_datetimes(date_time_pairs):
+    """Варианты, доступные в каждый из моментов [(date_str, time_str), ...]"""
+    return _schedule_index.available_at_many(
+        [parse_datetime(date_str, time_str) for date_str, time_str in date_time_pairs]
+    )
 
 def get_next_variants_after_datetime(date_str, time_str):
     """Получить варианты, которые начинаются после указанной даты и времени"""
-    target_dt = parse_datetime(date_str, time_str)
-    next_variants = []
-    
-    for variant in schedule["variants"]:
-        start_dt = get_variant_datetime(variant)
-        if start_dt > target_dt:
-            next_variants.append(variant)
-    
-    # Сортируем по datetime
-    next_variants.sort(key=lambda v: get_variant_datetime(v))
-    return next_variants
+    return _schedule_index.starting_after(parse_datetime(date_str, time_str))
 
-def get_current_date_time():
+def get_current_date_time(now=None):
     """Получить текущую дату и время в формате приложения"""
-    now = datetime.now()
+    if now is None:
+        now = datetime.now()
     # Определяем, какая дата должна быть использована
     # Если сейчас 31 декабря или 1 января в новогодний период
     if now.month == 12 and now.day == 31:
@@ -346,32 +694,21 @@ def get_current_date_time():
         else:
             return "01.01", now.strftime("%H:%M")
 
-def get_duration_minutes(duration_str):
-    """Получить продолжительность в минутах из строки"""
-    if not duration_str:
-        return 0
-    duration_minutes = 0
-    if 'час' in duration_str.lower():
-        if '+' in duration_str:
-            duration_minutes = 60
-        else:
-            import re
-            hours_match = re.search(r'(\d+(?:\.\d+)?)', duration_str)
-            if hours_match:
-                hours = float(hours_match.group(1))
-                duration_minutes = int(hours * 60)
-    elif 'минут' in duration_str.lower():
-        import re
-        mins_match = re.search(r'(\d+)', duration_str)
-        if mins_match:
-            duration_minutes = int(mins_match.group(1))
-    return duration_minutes
+def get_current_schedule_datetime(now=None):
+    """Получить текущий момент в координатах расписания (с секундами)"""
+    if now is None:
+        now = datetime.now()
+    date_str, time_str = get_current_date_time(now)
+    return parse_datetime(date_str, time_str).replace(second=now.second, microsecond=now.microsecond)
 
 def get_toc():
     """Получить оглавление - список всех уникальных дат и времен начала"""
     times_dict = {}
     
-    for variant in schedule["variants"]:
+    # Индекс уже отсортирован по дате и времени с учетом года
+    # (31.12 идет перед 01.01, так как это 31.12.2024, а 01.01.2025),
+    # поэтому группы добавляются в словарь в нужном порядке
+    for variant in _schedule_index.variants:
         key = f"{variant['date']} {variant['start_time']}"
         if key not in times_dict:
             times_dict[key] = {
@@ -384,57 +721,74 @@ def get_toc():
             "title": variant["title"]
         })
     
-    # Сортируем по дате и времени с учетом года
-    # 31.12 идет перед 01.01, так как это 31.12.2024, а 01.01.2025
-    def sort_key(x):
-        date_str = x["date"]
-        time_str = x["time"]
-        # Парсим дату для правильной сортировки
-        day, month = date_str.split('.')
-        hour, minute = time_str.split(':')
-        # Определяем год: 12 = 2024, 01 = 2025
-        if month == "12":
-            year = 2024
-        else:
-            year = 2025
-        # Возвращаем кортеж для сортировки: (год, месяц, день, час, минута)
-        return (year, int(month), int(day), int(hour), int(minute))
-    
-    toc = sorted(times_dict.values(), key=sort_key)
-    return toc
+    return list(times_dict.values())
 
 def intervals_overlap(start1, end1, start2, end2):
     """Проверяет, накладываются ли два временных интервала (хотя бы на миг)"""
     # Интервалы накладываются, если start1 < end2 и start2 < end1
     return start1 < end2 and start2 < end1
 
+def find_overlapping_intervals(intervals_a, intervals_b):
+    """Индексы интервалов из intervals_a, которые накладываются хотя бы на один из intervals_b
+
+    Проход заметающей прямой за O((n + m) log(n + m)) вместо попарной проверки.
+    Интервалы полуоткрытые [start, end), как в intervals_overlap.
+    """
+    # Порядок событий в один момент: окончания, точечные интервалы, начала
+    END, POINT, START = 0, 1, 2
+    events = []
+    for column, intervals in ((0, intervals_a), (1, intervals_b)):
+        for i, (start, end) in enumerate(intervals):
+            if start < end:
+                events.append((start, START, column, i))
+                events.append((end, END, column, i))
+            elif start == end:
+                events.append((start, POINT, column, i))
+    events.sort()
+
+    active_b = 0
+    waiting_a = set()  # Активные интервалы a, еще не встретившие ни одного b
+    overlapping = set()
+    for _, kind, column, i in events:
+        if kind == END:
+            if column == 0:
+                waiting_a.discard(i)
+            else:
+                active_b -= 1
+        elif kind == POINT:
+            # Точка накладывается только на интервалы, начавшиеся раньше нее
+            if column == 0:
+                if active_b > 0:
+                    overlapping.add(i)
+            else:
+                overlapping.update(waiting_a)
+                waiting_a.clear()
+        elif column == 0:
+            if active_b > 0:
+                overlapping.add(i)
+            else:
+                waiting_a.add(i)
+        else:
+            active_b += 1
+            overlapping.update(waiting_a)
+            waiting_a.clear()
+    return overlapping
+
 def get_toc_columns():
     """Получить оглавление в виде двух колонок с правильными размерами элементов"""
     # Разделяем варианты на две колонки (a и b)
     column_a = []
     column_b = []
     
-    # Получаем все варианты и сортируем их
-    all_variants = sorted(schedule["variants"], key=lambda v: (
-        parse_datetime(v["date"], v["start_time"])
-    ))
-    
-    # Разделяем на колонки по ID (a или b в конце)
-    for variant in all_variants:
+    # Разделяем на колонки по ID (a или b в конце), варианты в индексе уже отсортированы
+    index = _schedule_index
+    for variant, start_dt, end_dt, duration in zip(index.variants, index.starts, index.ends, index.durations):
         variant_id = variant["id"]
-        start_dt = get_variant_datetime(variant)
-        end_dt = get_variant_end_datetime(variant)
         
         # Если нет времени окончания, используем максимальное время из всех вариантов
         if not end_dt:
-            # Ищем максимальное время окончания среди всех вариантов
-            max_end = None
-            for v in all_variants:
-                v_end = get_variant_end_datetime(v)
-                if v_end and (not max_end or v_end > max_end):
-                    max_end = v_end
-            if max_end:
-                end_dt = max_end
+            if index.max_end:
+                end_dt = index.max_end
             else:
                 continue  # Пропускаем только если вообще нет времени окончания
         
@@ -445,7 +799,7 @@ def get_toc_columns():
             "start_time": variant["start_time"],
             "start_datetime": start_dt,
             "end_datetime": end_dt,
-            "duration_minutes": get_duration_minutes(variant.get("duration", ""))
+            "duration_minutes": duration
         }
         
         # Добавляем только варианты с ID, заканчивающимися на 'a' или 'b'
@@ -458,17 +812,13 @@ def get_toc_columns():
     
     # Для каждого элемента колонки A проверяем, есть ли наложение с колонкой B
     # Если есть наложение, то колонка A должна быть узкой
-    for item_a in column_a:
-        has_overlap = False
-        for item_b in column_b:
-            if intervals_overlap(
-                item_a["start_datetime"], item_a["end_datetime"],
-                item_b["start_datetime"], item_b["end_datetime"]
-            ):
-                has_overlap = True
-                break
+    overlapping_a = find_overlapping_intervals(
+        [(item["start_datetime"], item["end_datetime"]) for item in column_a],
+        [(item["start_datetime"], item["end_datetime"]) for item in column_b]
+    )
+    for i, item_a in enumerate(column_a):
         # Добавляем флаг, указывающий, узкая ли колонка для этого элемента
-        item_a["is_narrow"] = has_overlap
+        item_a["is_narrow"] = i in overlapping_a
     
     # Колонка B всегда узкая
     for item_b in column_b:
@@ -0,0 +1,316 @@
+# Снимок скомпилированного расписания для быстрого старта воркеров
+# Компиляция большого расписания (разбор времени, окончания открытых
+# вариантов, колонки и деревья индекса, индекс поиска, готовые JSON-ответы)
+# занимает секунды - и повторялась бы при каждом старте. Вместо этого
+# результат один раз сохраняется в двоичный файл
+# SCHEDULE_SNAPSHOT_DIR/schedule-<ключ>.snap, а при следующем старте
+# читается оттуда (через mmap) без разбора исходника.
+#
+# Ключ - хэш байтов исходника расписания вместе с кодом, который его
+# компилирует (CODE_FILES), и версией формата: поменялись данные, код или
+# формат - ключ другой, снимок строится заново. Файл пишется атомарно;
+# битый или чужой файл просто игнорируется.
+#
+# Формат только для данных, без pickle: файл лежит в каталоге, куда пишет
+# приложение, и его содержимое не должно исполняться. Данные - JSON, в
+# котором байты и массивы array заменены ссылками на двоичный хвост файла,
+# а объекты восстанавливаются только из фиксированного списка классов
+# (SNAPSHOT_CLASSES) через их __setstate__.
+#
+# Снимок можно собрать заранее, на этапе сборки: python schedule_snapshot.py
+#
+# Здесь же таймер старта: в лог пишется, сколько прошло от загрузки
+# приложения (в воркере gunicorn - от fork) до готовности отвечать и откуда
+# взялось расписание
+
+import glob
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+import weakref
+from array import array
+from datetime import datetime
+
+SNAPSHOT_FORMAT_VERSION = 3
+SNAPSHOT_MAGIC = b"NYSNAP\x00\x00"
+# Заголовок: метка, версия формата, ключ (sha256), длина данных
+SNAPSHOT_HEADER = struct.Struct(">8sH32sQ")
+# Данные начинаются с длины JSON-части, за ней - двоичный хвост
+SNAPSHOT_JSON_LENGTH = struct.Struct(">Q")
+# Классы, объекты которых могут быть в снимке: (модуль, имя класса)
+SNAPSHOT_CLASSES = (
+    ("schedule_data", "ScheduleIndex"),
+    ("columnar", "ColumnarSchedule"),
+    ("search", "SearchIndex"),
+)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.environ.get("SCHEDULE_SNAPSHOT_DIR", os.path.join(PROJECT_DIR, ".snapshots"))
+SNAPSHOT_ENABLED = os.environ.get("SCHEDULE_SNAPSHOT", "1") not in ("", "0", "false")
+# Код, от которого зависит содержимое снимка
+CODE_FILES = (
+    "schedule_data.py", "columnar.py", "layout.py", "search.py", "app.py",
+    "schedule_snapshot.py",
+)
+
+logger = logging.getLogger(__name__)
+
+_code_fingerprint = None
+# Индекс -> (ключ, расписание) для сохранения и готовые данные из снимка
+_sources = weakref.WeakKeyDictionary()
+_extras = weakref.WeakKeyDictionary()
+
+# Таймер старта
+_startup = {"started": time.perf_counter(), "schedule": None, "schedule_seconds": 0.0}
+
+
+def _restart_timer():
+    _startup["started"] = time.perf_counter()
+
+
+os.register_at_fork(after_in_child=_restart_timer)
+
+
+def code_fingerprint():
+    """Хэш кода, который компилирует расписание"""
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        digest = hashlib.sha256()
+        for filename in CODE_FILES:
+            with open(os.path.join(PROJECT_DIR, filename), "rb") as f:
+                digest.update(filename.encode("utf-8"))
+                digest.update(f.read())
+        _code_fingerprint = digest.digest()
+    return _code_fingerprint
+
+
+def source_key(source_bytes):
+    """Ключ снимка для исходника расписания (байты файла или модуля)"""
+    digest = hashlib.sha256()
+    # Массивы лежат в файле в порядке байтов машины, где снимок собран
+    digest.update(f"{SNAPSHOT_FORMAT_VERSION}:{sys.byteorder}".encode("ascii"))
+    digest.update(code_fingerprint())
+    digest.update(source_bytes)
+    return digest.digest()
+
+
+def snapshot_path(key):
+    return os.path.join(SNAPSHOT_DIR, f"schedule-{key.hex()[:16]}.snap")
+
+
+def _snapshot_classes():
+    """Имя класса -> класс для объектов снимка (импорт здесь: модули импортируют этот)"""
+    classes = {}
+    for module_name, class_name in SNAPSHOT_CLASSES:
+        __import__(module_name)
+        classes[class_name] = getattr(sys.modules[module_name], class_name)
+    return classes
+
+
+class _Encoder:
+    """Данные снимка -> JSON-совместимое значение и двоичный хвост
+
+    Теги (словарь с одним ключом "$..."): "$t" - кортеж, "$d" - словарь с
+    не строковыми ключами или ключом на "$", "$b"/"$ba" - bytes/bytearray,
+    "$a" - array, "$dt"/"$dts" - datetime и кортеж из datetime и None,
+    "$o" - объект из SNAPSHOT_CLASSES, "$r" - ссылка на уже записанный
+    словарь. Общие словари (варианты лежат и в расписании, и в индексе)
+    записываются один раз с ключом "$id".
+    """
+
+    def __init__(self, classes):
+        self.classes = {cls: name for name, cls in classes.items()}
+        self.blobs = bytearray()
+        self._labels = {}  # id(словаря) -> (номер, закодированный словарь, сам словарь)
+
+    def _blob(self, data):
+        offset = len(self.blobs)
+        self.blobs += data
+        return [offset, len(data)]
+
+    def encode(self, value):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, dict):
+            return self._encode_dict(value)
+        if isinstance(value, list):
+            return [self.encode(item) for item in value]
+        if isinstance(value, tuple):
+            if value and all(item is None or isinstance(item, datetime) for item in value):
+                return {"$dts": [item.isoformat() if item is not None else None for item in value]}
+            return {"$t": [self.encode(item) for item in value]}
+        if isinstance(value, bytes):
+            return {"$b": self._blob(value)}
+        if isinstance(value, bytearray):
+            return {"$ba": self._blob(value)}
+        if isinstance(value, array):
+            return {"$a": [value.typecode, *self._blob(value.tobytes())]}
+        if isinstance(value, datetime):
+            return {"$dt": value.isoformat()}
+        name = self.classes.get(type(value))
+        if name is not None:
+            return {"$o": [name, self._encode_dict(value.__getstate__())]}
+        raise TypeError(f"{type(value).__name__} нельзя сохранить в снимок")
+
+    def _encode_dict(self, value):
+        label = self._labels.get(id(value))
+        if label is not None:
+            number, encoded, _ = label
+            encoded["$id"] = number
+            return {"$r": number}
+        if all(isinstance(key, str) and not key.startswith("$") for key in value):
+            encoded = {key: self.encode(item) for key, item in value.items()}
+        else:
+            encoded = {"$d": [[self.encode(key), self.encode(item)] for key, item in value.items()]}
+        # Сам словарь держим до конца записи, чтобы его id не достался другому
+        self._labels[id(value)] = (len(self._labels), encoded, value)
+        return encoded
+
+
+def _decoder(blobs, classes):
+    """object_hook для json.loads, обратный _Encoder"""
+    shared = {}
+
+    def blob(offset, length):
+        if offset < 0 or length < 0 or offset + length > len(blobs):
+            raise ValueError("ссылка за пределы снимка")
+        return blobs[offset:offset + length]
+
+    def decode(value):
+        label = value.pop("$id", None)
+        if len(value) == 1:
+            tag, data = next(iter(value.items()))
+            if tag == "$t":
+                value = tuple(data)
+            elif tag == "$d":
+                value = {key: item for key, item in data}
+            elif tag == "$b":
+                value = bytes(blob(*data))
+            elif tag == "$ba":
+                value = bytearray(blob(*data))
+            elif tag == "$a":
+                typecode, offset, length = data
+                value = array(typecode)
+                value.frombytes(blob(offset, length))
+            elif tag == "$dt":
+                value = datetime.fromisoformat(data)
+            elif tag == "$dts":
+                value = tuple(datetime.fromisoformat(item) if item is not None else None for item in data)
+            elif tag == "$o":
+                name, state = data
+                cls = classes[name]
+                value = cls.__new__(cls)
+                value.__setstate__(state)
+            elif tag == "$r":
+                value = shared[data]
+            elif tag.startswith("$"):
+                raise ValueError(f"неизвестный тег {tag}")
+        if label is not None:
+            shared[label] = value
+        return value
+
+    return decode
+
+
+def _dumps(payload):
+    encoder = _Encoder(_snapshot_classes())
+    data = json.dumps(encoder.encode(payload), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return SNAPSHOT_JSON_LENGTH.pack(len(data)) + data + encoder.blobs
+
+
+def _loads(payload_view):
+    (json_length,) = SNAPSHOT_JSON_LENGTH.unpack_from(payload_view)
+    data_end = SNAPSHOT_JSON_LENGTH.size + json_length
+    if data_end > len(payload_view):
+        raise ValueError("неверная длина JSON-части")
+    data = bytes(payload_view[SNAPSHOT_JSON_LENGTH.size:data_end])
+    blobs = payload_view[data_end:]
+    return json.loads(data, object_hook=_decoder(blobs, _snapshot_classes()))
+
+
+def load(key):
+    """(расписание, индекс) из снимка или None, если подходящего снимка нет"""
+    if not SNAPSHOT_ENABLED:
+        return None
+    started = time.perf_counter()
+    try:
+        with open(snapshot_path(key), "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, format_version, stored_key, length = SNAPSHOT_HEADER.unpack_from(data)
+            if magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION or stored_key != key:
+                return None
+            if SNAPSHOT_HEADER.size + length != len(data):
+                return None
+            with memoryview(data)[SNAPSHOT_HEADER.size:] as payload_view:
+                payload = _loads(payload_view)
+        schedule, index, extras = payload["schedule"], payload["index"], payload["extras"]
+        if not isinstance(index, _snapshot_classes()["ScheduleIndex"]):
+            return None
+    except (OSError, ValueError, KeyError, TypeError, IndexError, AttributeError, RecursionError, struct.error):
+        return None
+
+    _extras[index] = extras
+    report_schedule("снимок", time.perf_counter() - started)
+    return schedule, index
+
+
+def remember_source(index, key, schedule):
+    """Ключ и расписание, под которыми сохранить снимок свежескомпилированного индекса"""
+    _sources[index] = (key, schedule)
+
+
+def loaded_extras(index):
+    """Готовые данные (ответы, индекс поиска), пришедшие со снимком индекса"""
+    return _extras.get(index)
+
+
+def save(index, extras):
+    """Сохраняет снимок индекса, если он скомпилирован из исходника с ключом"""
+    source = _sources.pop(index, None)
+    if not SNAPSHOT_ENABLED or source is None or index in _extras:
+        return False
+    key, schedule = source
+    payload = _dumps({"schedule": schedule, "index": index, "extras": extras})
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, key, len(payload)))
+        f.write(payload)
+    os.replace(tmp_path, path)
+    # Снимки прежних версий больше не понадобятся
+    for old_path in glob.glob(os.path.join(SNAPSHOT_DIR, "schedule-*.snap")):
+        if old_path != path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    _extras[index] = extras
+    return True
+
+
+def report_schedule(source, seconds):
+    """Запоминает для таймера старта, откуда и за сколько получено расписание"""
+    _startup["schedule"] = source
+    _startup["schedule_seconds"] = seconds
+
+
+def report_ready():
+    """Пишет в лог, за сколько процесс (воркер - от fork) подготовился к запросам"""
+    logger.info(
+        "Готов к запросам через %.3f с после старта процесса %s (расписание: %s, %.3f с)",
+        time.perf_counter() - _startup["started"], os.getpid(), _startup["schedule"], _startup["schedule_seconds"],
+    )
+
+
+if __name__ == "__main__":
+    # Импорт приложения компилирует расписание и сохраняет снимок
+    import app  # noqa: F401
+
+    for path in glob.glob(os.path.join(SNAPSHOT_DIR, "schedule-*.snap")):
+        print(f"{path}: {os.path.getsize(path)} байт")
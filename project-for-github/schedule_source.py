@@ -0,0 +1,171 @@
+# Расписание из внешнего файла с горячей заменой
+# Если задан SCHEDULE_FILE (JSON или TOML того же вида, что и schedule:
+# {"cover": {...}, "variants": [...]}), расписание берется из него, а не из
+# литерала в schedule_data.py. Каждый воркер раз в SCHEDULE_POLL_SECONDS
+# проверяет mtime и размер файла; при изменении новое расписание
+# проверяется и компилируется в фоновом потоке (индекс и готовые ответы),
+# после чего подменяется одним присваиванием. Запросы, начатые на старой
+# версии, дорабатывают на ней, новые сразу видят новую - без перезапуска
+# воркеров.
+#
+# Ошибка в файле не роняет приложение: остается прежнее расписание, ошибка
+# пишется в лог, и файл перечитывается после следующего изменения
+
+import json
+import logging
+import os
+import threading
+import time
+
+import schedule_data
+import schedule_snapshot
+from schedule_data import ScheduleIndex, log_compile_report, parse_datetime
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: поддерживается только JSON
+    tomllib = None
+
+SCHEDULE_FILE = os.environ.get("SCHEDULE_FILE", "")
+SCHEDULE_POLL_SECONDS = float(os.environ.get("SCHEDULE_POLL_SECONDS", "2"))
+
+REQUIRED_VARIANT_FIELDS = ("id", "date", "start_time", "end_time", "duration", "title")
+
+logger = logging.getLogger(__name__)
+
+
+def parse_schedule_bytes(path, raw):
+    """Разбирает содержимое файла расписания (формат - по расширению path)"""
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("Для TOML нужен Python 3.11+")
+        return tomllib.loads(raw.decode("utf-8"))
+    return json.loads(raw.decode("utf-8"))
+
+
+def validate_schedule(new_schedule):
+    """Проверяет структуру расписания; ValueError с описанием первой ошибки"""
+    if not isinstance(new_schedule, dict) or not isinstance(new_schedule.get("variants"), list):
+        raise ValueError('Расписание должно содержать список "variants"')
+    seen = set()
+    for position, variant in enumerate(new_schedule["variants"]):
+        if not isinstance(variant, dict):
+            raise ValueError(f"Вариант #{position} должен быть объектом")
+        missing = [field for field in REQUIRED_VARIANT_FIELDS if field not in variant]
+        if missing:
+            raise ValueError(f"Вариант #{position}: нет полей {', '.join(missing)}")
+        # Поля разбираются как строки: число или null в них - ошибка файла
+        not_strings = [field for field in REQUIRED_VARIANT_FIELDS if not isinstance(variant[field], str)]
+        if variant.get("end_date") is not None and not isinstance(variant["end_date"], str):
+            not_strings.append("end_date")
+        if not_strings:
+            raise ValueError(f"Вариант #{position}: поля {', '.join(not_strings)} должны быть строками")
+        if variant["id"] in seen:
+            raise ValueError(f"Вариант #{position}: повторяется id {variant['id']!r}")
+        seen.add(variant["id"])
+        try:
+            parse_datetime(variant["date"], variant["start_time"])
+            if variant.get("end_date"):
+                parse_datetime(variant["end_date"], variant["end_time"])
+        except ValueError:
+            raise ValueError(
+                f"Вариант {variant['id']!r}: неверная дата или время "
+                f"({variant['date']!r} {variant['start_time']!r})"
+            ) from None
+
+
+class ScheduleWatcher:
+    """Следит за файлом расписания и подменяет текущее расписание при изменении"""
+
+    def __init__(self, path, on_compiled=None, poll_seconds=SCHEDULE_POLL_SECONDS):
+        self.path = path
+        # Вызывается с новым индексом до подмены (например, чтобы прогреть кэш ответов)
+        self.on_compiled = on_compiled
+        self.poll_seconds = poll_seconds
+        self._stamp = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """Перезагружает расписание, если файл изменился; True, если подменили"""
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp == self._stamp:
+                return False
+            # Запоминаем сразу: сломанный файл не перечитываем, пока он не изменится
+            self._stamp = stamp
+
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            key = schedule_snapshot.source_key(raw)
+            snapshot = schedule_snapshot.load(key)
+            if snapshot is not None:
+                # Этот файл уже компилировался: берем готовое из снимка
+                new_schedule, index = snapshot
+            else:
+                started = time.perf_counter()
+                new_schedule = parse_schedule_bytes(self.path, raw)
+                validate_schedule(new_schedule)
+                index = ScheduleIndex(new_schedule["variants"])
+                schedule_snapshot.remember_source(index, key, new_schedule)
+                schedule_snapshot.report_schedule("компиляция", time.perf_counter() - started)
+            log_compile_report(index.report, self.path)
+            # Номер версии - время изменения файла в мс: одинаков во всех воркерах.
+            # Назначается до прогрева: он входит в тело /api/initial
+            index.revision = schedule_data.next_revision(stamp[0] // 1_000_000)
+            if self.on_compiled is not None:
+                self.on_compiled(index)
+            schedule_data.load_schedule(new_schedule, index, revision=index.revision)
+            return True
+
+    def _watch_loop(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                if self.check():
+                    logger.info("Расписание перезагружено из %s (версия %s)",
+                                self.path, schedule_data.get_schedule_version())
+            except Exception:
+                logger.exception("Не удалось перезагрузить расписание из %s", self.path)
+
+    def ensure_started(self):
+        """Фоновое слежение; запускается в каждом воркере после fork"""
+        pid = os.getpid()
+        if self._thread_pid != pid:
+            self._thread_pid = pid
+            threading.Thread(target=self._watch_loop, name="schedule-watch", daemon=True).start()
+
+
+def init_app(app, on_compiled=None):
+    """Загружает расписание из SCHEDULE_FILE и включает слежение, если файл задан"""
+    if not SCHEDULE_FILE:
+        return None
+    watcher = ScheduleWatcher(SCHEDULE_FILE, on_compiled)
+    # При старте ошибка в файле должна быть видна сразу, поэтому не перехватываем
+    watcher.check()
+    app.before_request(watcher.ensure_started)
+    return watcher
+
+
+if __name__ == "__main__":
+    # Проверка файла расписания без запуска приложения:
+    #   python schedule_source.py schedule.json
+    # Печатает отчет компиляции; код выхода 1 - ошибка в файле или есть проблемы
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else SCHEDULE_FILE
+    if not path:
+        sys.exit("Укажите файл расписания: python schedule_source.py schedule.json")
+    try:
+        with open(path, "rb") as f:
+            checked_schedule = parse_schedule_bytes(path, f.read())
+        validate_schedule(checked_schedule)
+    except ValueError as error:
+        sys.exit(f"{path}: {error}")
+    report = ScheduleIndex(checked_schedule["variants"]).report
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    sys.exit(0 if report["ok"] else 1)
@@ -0,0 +1,461 @@
+# Полнотекстовый поиск писем по названию и описанию (/api/search?q=)
+# Для каждого индекса расписания один раз строится обратный индекс:
+# основа слова -> позиции вариантов (отдельно - где слово есть в названии,
+# отдельно - только в описании), отсортированные по началу.
+#
+# Нормализация: NFKC, casefold, ё -> е, разбиение на слова и простое
+# отсечение русских окончаний ("салюты", "салютом" -> "салют"). Слово
+# запроса ищется точно, по префиксу (пока гость печатает) и, если не
+# нашлось ни того, ни другого, с опечатками: кандидаты берутся по общим
+# триграммам, а подходят те, до которых не больше одной-двух правок
+# (замена, вставка, удаление, перестановка соседних букв) - в зависимости
+# от длины слова.
+#
+# Слова запроса объединяются по И. Кандидатов перебираем по самому редкому
+# слову запроса от лучших совпадений к худшим; если у него много вариантов,
+# сначала пересекаем битовые маски всех слов: когда совпадений не больше
+# SEARCH_SCAN_LIMIT, оцениваем их все сразу, иначе при переборе варианты,
+# где каких-то слов нет, пропускаются без оценки. Перебор останавливается, как
+# только оставшиеся уже не попадут в выдачу, и в любом случае после
+# SEARCH_SCAN_LIMIT оцененных вариантов, подходящих под все слова. Если
+# перебор остановлен лимитом, а не оценкой, часть совпадений могла не
+# попасть в выдачу - ответ помечается "truncated": true
+
+import heapq
+import math
+import re
+import sys
+import threading
+import unicodedata
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+
+from schedule_data import format_datetime
+
+SEARCH_RESULTS_LIMIT = 20
+MAX_SEARCH_RESULTS_LIMIT = 100
+# Сколько вариантов, подходящих под все слова, оценивать на один запрос
+SEARCH_SCAN_LIMIT = 400
+# Совпадение в названии весит больше, чем в описании
+TITLE_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+# Вес совпадения по префиксу и по триграммам относительно точного
+PREFIX_QUALITY = 0.8
+FUZZY_QUALITY = 0.7
+PREFIX_MAX_TERMS = 20
+# Кандидаты для опечаток: доля общих триграмм не меньше этой, не больше
+# FUZZY_MAX_CANDIDATES самых похожих (одна замена в слове из 5 букв - около 0,25)
+FUZZY_MIN_SIMILARITY = 0.15
+FUZZY_MAX_CANDIDATES = 50
+# У коротких слов перестановка букв не оставляет общих триграмм: тогда
+# проверяются основы на ту же букву (не больше стольких)
+FUZZY_FIRST_LETTER_SCAN = 2000
+FUZZY_MAX_TERMS = 3
+# Слова до этой длины допускают одну правку, длиннее - две
+FUZZY_ONE_EDIT_MAX_LENGTH = 5
+# Память на одно число с плавающей точкой в списке (объект и ссылка)
+FLOAT_SIZE = 32
+# Основа считается частой, если встречается хотя бы в 1/32 вариантов
+DENSE_TERM_MIN_SHARE = 32
+
+MIN_STEM_LENGTH = 3
+# Окончания русских слов, от длинных к коротким
+RUSSIAN_ENDINGS = tuple(sorted({
+    "иями", "ями", "ами", "иях", "ого", "его", "ому", "ему", "ыми", "ими",
+    "ых", "их", "ую", "юю", "ая", "яя", "ое", "ее", "ой", "ей", "ий", "ый",
+    "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев", "ью", "ия", "ие", "ии",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+}, key=len, reverse=True))
+
+WORD_RE = re.compile(r"\w+")
+CYRILLIC_RE = re.compile(r"[а-я]")
+NONZERO_BYTE_RE = re.compile(rb"[^\x00]")
+
+
+def normalize_text(text):
+    """Текст для поиска: NFKC, без регистра, ё -> е"""
+    return unicodedata.normalize("NFKC", text).casefold().replace("ё", "е")
+
+
+def stem(word):
+    """Основа слова: у русских слов отсекается окончание"""
+    if CYRILLIC_RE.search(word):
+        for ending in RUSSIAN_ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM_LENGTH:
+                return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    """Нормализованные слова текста (из двух и более символов)"""
+    return [word for word in WORD_RE.findall(normalize_text(text)) if len(word) > 1]
+
+
+def trigrams(term):
+    padded = f" {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits(word):
+    """Сколько правок допускается в слове запроса такой длины"""
+    return 1 if len(word) <= FUZZY_ONE_EDIT_MAX_LENGTH else 2
+
+
+def edit_distance(a, b, limit):
+    """Расстояние Дамерау-Левенштейна (с перестановкой соседних букв) или limit + 1, если больше limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class SearchIndex:
+    """Обратный индекс по названиям и описаниям вариантов одного расписания"""
+
+    def __init__(self, index):
+        # Слабая ссылка: индекс поиска лежит в WeakKeyDictionary по этому же индексу
+        self._index = weakref.ref(index)
+        self.version = index.version
+
+        title_slots = {}  # основа -> [позиции]
+        description_slots = {}
+        stems = {}  # слово -> основа: слова в расписании сильно повторяются
+
+        def stems_of(text):
+            terms = set()
+            for word in tokenize(text):
+                term = stems.get(word)
+                if term is None:
+                    term = stems[word] = stem(word)
+                terms.add(term)
+            return terms
+
+        for slot, variant in enumerate(index.variants):
+            in_title = stems_of(variant.get("title", ""))
+            in_description = stems_of(variant.get("description", "")) - in_title
+            for term in in_title:
+                title_slots.setdefault(term, []).append(slot)
+            for term in in_description:
+                description_slots.setdefault(term, []).append(slot)
+
+        self.vocabulary = sorted(title_slots.keys() | description_slots.keys())
+        self._term_ids = {term: term_id for term_id, term in enumerate(self.vocabulary)}
+        # Позиции уже возрастают: варианты перебирались в порядке начала
+        self._title_postings = [array('i', title_slots.get(term, ())) for term in self.vocabulary]
+        self._description_postings = [array('i', description_slots.get(term, ())) for term in self.vocabulary]
+
+        documents = self.documents = max(1, len(index.variants))
+        self._idf = [
+            math.log(1 + documents / (len(titles) + len(descriptions)))
+            for titles, descriptions in zip(self._title_postings, self._description_postings)
+        ]
+
+        # У частых основ - еще и битовые таблицы: проверка "есть ли основа в
+        # варианте" без бинпоиска (по N/8 байт на основу, таких основ немного)
+        dense_min = max(1, documents // DENSE_TERM_MIN_SHARE)
+        self._dense = [
+            (_bitset(titles, documents), _bitset(descriptions, documents))
+            if len(titles) + len(descriptions) >= dense_min else None
+            for titles, descriptions in zip(self._title_postings, self._description_postings)
+        ]
+
+        by_trigram = {}
+        for term_id, term in enumerate(self.vocabulary):
+            for trigram in trigrams(term):
+                by_trigram.setdefault(trigram, []).append(term_id)
+        self._trigram_terms = {trigram: array('i', term_ids) for trigram, term_ids in by_trigram.items()}
+        self.size_bytes = self._estimate_size()
+
+    def _estimate_size(self):
+        """Оценка занимаемой памяти в байтах (для бюджета кэша планов)"""
+        size = sys.getsizeof(self.vocabulary) + sys.getsizeof(self._term_ids) + sys.getsizeof(self._trigram_terms)
+        size += sum(map(sys.getsizeof, self.vocabulary)) + FLOAT_SIZE * len(self._idf)
+        size += sum(map(sys.getsizeof, self._title_postings)) + sum(map(sys.getsizeof, self._description_postings))
+        size += sum(len(dense[0]) + len(dense[1]) for dense in self._dense if dense is not None)
+        size += sum(sys.getsizeof(trigram) + sys.getsizeof(term_ids) for trigram, term_ids in self._trigram_terms.items())
+        return size
+
+    def __getstate__(self):
+        # Для снимка расписания: ссылка на индекс восстанавливается при загрузке
+        state = self.__dict__.copy()
+        del state["_index"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._index = lambda: None
+
+    def _prefix_terms(self, prefix):
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + "\uffff", start)
+        return range(start, min(end, start + PREFIX_MAX_TERMS))
+
+    def _fuzzy_terms(self, word):
+        """Основы, отличающиеся от слова запроса опечаткой: [(id, сходство)]
+
+        Кандидаты - по общим триграммам с основой слова, проверка - по
+        числу правок до слова или до его основы (окончание у слова с
+        опечаткой может отсечься не так, как у правильного).
+        """
+        base = stem(word)
+        query_trigrams = trigrams(base)
+        shared = {}
+        for trigram in query_trigrams:
+            for term_id in self._trigram_terms.get(trigram, ()):
+                shared[term_id] = shared.get(term_id, 0) + 1
+        candidates = []
+        for term_id, count in shared.items():
+            term_trigrams = len(self.vocabulary[term_id]) + 1
+            similarity = count / (len(query_trigrams) + term_trigrams - count)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                candidates.append((similarity, term_id))
+        candidates.sort(reverse=True)
+
+        limit = max_edits(word)
+        scored = self._verify(word, base, [term_id for _, term_id in candidates[:FUZZY_MAX_CANDIDATES]], limit)
+        if not scored:
+            start = bisect_left(self.vocabulary, word[0])
+            end = bisect_left(self.vocabulary, word[0] + "\uffff", start)
+            scored = self._verify(word, base, range(start, min(end, start + FUZZY_FIRST_LETTER_SCAN)), limit)
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(term_id, similarity) for similarity, term_id in scored[:FUZZY_MAX_TERMS]]
+
+    def _verify(self, word, base, term_ids, limit):
+        """[(сходство, id)] основ, до которых не больше limit правок"""
+        scored = []
+        for term_id in term_ids:
+            term = self.vocabulary[term_id]
+            distance = min(edit_distance(base, term, limit), edit_distance(word, term, limit))
+            if distance <= limit:
+                scored.append((1 - distance / max(len(base), len(term)), term_id))
+        return scored
+
+    def _expand(self, word):
+        """Основы словаря для слова запроса: [(id, качество совпадения)]"""
+        expansions = {}
+        term_id = self._term_ids.get(stem(word))
+        if term_id is not None:
+            expansions[term_id] = 1.0
+        for term_id in self._prefix_terms(word):
+            expansions.setdefault(term_id, PREFIX_QUALITY)
+        if not expansions and len(word) >= MIN_STEM_LENGTH:
+            for term_id, similarity in self._fuzzy_terms(word):
+                expansions[term_id] = FUZZY_QUALITY * similarity
+        return sorted(expansions.items(), key=lambda item: item[1], reverse=True)
+
+    def _postings_size(self, expansions):
+        return sum(
+            len(self._title_postings[term_id]) + len(self._description_postings[term_id])
+            for term_id, _ in expansions
+        )
+
+    def _word_score(self, expansions, slot):
+        """Вклад слова запроса в оценку варианта (0 - слова в варианте нет)"""
+        best = 0.0
+        byte, bit = slot >> 3, 1 << (slot & 7)
+        for term_id, quality in expansions:
+            dense = self._dense[term_id]
+            if dense is not None:
+                in_title = dense[0][byte] & bit
+                in_description = not in_title and dense[1][byte] & bit
+            else:
+                in_title = _contains(self._title_postings[term_id], slot)
+                in_description = not in_title and _contains(self._description_postings[term_id], slot)
+            if in_title:
+                best = max(best, TITLE_WEIGHT * quality * self._idf[term_id])
+            elif in_description:
+                best = max(best, DESCRIPTION_WEIGHT * quality * self._idf[term_id])
+        return best
+
+    def _candidates(self, expansions, matching=None):
+        """(позиция варианта, вклад слова) по невозрастанию вклада, без повторов
+
+        matching - маска допустимых вариантов (остальные не перебираются).
+        """
+        sources = []
+        for term_id, quality in expansions:
+            score = quality * self._idf[term_id]
+            title, description = self._title_postings[term_id], self._description_postings[term_id]
+            if matching is not None:
+                title = _bit_slots(self._bits(title, term_id, 0) & matching, self.documents)
+                description = _bit_slots(self._bits(description, term_id, 1) & matching, self.documents)
+            sources.append((TITLE_WEIGHT * score, title))
+            sources.append((DESCRIPTION_WEIGHT * score, description))
+        sources.sort(key=lambda source: source[0], reverse=True)
+        seen = set()
+        for score, postings in sources:
+            for slot in postings:
+                if slot not in seen:
+                    seen.add(slot)
+                    yield slot, score
+
+    def _bits(self, postings, term_id, field):
+        """Список вариантов основы битовой маской (целым); field: 0 - название, 1 - описание"""
+        dense = self._dense[term_id]
+        return int.from_bytes(dense[field] if dense is not None else _bitset(postings, self.documents), "little")
+
+    def _word_bits(self, expansions):
+        """Битовая маска вариантов, в которых есть слово запроса"""
+        bits = 0
+        for term_id, _ in expansions:
+            bits |= self._bits(self._title_postings[term_id], term_id, 0)
+            bits |= self._bits(self._description_postings[term_id], term_id, 1)
+        return bits
+
+    def _matching(self, words):
+        """Битовая маска (целое) вариантов, в которых есть все слова words
+
+        Пересечение - побитовым И масок (у частых основ они уже готовы).
+        """
+        matching = -1
+        for expansions in sorted(words, key=self._postings_size):
+            matching &= self._word_bits(expansions)
+            if not matching:
+                break
+        return matching
+
+    def _rank_all(self, expanded, slots, limit):
+        scored = ((sum(self._word_score(expansions, slot) for expansions in expanded), -slot) for slot in slots)
+        return [(score, -negative_slot) for score, negative_slot in heapq.nlargest(limit, scored)]
+
+    def _max_word_score(self, expansions):
+        return max(TITLE_WEIGHT * quality * self._idf[term_id] for term_id, quality in expansions)
+
+    def search(self, query, limit=SEARCH_RESULTS_LIMIT):
+        """([(оценка, позиция варианта)], truncated)
+
+        Результаты - по убыванию оценки, при равенстве - по началу;
+        truncated - оценено SEARCH_SCAN_LIMIT подходящих вариантов, и среди
+        неоцененных могли быть совпадения лучше найденных.
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return [], False
+        expanded = [self._expand(word) for word in words]
+        if not all(expanded):
+            return [], False
+
+        # Перебираем варианты самого редкого слова, остальные проверяем бинпоиском;
+        # если вариантов у него больше лимита, сначала пересекаем остальные слова
+        expanded.sort(key=self._postings_size)
+        driving, others = expanded[0], expanded[1:]
+        matching = None
+        if others and self._postings_size(driving) > SEARCH_SCAN_LIMIT:
+            matching = self._matching(expanded)
+            if matching.bit_count() <= SEARCH_SCAN_LIMIT:
+                # Совпадений немного - оцениваем их все без перебора кандидатов
+                return self._rank_all(expanded, _bit_slots(matching, self.documents), limit), False
+        others_bound = sum(self._max_word_score(expansions) for expansions in others)
+        best = []
+        truncated = False
+        scanned = 0
+        for slot, score in self._candidates(driving, matching):
+            # Кандидаты идут по невозрастанию вклада, позиции при равном вкладе
+            # растут: дальше никто не обгонит худший из уже найденных
+            if len(best) == limit and score + others_bound <= best[0][0]:
+                break
+            if scanned >= SEARCH_SCAN_LIMIT:
+                truncated = True
+                break
+            for expansions in others:
+                word_score = self._word_score(expansions, slot)
+                if not word_score:
+                    break
+                score += word_score
+            else:
+                scanned += 1
+                entry = (score, -slot)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+        return [(score, -negative_slot) for score, negative_slot in sorted(best, reverse=True)], truncated
+
+    def search_payload(self, query, limit=SEARCH_RESULTS_LIMIT):
+        """Ответ /api/search: найденные письма с оценкой"""
+        index = self._index()
+        results = []
+        found, truncated = self.search(query, limit)
+        for score, slot in found:
+            variant = index.variants[slot]
+            end_dt = index.ends[slot]
+            results.append({
+                "id": variant["id"],
+                "title": variant["title"],
+                "image": variant.get("image", "📄"),
+                "start_datetime_str": format_datetime(index.starts[slot]),
+                "end_datetime_str": format_datetime(end_dt) if end_dt else None,
+                "special": variant.get("special", False),
+                "score": round(score, 4),
+            })
+        return {"query": query, "version": self.version, "results": results, "truncated": truncated}
+
+
+def _bitset(slots, size):
+    bits = bytearray((size + 7) // 8)
+    for slot in slots:
+        bits[slot >> 3] |= 1 << (slot & 7)
+    return bits
+
+
+def _bit_slots(bits, size):
+    """Позиции единичных битов маски bits по возрастанию"""
+    data = bits.to_bytes((size + 7) // 8, "little")
+    for match in NONZERO_BYTE_RE.finditer(data):
+        byte, base = match.group()[0], match.start() << 3
+        for bit in range(8):
+            if byte >> bit & 1:
+                yield base + bit
+
+
+def _contains(postings, slot):
+    position = bisect_right(postings, slot)
+    return position > 0 and postings[position - 1] == slot
+
+
+# Индекс поиска живет, пока жив индекс расписания (как снимки /api/now)
+_search_indexes = weakref.WeakKeyDictionary()
+_search_indexes_lock = threading.Lock()
+
+
+def restore_search_index(index, search_index):
+    """Подключает к индексу расписания индекс поиска, загруженный из снимка"""
+    search_index._index = weakref.ref(index)
+    with _search_indexes_lock:
+        _search_indexes[index] = search_index
+
+
+def clear_search_indexes():
+    """Забывает индексы поиска всех расписаний (для холодных замеров в бенчмарках)"""
+    with _search_indexes_lock:
+        _search_indexes.clear()
+
+
+def search_index_size(index):
+    """Сколько байт держит индекс поиска расписания (0, если его еще нет)"""
+    search_index = _search_indexes.get(index)
+    return search_index.size_bytes if search_index is not None else 0
+
+
+def get_search_index(index):
+    """Индекс поиска для индекса расписания (строится один раз на версию)"""
+    search_index = _search_indexes.get(index)
+    if search_index is None:
+        with _search_indexes_lock:
+            search_index = _search_indexes.get(index)
+            if search_index is None:
+                search_index = SearchIndex(index)
+                _search_indexes[index] = search_index
+    return search_index
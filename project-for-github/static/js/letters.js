@@ -1,6 +1,14 @@
 // Глобальные переменные
-let lettersData = []; // Обычные письма (без специальных)
-let allLettersData = []; // Все письма включая специальные (для серых меток)
+let lettersData = []; // Обычные письма (без специальных), только время - содержимое в loadedLetters
+let allLettersData = []; // Все письма включая специальные (для серых меток), только время
+let layoutData = null; // Готовая раскладка писем из /api/layout
+let layoutBoxesById = new Map(); // Прямоугольники раскладки по id письма
+let loadedLetters = new Map(); // Содержимое писем из загруженных окон по id
+let letterWindows = new Map(); // Номер окна -> { ids: id писем окна }
+let letterElements = new Map(); // Элементы писем на столе по id
+let letterWindowsTimer = null;
+let letterDetailsCache = new Map(); // Детали писем по id (из /api/letter)
+let scheduleRevision = null; // Номер версии расписания, на которой построена страница
 let currentTime = null;
 let minTime = null;
 let maxTime = null;
@@ -21,6 +29,18 @@ const LETTER_WIDTH_DOUBLE = 180;
 const RANDOM_ROTATION_MAX = 7; // Максимальный угол наклона в градусах
 const LETTER_SCALE = 2.5; // Масштаб писем (250%)
 const INSPECTION_SCALE = 0.4; // Масштаб в режиме осмотра
+const LETTER_WINDOW_MINUTES = 120; // Письма подгружаются окнами по 2 часа
+const LETTER_WINDOWS_AROUND = 1; // Сколько окон держать загруженными по обе стороны от ползунка
+const LETTER_WINDOWS_KEEP = 3; // Окна дальше этого от ползунка выгружаются
+const LETTER_WINDOWS_DELAY_MS = 100; // Пауза после скролла перед подгрузкой окон
+const ALL_LETTERS_WINDOW = 'all'; // Все письма сразу (для режима осмотра)
+const TIME_SYNC_SAMPLES = 4; // Замеров при синхронизации часов (берется с наименьшей задержкой)
+const TIME_RESYNC_MS = 30 * 60 * 1000; // Повторная синхронизация раз в полчаса
+const LETTER_CHANGES_POLL_MS = 5 * 60 * 1000; // Проверка изменений расписания раз в 5 минут
+// Префикс плана (/p/<plan_id>) или пустая строка для основного расписания
+const BASE_PATH = document.body.dataset.basePath || '';
+// Включены ли на сервере потоки /api/stream (иначе - только опрос)
+const LIVE_STREAM_ENABLED = document.body.dataset.liveStream === '1';
 
 // Функция для определения масштаба контейнера на мобильных устройствах
 function getTableSurfaceScale() {
@@ -35,15 +55,123 @@ function getTableSurfaceScale() {
 
 // Инициализация
 document.addEventListener('DOMContentLoaded', function() {
-            updateCurrentTime();
+            setupTimeSync();
+            setupChangeSync();
             loadLetters();
             setupTimeSlider();
             setupScrollTracking();
-    
-    // Обновляем текущее время каждую минуту
-    setInterval(updateCurrentTime, 60000);
 });
 
+// Смещение часов сервера относительно performance.now() клиента, мс.
+// До первой синхронизации - часы клиента
+let serverTimeOffsetMs = Date.now() - performance.now();
+let serverUtcOffsetMinutes = null; // Часовой пояс сервера (расписания), минут от UTC
+let clockTimer = null;
+const SERVER_CLOCK_KEY = 'serverClock'; // Последняя синхронизация в localStorage (для офлайн-режима)
+
+// Синхронизация часов: один раз при загрузке, изредка повторно и при
+// возвращении на вкладку; между синхронизациями часы идут локально
+function setupTimeSync() {
+    restoreServerClock();
+    startLocalClock();
+    syncServerTime();
+    setInterval(syncServerTime, TIME_RESYNC_MS);
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'visible') {
+            syncServerTime();
+        }
+    });
+}
+
+// Несколько замеров /api/time_sync подряд, как в NTP: считаем, что сервер
+// ответил в середине пути туда-обратно, и доверяем замеру с наименьшей задержкой
+function syncServerTime() {
+    const samples = [];
+    const takeSample = () => {
+        const sentAt = performance.now();
+        return fetch('/api/time_sync', { cache: 'no-store' })
+            .then(response => response.json())
+            .then(data => {
+                const receivedAt = performance.now();
+                samples.push({
+                    roundTrip: receivedAt - sentAt,
+                    offset: data.epoch_ms - (sentAt + receivedAt) / 2,
+                    utcOffsetMinutes: data.utc_offset_minutes
+                });
+            });
+    };
+    
+    let chain = Promise.resolve();
+    for (let i = 0; i < TIME_SYNC_SAMPLES; i++) {
+        chain = chain.then(takeSample);
+    }
+    return chain
+        .then(() => {
+            const best = samples.reduce((a, b) => (b.roundTrip < a.roundTrip ? b : a));
+            serverTimeOffsetMs = best.offset;
+            serverUtcOffsetMinutes = best.utcOffsetMinutes;
+            saveServerClock();
+            startLocalClock();
+        })
+        .catch(error => {
+            console.error('Ошибка синхронизации времени:', error);
+        });
+}
+
+// Без сети часы идут по последней синхронизации: сохраняем расхождение
+// часов сервера с Date.now() (performance.now() у каждой страницы свой)
+function saveServerClock() {
+    try {
+        localStorage.setItem(SERVER_CLOCK_KEY, JSON.stringify({
+            skewMs: serverNow() - Date.now(),
+            utcOffsetMinutes: serverUtcOffsetMinutes
+        }));
+    } catch (error) {
+        // localStorage может быть недоступен (приватный режим) - не страшно
+    }
+}
+
+function restoreServerClock() {
+    try {
+        const saved = JSON.parse(localStorage.getItem(SERVER_CLOCK_KEY));
+        if (saved && typeof saved.skewMs === 'number') {
+            serverTimeOffsetMs = Date.now() - performance.now() + saved.skewMs;
+            serverUtcOffsetMinutes = saved.utcOffsetMinutes;
+        }
+    } catch (error) {
+        // Нет сохраненной синхронизации - часы клиента до первого ответа сервера
+    }
+}
+
+// Текущее время сервера (мс от эпохи) по локальным часам и смещению
+function serverNow() {
+    return performance.now() + serverTimeOffsetMs;
+}
+
+// Момент времени сервера в координатах расписания (как get_current_date_time
+// на сервере: декабрь - это 31.12, остальные даты - 01.01)
+function scheduleDateFromServerTime(ms) {
+    const utcOffsetMinutes = serverUtcOffsetMinutes !== null
+        ? serverUtcOffsetMinutes
+        : -new Date(ms).getTimezoneOffset();
+    // UTC-поля этой даты - настенные часы сервера
+    const wall = new Date(ms + utcOffsetMinutes * 60 * 1000);
+    const isDecember = wall.getUTCMonth() === 11;
+    return new Date(
+        isDecember ? 2024 : 2025, isDecember ? 11 : 0, isDecember ? 31 : 1,
+        wall.getUTCHours(), wall.getUTCMinutes(), wall.getUTCSeconds()
+    );
+}
+
+// Локальные часы: обновляем текущее время в начале каждой минуты сервера,
+// границы слотов расписания приходятся на целые минуты
+function startLocalClock() {
+    clearTimeout(clockTimer);
+    updateCurrentTime();
+    const msToNextMinute = 60000 - (serverNow() % 60000);
+    clockTimer = setTimeout(startLocalClock, msToNextMinute + 50);
+}
+
 // Отслеживание скролла контейнера для обновления ползунка
 function setupScrollTracking() {
     const tableContainer = document.getElementById('table-container');
@@ -127,25 +255,21 @@ function updateSliderFromScroll() {
     // Показываем точное время на циферблате
     updateClockDisplay(centerTime);
     selectedTime = centerTime;
+    scheduleLetterWindowsUpdate();
 }
 
 // Загрузка писем
 function loadLetters() {
-    // Загружаем обычные письма
-    fetch('/api/letters')
-        .then(response => response.json())
-        .then(data => {
-            lettersData = data.letters;
-            // Загружаем все письма включая специальные (для серых меток)
-            return fetch('/api/all_letters_with_special');
-        })
-        .then(response => response.json())
+    // Данные для первого рендера обычно встроены в страницу; если их нет -
+    // загружаем их одним запросом
+    const initialDataEl = document.getElementById('initial-data');
+    const initialData = initialDataEl
+        ? Promise.resolve(JSON.parse(initialDataEl.textContent))
+        : fetch(`${BASE_PATH}/api/initial`).then(response => response.json());
+    
+    initialData
         .then(data => {
-            allLettersData = data.letters;
-            // Сначала рассчитываем временной диапазон
-            calculateTimeRange();
-            // Затем рендерим письма (размеры иконок уже учитывают масштаб через CSS)
-            renderLetters();
+            applyInitialData(data);
             // После рендеринга писем строим шкалу времени
             // Используем requestAnimationFrame чтобы убедиться, что DOM обновлен
             requestAnimationFrame(() => {
@@ -161,6 +285,127 @@ function loadLetters() {
         });
 }
 
+// Шкала всех писем (время без содержимого) и раскладка; содержимое
+// писем подгружается окнами по мере прокрутки
+function applyInitialData(data) {
+    scheduleRevision = data.revision;
+    allLettersData = data.timeline;
+    lettersData = allLettersData.filter(letter =>
+        !letter.special && (letter.id.endsWith('a') || letter.id.endsWith('b'))
+    );
+    layoutData = data.layout;
+    // Сначала рассчитываем временной диапазон
+    calculateTimeRange();
+    // Затем рендерим письма (размеры иконок уже учитывают масштаб через CSS)
+    renderLetters();
+}
+
+let scheduleStream = null; // Подписка на /api/stream (события замены расписания)
+
+// Проверка изменений расписания: по событию schedule из /api/stream,
+// а если поток недоступен - изредка опросом; и при возвращении на вкладку
+function setupChangeSync() {
+    subscribeToScheduleStream();
+    setInterval(function() {
+        if (!scheduleStream || scheduleStream.readyState !== EventSource.OPEN) {
+            syncLetterChanges();
+        }
+    }, LETTER_CHANGES_POLL_MS);
+    document.addEventListener('visibilitychange', function() {
+        if (document.visibilityState === 'visible') {
+            syncLetterChanges();
+        }
+    });
+}
+
+// Сервер присылает schedule при подключении и после каждой замены
+// расписания; время и смену слотов страница ведет сама (setupTimeSync)
+function subscribeToScheduleStream() {
+    if (!window.EventSource || !LIVE_STREAM_ENABLED) return;
+    
+    scheduleStream = new EventSource(`${BASE_PATH}/api/stream`);
+    
+    scheduleStream.addEventListener('schedule', function(e) {
+        const data = JSON.parse(e.data);
+        if (scheduleRevision !== null && data.revision !== scheduleRevision) {
+            syncLetterChanges();
+        }
+    });
+    scheduleStream.onerror = function() {
+        // Браузер сам переподключается; если поток закрыт окончательно
+        // (в том числе отказ 503 сверх лимита сервера) - остается опрос
+        if (scheduleStream.readyState === EventSource.CLOSED) {
+            scheduleStream = null;
+        }
+    };
+}
+
+// Запрашивает только изменения после известной версии; мелкие правки
+// (текст писем) применяются на месте, остальное - полной перезагрузкой данных
+function syncLetterChanges() {
+    if (scheduleRevision === null || inspectionMode) return;
+    
+    fetch(`${BASE_PATH}/api/letters/changes?since=${scheduleRevision}`, { cache: 'no-store' })
+        .then(response => response.json())
+        .then(data => {
+            if (data.revision === scheduleRevision) return;
+            if (data.full_resync || data.added.length > 0 || data.removed.length > 0 || !onlyTextChanged(data)) {
+                reloadAllLetters();
+                return;
+            }
+            data.letters.forEach(updateLetterInPlace);
+            scheduleRevision = data.revision;
+        })
+        .catch(error => {
+            console.error('Ошибка проверки изменений расписания:', error);
+        });
+}
+
+// Изменения не двигают письма на столе (время и продолжительность прежние)
+function onlyTextChanged(data) {
+    const timelineById = new Map(allLettersData.map(letter => [letter.id, letter]));
+    const changedById = new Map(data.letters.map(letter => [letter.id, letter]));
+    return data.modified.every(id => {
+        const before = timelineById.get(id);
+        const after = changedById.get(id);
+        return before && after
+            && before.start_datetime_str === after.start_datetime_str
+            && before.end_datetime_str === after.end_datetime_str
+            && before.duration_minutes === after.duration_minutes;
+    });
+}
+
+// Замена содержимого одного письма, если оно сейчас на столе
+function updateLetterInPlace(letter) {
+    letterDetailsCache.delete(letter.id);
+    if (!loadedLetters.has(letter.id)) return; // Новая версия придет вместе с окном
+    loadedLetters.set(letter.id, letter);
+    const letterEl = letterElements.get(letter.id);
+    if (letterEl) letterEl.remove();
+    letterElements.delete(letter.id);
+    renderLetterBox(letter);
+}
+
+// Полная перезагрузка данных писем без перезагрузки страницы
+function reloadAllLetters() {
+    fetch(`${BASE_PATH}/api/initial`, { cache: 'no-cache' })
+        .then(response => response.json())
+        .then(data => {
+            letterWindows.clear();
+            letterElements.forEach(letterEl => letterEl.remove());
+            letterElements.clear();
+            loadedLetters.clear();
+            letterDetailsCache.clear();
+            applyInitialData(data);
+            requestAnimationFrame(renderTimeScale);
+            // Расписание изменилось - офлайн-кэш тоже пора обновить
+            navigator.serviceWorker?.controller?.postMessage('sync-precache');
+        })
+        .catch(error => {
+            console.error('Ошибка загрузки писем:', error);
+        });
+}
+
 // Вычисление диапазона времени (используем все письма включая специальные)
 function calculateTimeRange() {
     if (allLettersData.length === 0) return;
@@ -330,114 +575,19 @@ function renderLetters() {
     existingSpecial.forEach(el => el.remove());
     renderSpecialLetters();
     
-    // Группируем письма по времени начала (для одновременных событий)
-    const groupedLetters = groupLettersByStartTime();
-    
-    if (groupedLetters.length === 0) {
-        console.error('Не удалось сгруппировать письма');
+    if (!layoutData || layoutData.boxes.length === 0) {
+        console.error('Нет раскладки писем');
         return;
     }
     
-    // Сортируем все группы по времени начала
-    groupedLetters.sort((a, b) => {
-        const timeA = parseDateTimeStr(a.letters[0].start_datetime_str);
-        const timeB = parseDateTimeStr(b.letters[0].start_datetime_str);
-        return timeA - timeB;
-    });
-    
+    // Раскладка (дорожки, узкие письма, пары a/b) уже посчитана сервером в /api/layout,
+    // поэтому высоту стола знаем сразу, а сами письма появляются по мере загрузки окон
+    layoutBoxesById = new Map(layoutData.boxes.map(box => [box.id, box]));
     let maxBottom = 0; // Максимальная нижняя граница для установки высоты поверхности
     
-    groupedLetters.forEach((group) => {
-        const letters = group.letters;
-        
-        // Если в группе несколько писем (наложение), каждое позиционируется независимо по своему времени начала
-        // Но показываются они рядом друг с другом
-        if (letters.length === 1) {
-            // Одно письмо - проверяем, должно ли оно быть узким (из-за наложения)
-            const letter = letters[0];
-            const letterStartTime = parseDateTimeStr(letter.start_datetime_str);
-            const minutesFromStart = (letterStartTime - minTime) / (1000 * 60);
-            const letterCenter = minutesFromStart * PIXELS_PER_MINUTE * LETTER_SCALE;
-            
-            const duration = letter.duration_minutes || 30;
-            const height = Math.max(MIN_LETTER_HEIGHT, duration * PIXELS_PER_MINUTE);
-            // Для письма "Дачная Суета!" (id="1a") используем максимальный наклон 1%, для остальных - 7%
-            const maxRotation = letter.id === '1a' ? 1 : RANDOM_ROTATION_MAX;
-            const rotation = (Math.random() - 0.5) * 2 * maxRotation;
-            
-            // Верх письма на времени начала
-            const top = letterCenter;
-            
-            // Если у группы есть флаг hasOverlap или письмо из колонки 'b', оно должно быть узким
-            const hasOverlap = group.hasOverlap || false;
-            const letterColumn = letter.id.endsWith('a') ? 'a' : 'b';
-            let className = 'single';
-            
-            if (hasOverlap || letterColumn === 'b') {
-                // Узкое письмо: 'a' слева, 'b' справа
-                className = letterColumn === 'a' ? 'double left' : 'double right';
-            }
-            
-            const letterEl = createLetterElement(letter, className, top, height, rotation);
-            tableSurface.appendChild(letterEl);
-            
-            // Обновляем максимальную нижнюю границу
-            const endMinutesFromStart = minutesFromStart + duration;
-            const endPosition = endMinutesFromStart * PIXELS_PER_MINUTE * LETTER_SCALE;
-            maxBottom = Math.max(maxBottom, endPosition);
-            
-        } else if (letters.length === 2) {
-            // Два письма рядом (наложение) - позиционируем каждое по своему времени начала
-            letters.forEach((letter, index) => {
-                const letterStartTime = parseDateTimeStr(letter.start_datetime_str);
-                const minutesFromStart = (letterStartTime - minTime) / (1000 * 60);
-                const letterCenter = minutesFromStart * PIXELS_PER_MINUTE * LETTER_SCALE;
-                
-                const duration = letter.duration_minutes || 30;
-                const height = Math.max(MIN_LETTER_HEIGHT, duration * PIXELS_PER_MINUTE);
-                // Для письма "Дачная Суета!" (id="1a") используем максимальный наклон 1%, для остальных - 7%
-                const maxRotation = letter.id === '1a' ? 1 : RANDOM_ROTATION_MAX;
-                const rotation = (Math.random() - 0.5) * 2 * maxRotation;
-                const position = index === 0 ? 'left' : 'right';
-                
-                // Верх каждого письма на своем времени начала
-                let letterTop = letterCenter;
-                // Левое письмо делаем немного выше (смещаем вверх на 30px)
-                if (position === 'left') {
-                    letterTop -= 30;
-                }
-                
-                const letterEl = createLetterElement(letter, `double ${position}`, letterTop, height, rotation);
-                tableSurface.appendChild(letterEl);
-                
-                // Обновляем максимальную нижнюю границу
-                const endMinutesFromStart = minutesFromStart + duration;
-                const endPosition = endMinutesFromStart * PIXELS_PER_MINUTE * LETTER_SCALE;
-                maxBottom = Math.max(maxBottom, endPosition);
-            });
-        } else {
-            // Если больше двух (не должно быть, но на всякий случай)
-            letters.forEach((letter, index) => {
-                const letterStartTime = parseDateTimeStr(letter.start_datetime_str);
-                const minutesFromStart = (letterStartTime - minTime) / (1000 * 60);
-                const letterCenter = minutesFromStart * PIXELS_PER_MINUTE * LETTER_SCALE;
-                
-                const duration = letter.duration_minutes || 30;
-                const height = Math.max(MIN_LETTER_HEIGHT, duration * PIXELS_PER_MINUTE);
-                // Для письма "Дачная Суета!" (id="1a") используем максимальный наклон 1%, для остальных - 7%
-                const maxRotation = letter.id === '1a' ? 1 : RANDOM_ROTATION_MAX;
-                const rotation = (Math.random() - 0.5) * 2 * maxRotation;
-                
-                const letterTop = letterCenter;
-                
-                const letterEl = createLetterElement(letter, 'single', letterTop, height, rotation);
-                tableSurface.appendChild(letterEl);
-                
-                const endMinutesFromStart = minutesFromStart + duration;
-                const endPosition = endMinutesFromStart * PIXELS_PER_MINUTE * scale;
-                maxBottom = Math.max(maxBottom, endPosition);
-            });
-        }
+    layoutData.boxes.forEach((box) => {
+        const endPosition = (box.start_minutes + box.height_minutes) * PIXELS_PER_MINUTE * LETTER_SCALE;
+        maxBottom = Math.max(maxBottom, endPosition);
     });
     
     // Также учитываем специальные письма (подарок) для расчета максимальной нижней границы
@@ -469,181 +619,146 @@ function renderLetters() {
     const halfHeight = calculatedHeight / 2;
     tableSurface.style.minHeight = `${halfHeight}px`;
     tableSurface.style.height = `${halfHeight}px`;
+    
+    updateLetterWindows();
 }
 
-// Группировка писем по наложению временных интервалов
-// Если письма накладываются (пересекаются по времени), они группируются вместе
-// Две колонки (a и b) идут параллельно и независимо
-function groupLettersByStartTime() {
-    const groups = [];
-    const processed = new Set();
-    
-    // Функция для проверки наложения двух писем
-    function lettersOverlap(letter1, letter2) {
-        const start1 = parseDateTimeStr(letter1.start_datetime_str);
-        const end1 = parseDateTimeStr(letter1.end_datetime_str);
-        const start2 = parseDateTimeStr(letter2.start_datetime_str);
-        const end2 = parseDateTimeStr(letter2.end_datetime_str);
-        
-        if (!start1 || !end1 || !start2 || !end2) return false;
-        
-        // Проверяем пересечение интервалов (даже минимальное наложение)
-        // Интервалы пересекаются, если start1 < end2 И start2 < end1
-        return start1.getTime() < end2.getTime() && start2.getTime() < end1.getTime();
+// Письмо на столе по готовому прямоугольнику раскладки (минуты переводим в пиксели)
+function renderLetterBox(letter) {
+    const tableSurface = document.getElementById('table-surface');
+    const box = layoutBoxesById.get(letter.id);
+    if (!tableSurface || !box || letterElements.has(letter.id)) return;
+    
+    const height = Math.max(MIN_LETTER_HEIGHT, box.height_minutes * PIXELS_PER_MINUTE);
+    // Для письма "Дачная Суета!" (id="1a") используем максимальный наклон 1%, для остальных - 7%
+    const maxRotation = letter.id === '1a' ? 1 : RANDOM_ROTATION_MAX;
+    const rotation = (Math.random() - 0.5) * 2 * maxRotation;
+    
+    // Верх письма на времени начала
+    let top = box.start_minutes * PIXELS_PER_MINUTE * LETTER_SCALE;
+    let className = 'single';
+    if (box.lane === 'left') {
+        className = 'double left';
+        // Левое письмо в паре делаем немного выше (смещаем вверх на 30px)
+        if (box.paired_with) {
+            top -= 30;
+        }
+    } else if (box.lane === 'right') {
+        className = 'double right';
     }
     
-    // Сортируем все письма по времени начала
-    const sortedLetters = [...lettersData].sort((a, b) => {
-        const timeA = parseDateTimeStr(a.start_datetime_str);
-        const timeB = parseDateTimeStr(b.start_datetime_str);
-        return timeA - timeB;
+    const letterEl = createLetterElement(letter, className, top, height, rotation);
+    tableSurface.appendChild(letterEl);
+    letterElements.set(letter.id, letterEl);
+}
+
+// Добавление писем, пришедших в окне, на стол
+function addWindowLetters(letterWindow, letters) {
+    letters.forEach(letter => {
+        letterWindow.ids.add(letter.id);
+        loadedLetters.set(letter.id, letter);
+        renderLetterBox(letter);
     });
+}
+
+// Подгрузка окон писем вокруг ползунка после паузы в скролле
+function scheduleLetterWindowsUpdate() {
+    clearTimeout(letterWindowsTimer);
+    letterWindowsTimer = setTimeout(updateLetterWindows, LETTER_WINDOWS_DELAY_MS);
+}
+
+// Загружает окна рядом с выбранным временем и выгружает далекие
+function updateLetterWindows() {
+    if (!minTime || !layoutData || inspectionMode) return;
     
-    // Логика группировки: две колонки (a и b) постоянные
-    // Для каждого события из колонки 'a' проверяем весь его временной промежуток (от начала до конца)
-    // Если в этом промежутке есть хотя бы одно событие из колонки 'b' - показываем узкими
-    // Колонка 'a' слева (узкая, если есть наложение), колонка 'b' справа (всегда узкая)
-    // Если событие из колонки 'a' не накладывается ни с одним событием из 'b' - оно широкое по центру
-    
-    // Сначала определяем, какие письма из 'a' имеют наложение с любым письмом из 'b'
-    const aHasOverlap = new Map(); // letter.id -> true/false
+    const windowMs = LETTER_WINDOW_MINUTES * 60 * 1000;
+    const current = Math.floor(((selectedTime || minTime) - minTime) / windowMs);
+    const lastWindow = Math.floor(Math.max(totalMinutes, layoutData.total_minutes) / LETTER_WINDOW_MINUTES);
     
-    sortedLetters.forEach(letter => {
-        if (!letter.id.endsWith('a')) return;
-        
-        const letterStart = parseDateTimeStr(letter.start_datetime_str);
-        const letterEnd = parseDateTimeStr(letter.end_datetime_str);
-        if (!letterStart || !letterEnd) {
-            aHasOverlap.set(letter.id, false);
-            return;
+    for (let k = current - LETTER_WINDOWS_AROUND; k <= current + LETTER_WINDOWS_AROUND; k++) {
+        if (k >= 0 && k <= lastWindow) {
+            loadLetterWindow(k);
         }
-        
-        // Проверяем наложение с ЛЮБЫМ письмом из 'b' (независимо от порядка обработки)
-        const hasOverlap = sortedLetters.some(otherLetter => {
-            if (!otherLetter.id.endsWith('b')) return false;
-            
-            const otherStart = parseDateTimeStr(otherLetter.start_datetime_str);
-            const otherEnd = parseDateTimeStr(otherLetter.end_datetime_str);
-            if (!otherStart || !otherEnd) return false;
-            
-            // Пересечение: otherStart < letterEnd И otherEnd > letterStart
-            return otherStart.getTime() < letterEnd.getTime() && otherEnd.getTime() > letterStart.getTime();
-        });
-        
-        aHasOverlap.set(letter.id, hasOverlap);
-    });
-    
-    // Теперь группируем письма, учитывая все наложения
-    sortedLetters.forEach(letter => {
-        if (processed.has(letter.id)) return;
-        
-        const letterColumn = letter.id.endsWith('a') ? 'a' : 'b';
-        const letterStart = parseDateTimeStr(letter.start_datetime_str);
-        const letterEnd = parseDateTimeStr(letter.end_datetime_str);
-        
-        if (!letterStart || !letterEnd) {
-            processed.add(letter.id);
-            groups.push({
-                timeKey: letter.start_datetime_str,
-                letters: [letter]
-            });
-            return;
+    }
+    for (const k of Array.from(letterWindows.keys())) {
+        if (k !== ALL_LETTERS_WINDOW && Math.abs(k - current) > LETTER_WINDOWS_KEEP) {
+            unloadLetterWindow(k);
         }
-        
-        if (letterColumn === 'a') {
-            const hasOverlap = aHasOverlap.get(letter.id) || false;
-            
-            if (hasOverlap) {
-                // Ищем первое непрочитанное письмо из 'b', которое пересекается
-                const overlappingB = sortedLetters.find(otherLetter => {
-                    if (!otherLetter.id.endsWith('b')) return false;
-                    if (processed.has(otherLetter.id)) return false;
-                    
-                    const otherStart = parseDateTimeStr(otherLetter.start_datetime_str);
-                    const otherEnd = parseDateTimeStr(otherLetter.end_datetime_str);
-                    if (!otherStart || !otherEnd) return false;
-                    
-                    return otherStart.getTime() < letterEnd.getTime() && otherEnd.getTime() > letterStart.getTime();
-                });
-                
-                if (overlappingB) {
-                    // Группируем вместе
-                    const group = [letter, overlappingB];
-                    group.sort((a, b) => {
-                        const colA = a.id.endsWith('a') ? 'a' : 'b';
-                        const colB = b.id.endsWith('a') ? 'a' : 'b';
-                        if (colA === colB) return a.id.localeCompare(b.id);
-                        return colA === 'a' ? -1 : 1;
-                    });
-                    
-                    processed.add(letter.id);
-                    processed.add(overlappingB.id);
-                    
-                    groups.push({
-                        timeKey: group[0].start_datetime_str,
-                        letters: group
-                    });
-                } else {
-                    // Нет непрочитанного наложения, но наложение есть - показываем отдельно узким
-                    // Добавляем флаг hasOverlap, чтобы при рендеринге оно было узким
-                    processed.add(letter.id);
-                    groups.push({
-                        timeKey: letter.start_datetime_str,
-                        letters: [letter],
-                        hasOverlap: true // Флаг для узкого отображения
-                    });
-                }
-            } else {
-                // Нет наложения - широкое письмо по центру
-                processed.add(letter.id);
-                groups.push({
-                    timeKey: letter.start_datetime_str,
-                    letters: [letter]
-                });
-            }
-        } else {
-            // Колонка 'b' - ищем непрочитанное письмо из 'a' с наложением
-            const overlappingA = sortedLetters.find(otherLetter => {
-                if (!otherLetter.id.endsWith('a')) return false;
-                if (processed.has(otherLetter.id)) return false;
-                
-                const hasOverlapForA = aHasOverlap.get(otherLetter.id);
-                if (!hasOverlapForA) return false;
-                
-                const otherStart = parseDateTimeStr(otherLetter.start_datetime_str);
-                const otherEnd = parseDateTimeStr(otherLetter.end_datetime_str);
-                if (!otherStart || !otherEnd) return false;
-                
-                return otherStart.getTime() < letterEnd.getTime() && otherEnd.getTime() > letterStart.getTime();
-            });
-            
-            if (overlappingA) {
-                // Группируем вместе (обработается в ветке 'a')
-                // Но если мы здесь, значит 'a' уже должно быть обработано - показываем отдельно
-                processed.add(letter.id);
-                groups.push({
-                    timeKey: letter.start_datetime_str,
-                    letters: [letter]
-                });
-            } else {
-                // Нет наложения - показываем отдельно (узким, так как 'b' всегда узкая)
-                processed.add(letter.id);
-                groups.push({
-                    timeKey: letter.start_datetime_str,
-                    letters: [letter]
-                });
+    }
+}
+
+// Граница окна в формате API: "ДД.ММ ЧЧ:ММ"
+function formatWindowBound(dt) {
+    const formatted = formatDateTime(dt);
+    return `${formatted.date} ${formatted.time}`;
+}
+
+// Загрузка окна k: письма, пересекающие [minTime + k * окно, minTime + (k + 1) * окно)
+function loadLetterWindow(k) {
+    if (letterWindows.has(k)) return;
+    const letterWindow = { ids: new Set() };
+    letterWindows.set(k, letterWindow);
+    
+    const windowMs = LETTER_WINDOW_MINUTES * 60 * 1000;
+    const from = new Date(minTime.getTime() + k * windowMs);
+    const to = new Date(from.getTime() + windowMs);
+    const params = `from=${encodeURIComponent(formatWindowBound(from))}&to=${encodeURIComponent(formatWindowBound(to))}`;
+    
+    // Страницы окна идут по next_cursor, пока сервер его возвращает
+    const loadPage = (cursor) => fetch(`${BASE_PATH}/api/letters?${params}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''}`)
+        .then(response => {
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            return response.json();
+        })
+        .then(data => {
+            // Окно могли выгрузить, пока шел запрос
+            if (letterWindows.get(k) !== letterWindow) return;
+            addWindowLetters(letterWindow, data.letters);
+            if (data.next_cursor) {
+                return loadPage(data.next_cursor);
             }
+        });
+    
+    loadPage(null).catch(error => {
+        console.error('Ошибка загрузки окна писем:', error);
+        // Забываем окно, чтобы следующая прокрутка запросила его заново
+        if (letterWindows.get(k) === letterWindow) {
+            letterWindows.delete(k);
         }
     });
-    
-    // Сортируем группы по времени начала первой буквы
-    groups.sort((a, b) => {
-        const timeA = parseDateTimeStr(a.timeKey);
-        const timeB = parseDateTimeStr(b.timeKey);
-        return timeA - timeB;
+}
+
+// Выгрузка окна: убираем письма, которые не входят ни в одно оставшееся окно
+function unloadLetterWindow(k) {
+    const letterWindow = letterWindows.get(k);
+    if (!letterWindow) return;
+    letterWindows.delete(k);
+    
+    letterWindow.ids.forEach(id => {
+        for (const other of letterWindows.values()) {
+            if (other.ids.has(id)) return;
+        }
+        const letterEl = letterElements.get(id);
+        if (letterEl) letterEl.remove();
+        letterElements.delete(id);
+        loadedLetters.delete(id);
+        letterDetailsCache.delete(id);
     });
-    
-    return groups;
+}
+
+// Загрузка всех писем сразу (режим осмотра показывает весь список)
+function loadAllLetters() {
+    if (letterWindows.has(ALL_LETTERS_WINDOW)) return Promise.resolve();
+    return fetch(`${BASE_PATH}/api/letters`)
+        .then(response => response.json())
+        .then(data => {
+            const letterWindow = { ids: new Set() };
+            letterWindows.set(ALL_LETTERS_WINDOW, letterWindow);
+            addWindowLetters(letterWindow, data.letters);
+        })
+        .catch(error => {
+            console.error('Ошибка загрузки писем:', error);
+        });
 }
 
 // Создание элемента письма
@@ -908,6 +1023,7 @@ function updateTimeFromSlider(percent, skipScroll = false) {
     
     // Показываем точное время на циферблате
     updateClockDisplay(selectedTime);
+    scheduleLetterWindowsUpdate();
     
     // Прокручиваем только если пользователь перемещает ползунок (не при автообновлении из скролла)
     if (!skipScroll) {
@@ -1132,29 +1248,9 @@ function goToCurrentTime() {
     }, 100);
 }
 
-// Обновление текущего времени
+// Обновление текущего времени по синхронизированным часам
 function updateCurrentTime() {
-    fetch('/api/current_time')
-        .then(response => response.json())
-        .then(data => {
-            // Парсим текущее время из строки "DD.MM HH:MM"
-            const parts = data.time.split(' ');
-            if (parts.length === 2) {
-                const datePart = parts[0].split('.');
-                const timePart = parts[1].split(':');
-                if (datePart.length === 2 && timePart.length === 2) {
-                    const day = parseInt(datePart[0]);
-                    const month = parseInt(datePart[1]);
-                    const hour = parseInt(timePart[0]);
-                    const minute = parseInt(timePart[1]);
-                    const year = month === 12 ? 2024 : 2025;
-                    currentTime = new Date(year, month - 1, day, hour, minute);
-                }
-            }
-        })
-        .catch(error => {
-            console.error('Ошибка получения времени:', error);
-        });
+    currentTime = scheduleDateFromServerTime(serverNow());
 }
 
 // Установка ползунка на текущее время
@@ -1174,35 +1270,19 @@ function openLetterModal(letter) {
     const modal = document.getElementById('letter-modal');
     if (!modal) return;
     
+    // Письма из загруженных окон уже содержат все детали
+    const cached = letterDetailsCache.get(letter.id) || loadedLetters.get(letter.id);
+    if (cached) {
+        showLetterDetails(cached);
+        return;
+    }
+    
     // Получаем полную информацию о письме через API
-    fetch(`/api/letter/${letter.id}`)
+    fetch(`${BASE_PATH}/api/letter/${letter.id}`)
         .then(response => response.json())
         .then(fullLetter => {
-            document.getElementById('modal-image').textContent = fullLetter.image || '📄';
-            document.getElementById('modal-title').textContent = fullLetter.title;
-            document.getElementById('modal-date').textContent = fullLetter.date;
-            document.getElementById('modal-start').textContent = fullLetter.start_time;
-            
-            // Форматируем продолжительность
-            const duration = fullLetter.duration || '-';
-            document.getElementById('modal-duration').textContent = duration;
-            
-            // Форматируем время окончания
-            let endTime = '-';
-            if (fullLetter.end_time && fullLetter.end_time !== '-') {
-                endTime = fullLetter.end_time;
-            } else if (fullLetter.end_datetime_str) {
-                const endDt = parseDateTimeStr(fullLetter.end_datetime_str);
-                if (endDt) {
-                    const formatted = formatDateTime(endDt);
-                    endTime = formatted.time;
-                }
-            }
-            document.getElementById('modal-end').textContent = endTime;
-            
-            document.getElementById('modal-description').textContent = fullLetter.description || '';
-            
-            modal.classList.add('active');
+            letterDetailsCache.set(fullLetter.id, fullLetter);
+            showLetterDetails(fullLetter);
         })
         .catch(error => {
             console.error('Ошибка загрузки деталей письма:', error);
@@ -1218,6 +1298,36 @@ function openLetterModal(letter) {
         });
 }
 
+// Заполнение модального окна деталями письма
+function showLetterDetails(fullLetter) {
+    const modal = document.getElementById('letter-modal');
+    document.getElementById('modal-image').textContent = fullLetter.image || '📄';
+    document.getElementById('modal-title').textContent = fullLetter.title;
+    document.getElementById('modal-date').textContent = fullLetter.date;
+    document.getElementById('modal-start').textContent = fullLetter.start_time;
+    
+    // Форматируем продолжительность
+    const duration = fullLetter.duration || '-';
+    document.getElementById('modal-duration').textContent = duration;
+    
+    // Форматируем время окончания
+    let endTime = '-';
+    if (fullLetter.end_time && fullLetter.end_time !== '-') {
+        endTime = fullLetter.end_time;
+    } else if (fullLetter.end_datetime_str) {
+        const endDt = parseDateTimeStr(fullLetter.end_datetime_str);
+        if (endDt) {
+            const formatted = formatDateTime(endDt);
+            endTime = formatted.time;
+        }
+    }
+    document.getElementById('modal-end').textContent = endTime;
+    
+    document.getElementById('modal-description').textContent = fullLetter.description || '';
+    
+    modal.classList.add('active');
+}
+
 // Закрытие модального окна
 function closeLetterModal() {
     const modal = document.getElementById('letter-modal');
@@ -1244,50 +1354,10 @@ function toggleInspectionMode() {
     if (!tableSurface) return;
     
     if (inspectionMode) {
-        // Включаем режим осмотра
-        // Сохраняем исходные позиции и свойства писем
-        originalLetterPositions = [];
-        const letters = tableSurface.querySelectorAll('.letter');
-        letters.forEach(letterEl => {
-            const letterId = letterEl.dataset.letterId;
-            const letter = letterId ? lettersData.find(l => l.id === letterId) : null;
-            
-            // Сохраняем оригинальное содержимое
-            const originalHTML = letterEl.innerHTML;
-            
-            originalLetterPositions.push({
-                element: letterEl,
-                top: letterEl.style.top,
-                left: letterEl.style.left,
-                height: letterEl.style.height,
-                width: letterEl.style.width,
-                transform: letterEl.style.transform,
-                transformOrigin: letterEl.style.transformOrigin,
-                rotation: letterEl.dataset.rotation,
-                className: letterEl.className,
-                innerHTML: originalHTML // Сохраняем оригинальное содержимое
-            });
+        // Для осмотра нужны все письма, а не только загруженные окна
+        loadAllLetters().then(() => {
+            if (inspectionMode) enterInspectionMode(tableSurface, timeScaleContainer, btnInspect);
         });
-        
-        // Скрываем временную шкалу
-        if (timeScaleContainer) {
-            timeScaleContainer.classList.add('hidden');
-        }
-        
-        // Меняем стиль кнопки
-        if (btnInspect) {
-            btnInspect.classList.add('active');
-            btnInspect.textContent = '📋 Сортировка писем';
-        }
-        
-        // Применяем режим осмотра к письмам
-        applyInspectionMode();
-        
-        // Прокручиваем к верху страницы
-        const tableContainer = document.getElementById('table-container');
-        if (tableContainer) {
-            tableContainer.scrollTop = 0;
-        }
     } else {
         // Выключаем режим осмотра - возвращаем все обратно
         // Показываем временную шкалу
@@ -1334,6 +1404,58 @@ function toggleInspectionMode() {
         });
         
         originalLetterPositions = [];
+        
+        // Письма, загруженные только для осмотра, снова живут окнами
+        unloadLetterWindow(ALL_LETTERS_WINDOW);
+        updateLetterWindows();
+    }
+}
+
+// Включение режима осмотра (все письма уже на столе)
+function enterInspectionMode(tableSurface, timeScaleContainer, btnInspect) {
+    // Включаем режим осмотра
+    // Сохраняем исходные позиции и свойства писем
+    originalLetterPositions = [];
+    const letters = tableSurface.querySelectorAll('.letter');
+    letters.forEach(letterEl => {
+        const letterId = letterEl.dataset.letterId;
+        const letter = letterId ? loadedLetters.get(letterId) : null;
+        
+        // Сохраняем оригинальное содержимое
+        const originalHTML = letterEl.innerHTML;
+        
+        originalLetterPositions.push({
+            element: letterEl,
+            top: letterEl.style.top,
+            left: letterEl.style.left,
+            height: letterEl.style.height,
+            width: letterEl.style.width,
+            transform: letterEl.style.transform,
+            transformOrigin: letterEl.style.transformOrigin,
+            rotation: letterEl.dataset.rotation,
+            className: letterEl.className,
+            innerHTML: originalHTML // Сохраняем оригинальное содержимое
+        });
+    });
+    
+    // Скрываем временную шкалу
+    if (timeScaleContainer) {
+        timeScaleContainer.classList.add('hidden');
+    }
+    
+    // Меняем стиль кнопки
+    if (btnInspect) {
+        btnInspect.classList.add('active');
+        btnInspect.textContent = '📋 Сортировка писем';
+    }
+    
+    // Применяем режим осмотра к письмам
+    applyInspectionMode();
+    
+    // Прокручиваем к верху страницы
+    const tableContainer = document.getElementById('table-container');
+    if (tableContainer) {
+        tableContainer.scrollTop = 0;
     }
 }
 
@@ -1359,7 +1481,7 @@ function applyInspectionMode() {
         if (!letterId) return;
         
         // Находим данные письма
-        const letter = lettersData.find(l => l.id === letterId);
+        const letter = loadedLetters.get(letterId);
         if (!letter) return;
         
         // Заменяем содержимое письма на простое (время и название, печатным шрифтом)
@@ -1510,7 +1632,7 @@ function applyInspectionMode() {
 
 // Переход на страницу почтового ящика
 function goToMailbox() {
-    window.location.href = '/';
+    window.location.href = `${BASE_PATH}/`;
 }
 
 // Экспорт функций для глобального доступа
@@ -0,0 +1,210 @@
+// Service worker офлайн-режима
+// Кэширует все, что перечислено в манифесте предзагрузки
+// (<scope>offline-manifest.json): страницы, статику и полный список писем
+// с хэшами содержимого. Манифест проверяется при установке и при открытии
+// страниц (не чаще раза в MANIFEST_CHECK_MS): если его версия прежняя,
+// ничего не скачивается, иначе скачиваются только записи с новым хэшем.
+// Окна писем (/api/letters?from=&to=) и детали письма (/api/letter/<id>)
+// собираются из закэшированного списка, поэтому после первого визита
+// страница, письма и модальные окна работают без запросов к серверу
+
+const SCOPE_PATH = new URL(self.registration.scope).pathname; // "/" или "/p/<plan_id>/"
+const BASE_PATH = SCOPE_PATH.replace(/\/$/, '');
+const MANIFEST_URL = `${SCOPE_PATH}offline-manifest.json`;
+const LETTERS_URL = `${BASE_PATH}/api/letters`;
+const LETTER_PREFIX = `${BASE_PATH}/api/letter/`;
+const CACHE_PREFIX = 'newyear-precache-';
+const CACHE_NAME = `${CACHE_PREFIX}v1:${SCOPE_PATH}`;
+const FONT_CACHE_NAME = 'newyear-fonts';
+const FONT_HOSTS = new Set(['fonts.googleapis.com', 'fonts.gstatic.com']);
+const MANIFEST_CHECK_MS = 60 * 1000;
+// Адреса, которые отдаются из кэша; остальные запросы идут в сеть как обычно
+const OFFLINE_PATHS = new Set([`${BASE_PATH}/`, `${BASE_PATH}/letters`, `${BASE_PATH}/api/initial`, LETTERS_URL]);
+
+let lastManifestCheck = 0;
+let syncing = null;
+let letterBundle = null; // Разобранный список писем: { etag, version, letters, byId }
+
+self.addEventListener('install', event => {
+    event.waitUntil(syncPrecache().then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    // Кэши прежних форматов этого же scope больше не нужны
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names
+                .filter(name => name.startsWith(CACHE_PREFIX) && name.endsWith(`:${SCOPE_PATH}`) && name !== CACHE_NAME)
+                .map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+// Страница сообщает, что расписание изменилось (см. reloadAllLetters)
+self.addEventListener('message', event => {
+    if (event.data === 'sync-precache') {
+        event.waitUntil(syncPrecache().catch(() => {}));
+    }
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+    if (FONT_HOSTS.has(url.hostname)) {
+        event.respondWith(fromFontCache(request));
+        return;
+    }
+    if (url.origin !== self.location.origin || !isOfflinePath(url.pathname)) return;
+    if (request.mode === 'navigate' && Date.now() - lastManifestCheck > MANIFEST_CHECK_MS) {
+        // Манифест проверяется в фоне: страница открывается из кэша сразу
+        event.waitUntil(syncPrecache().catch(() => {}));
+    }
+    event.respondWith(respond(request, url));
+});
+
+function isOfflinePath(pathname) {
+    return OFFLINE_PATHS.has(pathname) || pathname.startsWith('/assets/') || pathname.startsWith(LETTER_PREFIX);
+}
+
+// Одна проверка манифеста за раз
+function syncPrecache() {
+    if (!syncing) {
+        syncing = updatePrecache().finally(() => {
+            syncing = null;
+        });
+    }
+    return syncing;
+}
+
+async function updatePrecache() {
+    lastManifestCheck = Date.now();
+    const response = await fetch(MANIFEST_URL, { cache: 'no-store' });
+    if (!response.ok) throw new Error(`${MANIFEST_URL}: HTTP ${response.status}`);
+    const manifest = await response.clone().json();
+    const cache = await caches.open(CACHE_NAME);
+    const stored = await cache.match(MANIFEST_URL);
+    const previous = stored ? await stored.json() : { version: null, entries: [] };
+    if (previous.version === manifest.version) return;
+
+    const known = new Map(previous.entries.map(entry => [entry.url, entry.revision]));
+    const changed = [];
+    for (const entry of manifest.entries) {
+        if (known.get(entry.url) !== entry.revision || !(await cache.match(entry.url))) {
+            changed.push(entry);
+        }
+    }
+    // Сначала скачиваем все изменившееся и только потом кладем в кэш: при
+    // обрыве сети в кэше целиком остается прежняя версия
+    const fetched = await Promise.all(changed.map(async entry => {
+        const entryResponse = await fetch(entry.url, { cache: 'no-cache' });
+        if (!entryResponse.ok) throw new Error(`${entry.url}: HTTP ${entryResponse.status}`);
+        return [entry.url, entryResponse];
+    }));
+    await Promise.all(fetched.map(([entryUrl, entryResponse]) => cache.put(entryUrl, entryResponse)));
+    const current = new Set(manifest.entries.map(entry => entry.url));
+    await Promise.all(previous.entries
+        .filter(entry => !current.has(entry.url))
+        .map(entry => cache.delete(entry.url)));
+    await cache.put(MANIFEST_URL, response);
+}
+
+async function respond(request, url) {
+    const cache = await caches.open(CACHE_NAME);
+    // Явная перепроверка (cache: 'no-cache') идет в сеть, кэш - запасной вариант
+    if (request.cache === 'no-cache' || request.cache === 'reload') {
+        try {
+            return await fetch(request);
+        } catch (error) {
+            const cached = await cache.match(url.pathname + url.search);
+            if (cached) return cached;
+            throw error;
+        }
+    }
+    const cached = await cache.match(url.pathname + url.search);
+    if (cached) return cached;
+    const built = await fromLetterBundle(cache, url);
+    if (built) return built;
+    return fetch(request);
+}
+
+// Ответы API писем из закэшированного полного списка; null - пусть отвечает сервер
+async function fromLetterBundle(cache, url) {
+    const params = url.searchParams;
+    const isWindow = url.pathname === LETTERS_URL && (params.has('from') || params.has('to')) && !params.has('cursor');
+    if (!isWindow && !url.pathname.startsWith(LETTER_PREFIX)) return null;
+    const bundle = await loadLetterBundle(cache);
+    if (!bundle) return null;
+
+    if (!isWindow) {
+        const letter = bundle.byId.get(decodeURIComponent(url.pathname.slice(LETTER_PREFIX.length)));
+        return letter ? jsonResponse(letter) : null;
+    }
+    // Как letters_window_response: письма, пересекающие [from, to); письмо
+    // нулевой длины занимает минуту [start, start + 1)
+    const from = params.has('from') ? parseScheduleMinutes(params.get('from')) : null;
+    const to = params.has('to') ? parseScheduleMinutes(params.get('to')) : null;
+    if (Number.isNaN(from) || Number.isNaN(to)) return null;
+    const letters = bundle.letters
+        .filter(item => (to === null || item.start < to) && (from === null || Math.max(item.end, item.start + 1) > from))
+        .map(item => item.letter);
+    return jsonResponse({
+        letters,
+        from: params.get('from'),
+        to: params.get('to'),
+        next_cursor: null,
+        version: bundle.version
+    });
+}
+
+async function loadLetterBundle(cache) {
+    const response = await cache.match(LETTERS_URL);
+    if (!response) return null;
+    const etag = response.headers.get('ETag');
+    if (letterBundle && letterBundle.etag === etag) return letterBundle;
+
+    const data = await response.json();
+    const stored = await cache.match(MANIFEST_URL);
+    const manifest = stored ? await stored.json() : {};
+    const letters = data.letters
+        .map(letter => ({
+            letter,
+            start: parseScheduleMinutes(letter.start_datetime_str),
+            end: parseScheduleMinutes(letter.end_datetime_str)
+        }))
+        .sort((a, b) => a.start - b.start);
+    letterBundle = {
+        etag,
+        version: manifest.schedule_version || null,
+        letters,
+        byId: new Map(data.letters.map(letter => [letter.id, letter]))
+    };
+    return letterBundle;
+}
+
+// "ДД.ММ ЧЧ:ММ" -> минуты от эпохи (год как в parse_datetime: декабрь - 2024,
+// остальное - 2025); NaN для строки в другом формате
+function parseScheduleMinutes(value) {
+    const match = /^(\d{2})\.(\d{2}) (\d{2}):(\d{2})$/.exec(value || '');
+    if (!match) return NaN;
+    const [, day, month, hour, minute] = match.map(Number);
+    return Date.UTC(month === 12 ? 2024 : 2025, month - 1, day, hour, minute) / 60000;
+}
+
+function jsonResponse(payload) {
+    return new Response(JSON.stringify(payload) + '\n', {
+        headers: { 'Content-Type': 'application/json' }
+    });
+}
+
+// Шрифты Google: кэш при первом запросе, дальше - без сети
+async function fromFontCache(request) {
+    const cache = await caches.open(FONT_CACHE_NAME);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+    const response = await fetch(request);
+    if (response.ok || response.type === 'opaque') {
+        cache.put(request, response.clone());
+    }
+    return response;
+}
@@ -0,0 +1,29 @@
+# Общие настройки тестов: модули проекта лежат плоско в project-for-github,
+# снимок расписания на диск в тестах не пишется
+
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+os.environ.setdefault("SCHEDULE_SNAPSHOT", "0")
+
+
+def make_variant(variant_id, date, start_time, duration="30 минут", end_time=None, **extra):
+    """Вариант расписания в том же виде, что и schedule["variants"]"""
+    variant = {
+        "id": variant_id,
+        "date": date,
+        "start_time": start_time,
+        "duration": duration,
+        "end_time": end_time if end_time is not None else start_time,
+        "title": extra.pop("title", f"Письмо {variant_id}"),
+        "description": extra.pop("description", ""),
+        "location": "",
+        "tv": "-",
+        "image": "📄",
+    }
+    variant.update(extra)
+    return variant
@@ -0,0 +1,14 @@
+from assets import minify_js
+
+NESTED_TEMPLATE = """\
+const label = `${count > 1 ? `писем:  ${names.map(n => `"${n}"`).join(", ")} // все` : '}'}`;  // итог
+/* комментарий */
+const next = { a: `}` };
+"""
+
+
+def test_nested_template_literal_is_kept_whole():
+    assert minify_js(NESTED_TEMPLATE) == (
+        'const label = `${count > 1 ? `писем:  ${names.map(n => `"${n}"`).join(", ")} // все` : \'}\'}`;\n'
+        "const next = { a: `}` };\n"
+    )
@@ -0,0 +1,37 @@
+import random
+
+import pytest
+
+import columnar
+from columnar import ColumnarSchedule, vector_chunks
+
+np = pytest.importorskip("numpy")
+
+
+def skewed_limits(count, early=64, moments=10_000):
+    """Длины префиксов: early ранних моментов, дальше моменты по всему расписанию"""
+    rng = random.Random(1)
+    return np.array(sorted([1] * early + [rng.randrange(count) for _ in range(moments)]))
+
+
+@pytest.mark.parametrize("max_cells", [1024, 8 * 1024 * 1024])
+def test_chunks_stay_within_cell_budget(max_cells):
+    limits = skewed_limits(200_000)
+    covered = 0
+    for position, rows, width in vector_chunks(limits, max_cells):
+        assert position == covered
+        assert width == max(1, limits[position + rows - 1])
+        # Шире бюджета может быть только шаг из одной строки
+        assert rows * width <= max_cells or rows == 1
+        covered += rows
+    assert covered == len(limits)
+
+
+def test_active_slots_many_with_small_budget(monkeypatch):
+    monkeypatch.setattr(columnar, "VECTOR_CHUNK_CELLS", 256)
+    rng = random.Random(4)
+    starts = sorted(rng.randrange(0, 600) for _ in range(500))
+    ends = [start + rng.choice([0, 15, 30, 240]) for start in starts]
+    columns = ColumnarSchedule(starts, ends, [f"{i}a" for i in range(500)], [""] * 500)
+    minutes = [0] * 64 + [rng.randrange(-10, 900) for _ in range(300)]
+    assert columns.active_slots_many(minutes) == [columns.active_slots(minute) for minute in minutes]
@@ -0,0 +1,65 @@
+import pytest
+
+import schedule_data
+from conftest import make_variant
+from export import ICS_LINE_OCTETS, _ics_escape, _ics_line
+
+
+@pytest.fixture
+def client():
+    from app import app
+    original = schedule_data.schedule
+    yield app.test_client()
+    schedule_data.load_schedule(original)
+
+
+def unfold(data):
+    return data.replace(b"\r\n ", b"")
+
+
+@pytest.mark.parametrize("text", [
+    "SUMMARY:" + "а" * 100,
+    "DESCRIPTION:" + "🎆x" * 40,
+    "X:" + "a" * 72 + "я" * 3,
+])
+def test_fold_keeps_lines_short_and_characters_whole(text):
+    folded = _ics_line(text)
+    assert folded.endswith(b"\r\n")
+    for line in folded[:-2].split(b"\r\n"):
+        assert len(line) <= ICS_LINE_OCTETS
+        line.decode("utf-8")
+    assert unfold(folded).decode("utf-8") == text + "\r\n"
+
+
+def test_fold_only_long_lines():
+    assert _ics_line("a" * ICS_LINE_OCTETS) == b"a" * ICS_LINE_OCTETS + b"\r\n"
+    assert _ics_line("a" * (ICS_LINE_OCTETS + 1)) == b"a" * ICS_LINE_OCTETS + b"\r\n a\r\n"
+
+
+def test_escape_text_values():
+    assert _ics_escape("Салют; ёлка, торт\\подарки\nночь\r\nутро\rвечер") == \
+        "Салют\\; ёлка\\, торт\\\\подарки\\nночь\\nутро\\nвечер"
+
+
+def test_ics_export(client):
+    schedule_data.load_schedule({"cover": {}, "variants": [
+        make_variant("1a", "31.12", "23:30", duration="1 час", end_time="00:30", end_date="01.01",
+                     title="Куранты, тост; " + "салют " * 20, description="Строка 1\nСтрока 2"),
+        make_variant("2a", "01.01", "01:00", duration="-", end_time="-"),
+    ]})
+    response = client.get("/api/export.ics")
+    assert response.mimetype == "text/calendar"
+    lines = response.data.split(b"\r\n")
+    assert lines[-1] == b""
+    assert all(len(line) <= ICS_LINE_OCTETS for line in lines)
+
+    text = unfold(response.data).decode("utf-8")
+    assert text.count("BEGIN:VEVENT") == 2
+    assert "DTSTART:20241231T233000\r\nDTEND:20250101T003000\r\n" in text
+    assert "SUMMARY:📄 Куранты\\, тост\\; салют" in text
+    assert "DESCRIPTION:Строка 1\\nСтрока 2\r\n" in text
+    # Открытый последний вариант - без DTEND
+    assert text.split("BEGIN:VEVENT")[2].count("DTEND") == 0
+
+    etag = response.headers["ETag"]
+    assert client.get("/api/export.ics", headers={"If-None-Match": etag}).status_code == 304
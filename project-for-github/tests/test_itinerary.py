@@ -0,0 +1,107 @@
+import json
+import random
+from itertools import combinations
+
+import pytest
+
+from conftest import make_variant
+from itinerary import ItineraryPlanner, parse_weights
+from schedule_data import ScheduleIndex
+
+
+def plan_payload(index, weights=None):
+    body, _ = ItineraryPlanner(index).plan(weights or {})
+    return json.loads(body)
+
+
+def brute_force_best(index, weights):
+    """Наибольший суммарный вес набора писем a/b без наложений - перебором"""
+    letters = []
+    for slot, variant in enumerate(index.variants):
+        if index.ends[slot] is None or variant.get("special") or variant["id"][-1:] not in ("a", "b"):
+            continue
+        start, end = index.columns.starts[slot], index.columns.ends[slot]
+        letters.append((start, end, max(1, end - start) * weights.get(variant["id"], 1)))
+    best = 0
+    for size in range(len(letters) + 1):
+        for chosen in combinations(sorted(letters), size):
+            if all(chosen[i][1] <= chosen[i + 1][0] for i in range(len(chosen) - 1)):
+                best = max(best, sum(weight for _, _, weight in chosen))
+    return best
+
+
+def test_zero_length_letters_do_not_hang():
+    index = ScheduleIndex([
+        make_variant("1a", "31.12", "20:00", duration="-", end_time="20:00"),
+        make_variant("2b", "31.12", "20:00", duration="-", end_time="20:00"),
+        make_variant("3a", "31.12", "20:00", duration="30 минут", end_time="20:30"),
+    ])
+    payload = plan_payload(index)
+    ids = [letter["id"] for letter in payload["letters"]]
+    assert sorted(ids) == ["1a", "2b", "3a"]
+    assert payload["total_weight"] == brute_force_best(index, {})
+
+
+def test_matches_brute_force_on_small_schedules():
+    rng = random.Random(7)
+    durations = [("-", 0), ("15 минут", 15), ("30 минут", 30), ("1 час", 60), ("1.5 часа", 90)]
+    for _ in range(40):
+        variants = []
+        for i in range(rng.randint(1, 9)):
+            minute = 18 * 60 + 15 * rng.randrange(12)
+            duration, length = rng.choice(durations)
+            end = minute + length
+            variants.append(make_variant(
+                f"{i}{rng.choice('ab')}", "31.12", f"{minute // 60:02d}:{minute % 60:02d}",
+                duration=duration, end_time=f"{end // 60:02d}:{end % 60:02d}",
+            ))
+        index = ScheduleIndex(variants)
+        weights = {variant["id"]: rng.choice([0, 0.5, 1, 3]) for variant in variants if rng.random() < 0.5}
+        payload = plan_payload(index, weights)
+        assert abs(payload["total_weight"] - brute_force_best(index, weights)) < 1e-6
+
+        chosen = payload["letters"]
+        for previous, current in zip(chosen, chosen[1:]):
+            previous_end = index.columns.ends[index.slot_of(index.get_by_id(previous["id"]))]
+            current_start = index.columns.starts[index.slot_of(index.get_by_id(current["id"]))]
+            assert previous_end <= current_start
+
+
+def test_zero_weight_excludes_letter():
+    index = ScheduleIndex([
+        make_variant("1a", "31.12", "20:00", duration="1 час", end_time="21:00"),
+        make_variant("1b", "31.12", "20:00", duration="30 минут", end_time="20:30"),
+    ])
+    assert [letter["id"] for letter in plan_payload(index)["letters"]] == ["1a"]
+    assert [letter["id"] for letter in plan_payload(index, {"1a": 0})["letters"]] == ["1b"]
+
+
+def test_parse_weights():
+    assert parse_weights("12a:3,4b:0") == {"12a": 3.0, "4b": 0.0}
+    assert parse_weights("") == {}
+    assert parse_weights("12a:1e6") == {"12a": 1e6}
+    for bad in ("12a", ":3", "12a:-1", "12a:nan", "12a:x", "12a:1e308", "12a:inf"):
+        try:
+            parse_weights(bad)
+        except ValueError:
+            continue
+        raise AssertionError(bad)
+
+
+def test_non_finite_total_weight_is_rejected():
+    index = ScheduleIndex([
+        make_variant("1a", "31.12", "20:00", duration="30 минут", end_time="20:30"),
+        make_variant("2b", "31.12", "21:00", duration="30 минут", end_time="21:30"),
+    ])
+    planner = ItineraryPlanner(index)
+    with pytest.raises(ValueError):
+        planner.plan({"1a": 1e308, "2b": 1e308})
+    # Максимальные множители дают конечную сумму
+    payload = json.loads(planner.plan({"1a": 1e6, "2b": 1e6})[0])
+    assert payload["total_weight"] == 6e7
+
+
+def test_huge_multiplier_is_bad_request():
+    from app import app
+    response = app.test_client().get("/api/itinerary?weights=1a:1e308,2b:1e308")
+    assert response.status_code == 400
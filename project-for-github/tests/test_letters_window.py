@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+import schedule_data
+from benchmarks.synthetic import generate_schedule
+from columnar import OPEN_END, ColumnarSchedule
+from conftest import make_variant
+
+
+def brute_force_overlapping(columns, lo, hi):
+    return [
+        slot for slot, (start, end) in enumerate(zip(columns.starts, columns.ends))
+        if start < hi and max(end, start + 1) > lo
+    ]
+
+
+def test_overlapping_slots_match_half_open_windows():
+    rng = random.Random(3)
+    starts = sorted(rng.randrange(0, 300) for _ in range(200))
+    ends = [start + rng.choice([0, 0, 15, 30, 90]) for start in starts]
+    ends[-1] = OPEN_END
+    columns = ColumnarSchedule(starts, ends, [f"{i}a" for i in range(200)], [""] * 200)
+    for lo in range(-10, 320, 7):
+        for width in (1, 15, 60):
+            assert columns.overlapping_slots(lo, lo + width) == brute_force_overlapping(columns, lo, lo + width)
+
+
+def test_adjacent_windows_do_not_repeat_letters():
+    columns = ColumnarSchedule([0, 60, 60, 90], [60, 60, 120, 90], ["1a", "2a", "3a", "4a"], [""] * 4)
+    first = columns.overlapping_slots(0, 60)
+    second = columns.overlapping_slots(60, 120)
+    # Письмо до 60 - только в первом окне, письма нулевой длины - ровно в одном
+    assert first == [0]
+    assert second == [1, 2, 3]
+    assert columns.active_slots(60) == [2]
+
+
+@pytest.fixture
+def client():
+    from app import app
+    original = schedule_data.schedule
+    schedule_data.load_schedule(generate_schedule(400, seed=5))
+    yield app.test_client()
+    schedule_data.load_schedule(original)
+
+
+def test_cursor_pages_cover_window_once(client):
+    url = "/api/letters?from=31.12 20:00&to=01.01 01:00&limit=30"
+    full = client.get("/api/letters?from=31.12 20:00&to=01.01 01:00&limit=500").get_json()
+    pages = []
+    page = client.get(url).get_json()
+    pages.extend(page["letters"])
+    while page["next_cursor"]:
+        page = client.get(f"{url}&cursor={page['next_cursor']}").get_json()
+        pages.extend(page["letters"])
+    ids = [letter["id"] for letter in pages]
+    assert ids == [letter["id"] for letter in full["letters"]]
+    assert len(ids) == len(set(ids))
+
+
+def test_cursor_from_other_version_is_conflict(client):
+    page = client.get("/api/letters?from=31.12 20:00&limit=10").get_json()
+    schedule_data.load_schedule({"cover": {}, "variants": [make_variant("1a", "31.12", "20:00")]})
+    response = client.get(f"/api/letters?from=31.12 20:00&limit=10&cursor={page['next_cursor']}")
+    assert response.status_code == 409
+    assert client.get("/api/letters?from=31.12 20:00&cursor=x.1").status_code == 409
+    assert client.get("/api/letters?from=31-12&to=x").status_code == 400
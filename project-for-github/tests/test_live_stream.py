@@ -0,0 +1,133 @@
+import json
+from datetime import datetime, timedelta
+
+from conftest import make_variant
+from live_stream import stream_events
+from schedule_data import ScheduleIndex
+
+
+class FakeClock:
+    """Часы и sleep без ожидания: sleep просто сдвигает время"""
+
+    def __init__(self, now):
+        self.now = now
+        self.elapsed = 0.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += timedelta(seconds=seconds)
+        self.elapsed += seconds
+
+    def monotonic(self):
+        return self.elapsed
+
+
+def revisioned(variants, revision):
+    index = ScheduleIndex(variants)
+    index.revision = revision
+    return index
+
+
+def parse_event(chunk):
+    lines = chunk.strip().split("\n")
+    if not lines[0].startswith("event: "):
+        return None, None
+    return lines[0][len("event: "):], json.loads(lines[1][len("data: "):])
+
+
+def open_stream(get_index, fake):
+    return stream_events(get_index, tick_seconds=60, check_seconds=5,
+                         clock=fake.clock, sleep=fake.sleep, monotonic=fake.monotonic)
+
+
+def next_event(stream, wanted):
+    for chunk in stream:
+        event, data = parse_event(chunk)
+        if event == wanted:
+            return data
+    return None
+
+
+def test_stream_reports_schedule_on_connect_and_slots():
+    index = revisioned([make_variant("1a", "31.12", "20:00")], 3)
+    fake = FakeClock(datetime(2024, 12, 31, 19, 55))
+    stream = open_stream(lambda: index, fake)
+
+    assert next_event(stream, "schedule") == {"revision": 3, "version": index.version}
+    slot = next_event(stream, "slot")
+    assert slot["datetime_str"].endswith("20:00")
+    assert slot["active"] == ["1a"]
+
+
+def test_stream_follows_reloaded_schedule():
+    old = revisioned([make_variant("1a", "31.12", "20:00")], 3)
+    new = revisioned([make_variant("2a", "31.12", "20:10")], 4)
+    current = {"index": old}
+    fake = FakeClock(datetime(2024, 12, 31, 19, 55))
+    stream = open_stream(lambda: current["index"], fake)
+    assert next_event(stream, "schedule")["revision"] == 3
+
+    current["index"] = new
+    assert next_event(stream, "schedule") == {"revision": 4, "version": new.version}
+    # Граница 20:00 была только в старом расписании
+    slot = next_event(stream, "slot")
+    assert slot["datetime_str"].endswith("20:10")
+    assert slot["active"] == ["2a"]
+
+
+def test_reload_noticed_before_next_tick():
+    old = revisioned([make_variant("1a", "31.12", "23:00")], 3)
+    new = revisioned([make_variant("1a", "31.12", "23:00", title="Новое")], 4)
+    fake = FakeClock(datetime(2024, 12, 31, 19, 55))
+    # Расписание заменяется, пока поток спит (через 7 секунд после подключения)
+    stream = open_stream(lambda: new if fake.elapsed >= 7 else old, fake)
+    next_event(stream, "schedule")
+
+    assert next_event(stream, "schedule")["revision"] == 4
+    assert fake.elapsed <= 7 + 5
+
+
+def test_stream_ends_when_schedule_disappears():
+    index = revisioned([make_variant("1a", "31.12", "20:00")], 1)
+    current = {"index": index}
+    fake = FakeClock(datetime(2024, 12, 31, 19, 55))
+    stream = open_stream(lambda: current["index"], fake)
+    next_event(stream, "schedule")
+
+    current["index"] = None
+    assert list(stream) == []
+    assert list(open_stream(lambda: None, fake)) == []
+
+
+def test_stream_connections_are_capped(monkeypatch):
+    import live_stream
+    from app import app
+    client = app.test_client()
+    monkeypatch.setattr(live_stream, "STREAM_MAX_CONNECTIONS", 0)
+    assert client.get("/api/stream").status_code == 503
+    assert 'data-live-stream="0"' in client.get("/letters").get_data(as_text=True)
+
+    monkeypatch.setattr(live_stream, "STREAM_MAX_CONNECTIONS", 1)
+    first = client.get("/api/stream", buffered=False)
+    assert first.status_code == 200
+    assert next(first.response).startswith(b"retry:")
+    rejected = client.get("/api/stream")
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "300"
+
+    first.close()
+    assert live_stream.open_streams() == 0
+    second = client.get("/api/stream", buffered=False)
+    assert second.status_code == 200
+    second.close()
+
+
+def test_idle_stream_writes_keepalive_on_every_check():
+    index = revisioned([make_variant("1a", "31.12", "23:00")], 1)
+    fake = FakeClock(datetime(2024, 12, 31, 19, 55))
+    stream = open_stream(lambda: index, fake)
+    next_event(stream, "schedule")
+    assert next(stream) == ":\n\n"
+    assert fake.elapsed == 5
@@ -0,0 +1,84 @@
+import os
+import threading
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def multiproc_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    monkeypatch.setattr(metrics, "METRICS_MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "registry", metrics.MetricsRegistry())
+    monkeypatch.setattr(metrics, "_process_file", None)
+    return tmp_path
+
+
+def write_worker(pid, requests, started_ns=1):
+    registry = metrics.MetricsRegistry()
+    registry.inc("http_requests_total", metrics._labels(route="/", method="GET", status=200), requests)
+    registry.observe("http_request_duration_seconds", metrics._labels(route="/"), 0.002, metrics.LATENCY_BUCKETS)
+    path = os.path.join(metrics.METRICS_MULTIPROC_DIR, f"metrics-{pid}-{started_ns}.json")
+    metrics._write_json(path, registry.snapshot())
+
+
+def total_requests():
+    counters, _, _ = metrics._merge(metrics._collect())
+    return sum(value for (name, _), value in counters.items() if name == "http_requests_total")
+
+
+def test_dead_workers_are_archived_and_counters_do_not_decrease(multiproc_dir):
+    write_worker(101, 5)
+    write_worker(102, 7)
+    assert total_requests() == 12
+
+    metrics.archive_worker(101)
+    assert not os.path.exists(multiproc_dir / "metrics-101-1.json")
+    assert total_requests() == 12
+
+    # Новый воркер получил тот же pid: файл у него свой, старые счетчики - в архиве
+    write_worker(101, 1, started_ns=2)
+    assert total_requests() == 13
+    metrics.archive_worker(101)
+    metrics.archive_worker(102)
+    assert total_requests() == 13
+    assert 'http_request_duration_seconds_count{route="/"} 3' in metrics.render_metrics()
+
+
+def test_worker_file_archived_but_not_yet_removed_is_counted_once(multiproc_dir):
+    write_worker(201, 4)
+    metrics.archive_worker(201)
+    # Воркер успел записать файл заново, пока мастер архивировал (файл в списке архива)
+    write_worker(201, 4)
+    assert total_requests() == 4
+
+
+def test_reset_removes_previous_run(multiproc_dir):
+    write_worker(301, 3)
+    metrics.archive_worker(301)
+    write_worker(302, 2)
+    metrics.reset_multiproc_dir()
+    assert os.listdir(multiproc_dir) == []
+    assert total_requests() == 0
+
+
+def test_concurrent_writes_do_not_share_temp_file(multiproc_dir):
+    path = str(multiproc_dir / "metrics-1-1.json")
+    errors = []
+
+    def write(value):
+        try:
+            for _ in range(200):
+                metrics._write_json(path, {"value": value})
+        except OSError as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write, args=(value,)) for value in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert metrics._read_json(path)["value"] in range(4)
+    assert [entry.name for entry in multiproc_dir.iterdir()] == ["metrics-1-1.json"]
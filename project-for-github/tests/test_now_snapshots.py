@@ -0,0 +1,47 @@
+import pytest
+
+import now_snapshots
+from benchmarks.synthetic import generate_schedule
+from now_snapshots import NowSnapshots, build_now_letter
+from schedule_data import ScheduleIndex, format_datetime
+
+
+@pytest.fixture
+def app_context():
+    from app import app
+    with app.app_context():
+        yield app
+
+
+def full_body(app, index, position):
+    since = index.boundaries[position - 1] if position > 0 else None
+    until = index.boundaries[position] if position < len(index.boundaries) else None
+    payload = {
+        "version": index.version,
+        "since": format_datetime(since) if since else None,
+        "until": format_datetime(until) if until else None,
+        "letters": [build_now_letter(index, v) for v in (index.available_at(since) if since else [])],
+    }
+    return (app.json.dumps(payload, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def test_bodies_match_full_serialization_and_stay_bounded(app_context, monkeypatch):
+    monkeypatch.setattr(now_snapshots, "NOW_BODY_CACHE_INTERVALS", 4)
+    index = ScheduleIndex(generate_schedule(300, seed=2)["variants"])
+    snapshots = NowSnapshots(index)
+    moments = [index.boundaries[0].replace(hour=0)] + list(index.boundaries)
+    for position, moment in enumerate(moments):
+        body, etag, seconds_left = snapshots.get(moment)
+        assert snapshots.interval_of(moment) == position
+        assert body == full_body(app_context, index, position)
+        if position < len(index.boundaries):
+            assert seconds_left == (index.boundaries[position] - moment).total_seconds()
+        else:
+            assert seconds_left is None
+
+    # Держатся только последние промежутки и по фрагменту на письмо
+    assert len(snapshots._bodies) == 4
+    cached = sum(len(body) for body, _ in snapshots._bodies.values())
+    fragments = sum(len(fragment) for fragment in snapshots._fragments.values())
+    assert snapshots.size_bytes == cached + fragments
+    assert len(snapshots._fragments) <= len(index.variants)
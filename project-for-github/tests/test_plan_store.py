@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+
+import pytest
+
+from conftest import make_variant
+from itinerary import get_itinerary_planner
+from plan_store import PlanStore
+from search import get_search_index
+
+
+def write_plan(plans_dir, plan_id, content):
+    path = os.path.join(plans_dir, f"{plan_id}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content if isinstance(content, str) else json.dumps(content, ensure_ascii=False))
+    return path
+
+
+def plan_schedule(count):
+    return {"cover": {}, "variants": [make_variant(f"{i}a", "31.12", f"{18 + i % 6}:00") for i in range(count)]}
+
+
+def test_invalid_plan_id_rejected(tmp_path):
+    store = PlanStore(str(tmp_path))
+    write_plan(str(tmp_path), "good", plan_schedule(2))
+    assert store.get("good") is not None
+    assert store.get("good\n") is None
+    assert store.get("../good") is None
+
+
+def test_broken_plan_is_not_found_and_not_reparsed(tmp_path, caplog):
+    store = PlanStore(str(tmp_path))
+    path = write_plan(str(tmp_path), "broken", "{not json")
+    assert store.get("broken") is None
+    assert store.get("broken") is None
+    assert len([record for record in caplog.records if "broken" in record.getMessage()]) == 1
+
+    write_plan(str(tmp_path), "invalid", {"variants": [{"id": "1a"}]})
+    assert store.get("invalid") is None
+
+    # Файл исправили - план компилируется
+    write_plan(str(tmp_path), "broken", plan_schedule(1))
+    os.utime(path, ns=(1, 1))
+    assert store.get("broken") is not None
+
+
+def test_response_growth_counts_toward_budget(tmp_path):
+    for plan_id in ("first", "second"):
+        write_plan(str(tmp_path), plan_id, plan_schedule(3))
+    store = PlanStore(str(tmp_path))
+    first = store.get("first")
+    store.max_bytes = first.size_bytes * 2 + 1000
+    store.get("second")
+    assert set(store._plans) == {"first", "second"}
+
+    # Ответы плана растут после компиляции; при следующем обращении
+    # бюджет превышен и вытесняется давно не использованный план
+    first.responses.get_body("big", lambda: b"x" * 5000, first.index.version)
+    store.get("first")
+    assert list(store._plans) == ["first"]
+
+
+@pytest.mark.parametrize("field, value", [
+    ("duration", 30),
+    ("end_time", 1830),
+    ("start_time", None),
+    ("id", 7),
+    ("end_date", 1),
+])
+def test_plan_with_non_string_field_is_not_found(tmp_path, field, value):
+    schedule = plan_schedule(2)
+    schedule["variants"][1][field] = value
+    write_plan(str(tmp_path), "typed", schedule)
+    assert PlanStore(str(tmp_path)).get("typed") is None
+
+
+def test_waiters_get_plan_even_if_it_is_evicted(tmp_path, monkeypatch):
+    write_plan(str(tmp_path), "slow", plan_schedule(3))
+    store = PlanStore(str(tmp_path), max_bytes=0)
+    started, release = threading.Event(), threading.Event()
+    compile_plan = store._compile
+
+    def slow_compile(plan_id):
+        started.set()
+        release.wait()
+        return compile_plan(plan_id)
+
+    monkeypatch.setattr(store, "_compile", slow_compile)
+    results = []
+    first = threading.Thread(target=lambda: results.append(store.get("slow")))
+    first.start()
+    started.wait()
+    waiting = threading.Event()
+    compilation = store._compiling["slow"]
+    done_wait = compilation.done.wait
+    compilation.done.wait = lambda: waiting.set() or done_wait()
+    waiter = threading.Thread(target=lambda: results.append(store.get("slow")))
+    waiter.start()
+    waiting.wait()
+    release.set()
+    first.join()
+    # План вытесняется сразу после компиляции, ожидавший запрос получает его же
+    store.clear()
+    waiter.join()
+    assert len(results) == 2 and results[0] is results[1] is not None
+
+
+def test_changed_plan_file_is_recompiled(tmp_path):
+    path = write_plan(str(tmp_path), "live", plan_schedule(2))
+    store = PlanStore(str(tmp_path), check_seconds=0)
+    plan = store.get("live")
+    assert store.get("live") is plan
+
+    write_plan(str(tmp_path), "live", plan_schedule(3))
+    os.utime(path, ns=(1, 1))
+    changed = store.get("live")
+    assert changed is not plan and len(changed.index.variants) == 3
+
+    os.remove(path)
+    assert store.get("live") is None
+    assert "live" not in store._plans and store._total_bytes == 0
+
+
+def test_index_caches_count_toward_plan_size(tmp_path):
+    write_plan(str(tmp_path), "cached", plan_schedule(5))
+    plan = PlanStore(str(tmp_path)).get("cached")
+    before = plan.size_bytes
+    search_index = get_search_index(plan.index)
+    planner = get_itinerary_planner(plan.index)
+    planner.plan({})
+    assert search_index.size_bytes > 0 and planner.size_bytes > 0
+    assert plan.size_bytes == before + search_index.size_bytes + planner.size_bytes
@@ -0,0 +1,69 @@
+import copy
+
+import pytest
+
+import schedule_data
+from conftest import make_variant
+from response_cache import CACHE_CONTROL, MAX_CACHED_VERSIONS, ResponseCache
+
+
+@pytest.fixture
+def client():
+    from app import app
+    original = schedule_data.schedule
+    yield app.test_client()
+    schedule_data.load_schedule(original)
+
+
+def counting_builder(calls, body):
+    def build():
+        calls.append(body)
+        return body
+    return build
+
+
+def test_etag_and_not_modified(client):
+    first = client.get("/api/letters")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == CACHE_CONTROL
+
+    cached = client.get("/api/letters", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+    assert cached.headers["ETag"] == etag
+    assert client.get("/api/letters", headers={"If-None-Match": '"other"'}).data == first.data
+
+    changed = copy.deepcopy(schedule_data.schedule)
+    changed["variants"].append(make_variant("999a", "01.01", "02:00"))
+    schedule_data.load_schedule(changed)
+    reloaded = client.get("/api/letters", headers={"If-None-Match": etag})
+    assert reloaded.status_code == 200
+    assert reloaded.headers["ETag"] != etag
+
+
+def test_old_versions_are_evicted():
+    cache = ResponseCache()
+    calls = []
+    for version in range(MAX_CACHED_VERSIONS + 1):
+        cache.get_body("letters", counting_builder(calls, b"v%d" % version), version)
+    assert cache.size_bytes == 2 * MAX_CACHED_VERSIONS
+    assert cache.entries(0, ["letters"]) == {}
+
+    # Свежие версии берутся из кэша, вытесненная строится заново
+    cache.get_body("letters", counting_builder(calls, b"new"), MAX_CACHED_VERSIONS)
+    assert len(calls) == MAX_CACHED_VERSIONS + 1
+    body, etag = cache.get_body("letters", counting_builder(calls, b"v0"), 0)
+    assert len(calls) == MAX_CACHED_VERSIONS + 2
+    assert cache.get_body("letters", counting_builder(calls, b"v0"), 0) == (body, etag)
+
+
+def test_revision_rebuilds_entry():
+    cache = ResponseCache()
+    calls = []
+    cache.get_body("initial", counting_builder(calls, b"rev-1"), "v", revision=1)
+    cache.get_body("initial", counting_builder(calls, b"rev-1"), "v", revision=1)
+    body, _ = cache.get_body("initial", counting_builder(calls, b"rev-22"), "v", revision=22)
+    assert body == b"rev-22"
+    assert calls == [b"rev-1", b"rev-22"]
+    assert cache.size_bytes == len(b"rev-22")
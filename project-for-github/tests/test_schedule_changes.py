@@ -0,0 +1,64 @@
+import copy
+
+import pytest
+
+import schedule_data
+from conftest import make_variant
+from schedule_data import ScheduleChangeLog, ScheduleIndex
+
+
+def revisioned(variants, revision):
+    index = ScheduleIndex(variants)
+    index.revision = revision
+    return index
+
+
+def test_changes_since_folds_entries():
+    first = revisioned([make_variant("1a", "31.12", "20:00"), make_variant("2a", "31.12", "21:00")], 1)
+    second = revisioned([make_variant("1a", "31.12", "20:00", title="Новое"), make_variant("3a", "31.12", "22:00")], 5)
+    third = revisioned([make_variant("1a", "31.12", "20:00", title="Новое"), make_variant("2a", "31.12", "21:00")], 9)
+    log = ScheduleChangeLog()
+    log.record(first, second)
+    log.record(second, third)
+
+    assert log.changes_since(1, 5) == {"added": ["3a"], "removed": ["2a"], "modified": ["1a"]}
+    # 3a добавлен и снова удален, 2a удален и снова добавлен
+    assert log.changes_since(1, 9) == {"added": [], "removed": [], "modified": ["1a", "2a"]}
+    assert log.changes_since(5, 9) == {"added": ["2a"], "removed": ["3a"], "modified": []}
+    assert log.changes_since(9, 9) == {"added": [], "removed": [], "modified": []}
+
+
+def test_changes_since_unknown_revision_needs_full_resync():
+    log = ScheduleChangeLog(max_entries=1)
+    indexes = [revisioned([make_variant("1a", "31.12", f"2{i}:00")], i + 1) for i in range(3)]
+    log.record(indexes[0], indexes[1])
+    log.record(indexes[1], indexes[2])
+    assert log.changes_since(1, 3) is None
+    assert log.changes_since(4, 3) is None
+    assert log.changes_since(2, 3) is not None
+
+
+@pytest.fixture
+def client():
+    from app import app
+    original = schedule_data.schedule
+    yield app.test_client()
+    schedule_data.load_schedule(original)
+
+
+def test_initial_revision_follows_reload_to_cached_content(client):
+    original = schedule_data.schedule
+    changed = copy.deepcopy(original)
+    changed["variants"].append(make_variant("999a", "01.01", "02:00"))
+
+    first = client.get("/api/initial").get_json()
+    schedule_data.load_schedule(changed)
+    assert client.get("/api/initial").get_json()["revision"] == schedule_data.get_schedule_index().revision
+    # Содержимое вернулось прежним (та же версия в кэше), номер ревизии - новый
+    schedule_data.load_schedule(original)
+    revision = schedule_data.get_schedule_index().revision
+    assert revision > first["revision"] + 1
+    assert client.get("/api/initial").get_json()["revision"] == revision
+    assert f'"revision": {revision}'.encode() in client.get("/letters").data
+    changes = client.get(f"/api/letters/changes?since={revision}").get_json()
+    assert changes["revision"] == revision and not changes["full_resync"]
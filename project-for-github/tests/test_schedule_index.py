@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import schedule_data
+from benchmarks.synthetic import generate_schedule
+from conftest import make_variant
+from schedule_data import format_datetime, get_duration_minutes, parse_datetime
+
+
+# Прежние линейные реализации: проход по всем вариантам на каждый вызов
+
+def linear_start(variant):
+    return parse_datetime(variant["date"], variant["start_time"])
+
+
+def linear_end(variants, variant):
+    if variant.get("end_date"):
+        return parse_datetime(variant["end_date"], variant["end_time"])
+    if variant["end_time"] != "-" and variant["end_time"]:
+        return linear_start(variant) + timedelta(minutes=get_duration_minutes(variant["duration"]))
+    later = linear_after(variants, linear_start(variant))
+    return linear_start(later[0]) if later else None
+
+
+def linear_available(variants, ends, target_dt):
+    available = []
+    for variant, end_dt in zip(variants, ends):
+        start_dt = linear_start(variant)
+        if start_dt <= target_dt and (end_dt is None or target_dt < end_dt):
+            available.append(variant)
+    return available
+
+
+def linear_after(variants, target_dt):
+    return sorted((v for v in variants if linear_start(v) > target_dt), key=linear_start)
+
+
+def linear_by_datetime(variants, date_str, time_str):
+    return [v for v in variants if v["date"] == date_str and v["start_time"] == time_str]
+
+
+def ids(variants):
+    return [variant["id"] for variant in variants]
+
+
+def with_edge_cases(variants):
+    """Добавляет варианты нулевой длины, открытые и с одинаковым началом"""
+    return variants + [
+        make_variant("900a", "31.12", "21:00", duration="0 минут"),
+        make_variant("901a", "31.12", "21:00", duration="45 минут", end_time="21:45"),
+        make_variant("902b", "31.12", "23:50", duration="-", end_time="-"),
+        make_variant("903a", "31.12", "23:30", duration="1 час", end_time="00:30", end_date="01.01"),
+        make_variant("904b", "01.01", "05:00", duration="-", end_time="-"),
+    ]
+
+
+SCHEDULES = {
+    "builtin": lambda original: original,
+    "synthetic": lambda original: {
+        "cover": {},
+        "variants": with_edge_cases(generate_schedule(300, seed=11)["variants"]),
+    },
+}
+
+
+@pytest.fixture(params=sorted(SCHEDULES))
+def variants(request):
+    original = schedule_data.schedule
+    schedule_data.load_schedule(SCHEDULES[request.param](original))
+    yield schedule_data.schedule["variants"]
+    schedule_data.load_schedule(original)
+
+
+def probe_moments(variants, ends):
+    moments = {linear_start(v) for v in variants}
+    moments |= {end for end in ends if end is not None}
+    moment = datetime(2024, 12, 31, 14, 0)
+    while moment < datetime(2025, 1, 1, 6, 0):
+        moments.add(moment)
+        moment += timedelta(minutes=7)
+    return sorted(moments)
+
+
+def test_start_and_end_match_linear(variants):
+    for variant in variants:
+        assert schedule_data.get_variant_by_id(variant["id"]) is variant
+        assert schedule_data.get_variant_datetime(variant) == linear_start(variant)
+        assert schedule_data.get_variant_end_datetime(variant) == linear_end(variants, variant)
+    assert schedule_data.get_variant_by_id("нет такого") is None
+
+
+def test_queries_match_linear(variants):
+    ends = [linear_end(variants, variant) for variant in variants]
+    moments = probe_moments(variants, ends)
+    pairs = [tuple(format_datetime(moment).split(" ")) for moment in moments]
+    batched = schedule_data.get_variants_available_at_datetimes(pairs)
+    for (date_str, time_str), moment, batch in zip(pairs, moments, batched):
+        expected = ids(linear_available(variants, ends, moment))
+        assert ids(schedule_data.get_variants_available_at_datetime(date_str, time_str)) == expected
+        assert ids(batch) == expected
+        assert ids(schedule_data.get_next_variants_after_datetime(date_str, time_str)) == \
+            ids(linear_after(variants, moment))
+        assert ids(schedule_data.get_variants_by_datetime(date_str, time_str)) == \
+            ids(linear_by_datetime(variants, date_str, time_str))
@@ -0,0 +1,78 @@
+import os
+import pickle
+
+import pytest
+
+import schedule_snapshot
+from conftest import make_variant
+from schedule_data import ScheduleIndex
+from search import SearchIndex
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(schedule_snapshot, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(schedule_snapshot, "SNAPSHOT_ENABLED", True)
+    return tmp_path
+
+
+def compiled(variants, source):
+    schedule = {"cover": {}, "variants": variants}
+    index = ScheduleIndex(variants)
+    key = schedule_snapshot.source_key(source)
+    schedule_snapshot.remember_source(index, key, schedule)
+    return schedule, index, key
+
+
+def test_roundtrip_keeps_data_and_shared_variants(snapshot_dir):
+    variants = [make_variant("1a", "31.12", "20:00", title="Салют"), make_variant("2b", "31.12", "20:15")]
+    schedule, index, key = compiled(variants, b"first")
+    extras = {"responses": {"letters": (b"{}\n", "etag")}, "search": SearchIndex(index)}
+    assert schedule_snapshot.save(index, extras)
+
+    loaded_schedule, loaded_index = schedule_snapshot.load(key)
+    assert loaded_schedule == schedule
+    assert loaded_index.starts == index.starts and loaded_index.ends == index.ends
+    assert list(loaded_index.columns.ends) == list(index.columns.ends)
+    # Варианты расписания и индекса - одни и те же объекты, как до сохранения
+    variant = loaded_index.get_by_id("1a")
+    assert loaded_schedule["variants"][0] is variant
+    assert loaded_index.slot_of(variant) is not None
+    loaded_extras = schedule_snapshot.loaded_extras(loaded_index)
+    assert loaded_extras["responses"] == {"letters": (b"{}\n", "etag")}
+    assert loaded_extras["search"].vocabulary == extras["search"].vocabulary
+
+
+def test_changed_source_invalidates_snapshot(snapshot_dir):
+    _, index, old_key = compiled([make_variant("1a", "31.12", "20:00")], b"first")
+    schedule_snapshot.save(index, {})
+    assert schedule_snapshot.load(old_key) is not None
+
+    _, new_index, new_key = compiled([make_variant("1a", "31.12", "21:00")], b"second")
+    assert new_key != old_key
+    assert schedule_snapshot.load(new_key) is None
+    schedule_snapshot.save(new_index, {})
+    # Снимок прежней версии удален
+    assert schedule_snapshot.load(old_key) is None
+    assert len(os.listdir(snapshot_dir)) == 1
+
+
+def test_pickle_payload_is_not_executed(snapshot_dir):
+    key = schedule_snapshot.source_key(b"untrusted")
+    payload = pickle.dumps({"schedule": {}, "index": None, "extras": {}})
+    header = schedule_snapshot.SNAPSHOT_HEADER.pack(
+        schedule_snapshot.SNAPSHOT_MAGIC, schedule_snapshot.SNAPSHOT_FORMAT_VERSION, key, len(payload)
+    )
+    with open(schedule_snapshot.snapshot_path(key), "wb") as f:
+        f.write(header + payload)
+    assert schedule_snapshot.load(key) is None
+
+
+def test_unknown_class_is_rejected(snapshot_dir):
+    with pytest.raises(TypeError):
+        schedule_snapshot._dumps({"value": object()})
+    data = schedule_snapshot._dumps({"value": 1})
+    forged = data.replace(b'{"value":1}', b'{"value":{"$o":["os","x"]}}')
+    forged = schedule_snapshot.SNAPSHOT_JSON_LENGTH.pack(len(forged) - 8) + forged[8:]
+    with pytest.raises(KeyError):
+        schedule_snapshot._loads(memoryview(forged))
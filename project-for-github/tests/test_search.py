@@ -0,0 +1,115 @@
+import search
+from conftest import make_variant
+from schedule_data import ScheduleIndex
+from search import SearchIndex, normalize_text, stem, tokenize
+
+
+def build(titles_and_descriptions):
+    # Начало - через минуту после предыдущего: позиции в индексе совпадают с порядком строк
+    variants = [
+        make_variant(
+            f"{slot}a", "31.12" if slot < 24 * 60 else "01.01", f"{slot // 60 % 24:02d}:{slot % 60:02d}",
+            title=title, description=description,
+        )
+        for slot, (title, description) in enumerate(titles_and_descriptions)
+    ]
+    index = ScheduleIndex(variants)
+    return index, SearchIndex(index)
+
+
+def found_ids(index, search_index, query, limit=20):
+    results, _ = search_index.search(query, limit)
+    return {index.variants[slot]["id"] for _, slot in results}
+
+
+def test_normalization():
+    assert normalize_text("ЁЛКА Ｆｉｌｍ") == "елка film"
+    assert tokenize("Салюты, и фильм!") == ["салюты", "фильм"]
+    assert stem("салюты") == stem("салютом") == "салют"
+    assert stem("ёж") == "ёж"
+
+
+def test_words_are_combined_with_and():
+    index, search_index = build([
+        ("Салют во дворе", "смотрим салюты"),
+        ("Фильм", "новогодний фильм"),
+        ("Салют и фильм", ""),
+        ("Караоке", "песни и салют"),
+    ])
+    assert found_ids(index, search_index, "салютами") == {"0a", "2a", "3a"}
+    assert found_ids(index, search_index, "салют фильм") == {"2a"}
+    assert found_ids(index, search_index, "Ёлка салют") == set()
+    # Последнее слово - по префиксу, слово с опечаткой - по триграммам
+    assert found_ids(index, search_index, "кара") == {"3a"}
+    assert found_ids(index, search_index, "салютв") == {"0a", "2a", "3a"}
+
+
+def test_single_typos_are_found():
+    index, search_index = build([
+        ("Салют во дворе", ""),
+        ("Новогодний фильм", ""),
+        ("Подарки под елкой", ""),
+        ("Караоке", ""),
+        ("Торт", ""),
+    ])
+    for query, expected in [
+        ("салбт", "0a"), ("филм", "1a"), ("пдарки", "2a"),  # замена, удаление
+        ("салтю", "0a"), ("каракое", "3a"), ("трот", "4a"),  # перестановка соседних букв
+        ("фильмм", "1a"), ("подаркии", "2a"),  # лишняя буква
+    ]:
+        assert found_ids(index, search_index, query) == {expected}, query
+    # Две правки в коротком слове - уже другое слово
+    assert found_ids(index, search_index, "сакот") == set()
+
+
+def test_edit_distance():
+    assert search.edit_distance("салют", "салют", 1) == 0
+    assert search.edit_distance("салбт", "салют", 1) == 1
+    assert search.edit_distance("салтю", "салют", 1) == 1
+    assert search.edit_distance("караоке", "каракое", 2) == 1
+    assert search.edit_distance("kitten", "sitting", 2) == 3
+
+
+def test_and_query_finds_matches_beyond_scan_limit(monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_SCAN_LIMIT", 400)
+    # "салют" - в вариантах 0..999, "фильм" - в 500..1499: оба слова только в
+    # 500..999, а первые 400 вариантов самого редкого слова под запрос не подходят
+    rows = []
+    for slot in range(1500):
+        words = []
+        if slot < 1000:
+            words.append("салют")
+        if slot >= 500:
+            words.append("фильм")
+        rows.append((" ".join(words), ""))
+    index, search_index = build(rows)
+
+    results, truncated = search_index.search("салют фильм", limit=20)
+    assert not truncated
+    assert [slot for _, slot in results] == list(range(500, 520))
+
+    payload = search_index.search_payload("салют", limit=20)
+    assert not payload["truncated"] and len(payload["results"]) == 20
+
+
+def test_scan_limit_applies_to_ranked_matches(monkeypatch):
+    monkeypatch.setattr(search, "SEARCH_SCAN_LIMIT", 400)
+    # "фильм" - в названиях 0..599, "салют" - в описаниях 0..499 и в названиях
+    # 500..1099: у всех кандидатов "фильм" одна оценка, а по "салюту" лучшие
+    # идут после первых 400 - отсечь перебор оценкой нельзя
+    rows = []
+    for slot in range(1100):
+        title = ["фильм"] if slot < 600 else []
+        description = []
+        if slot < 500:
+            description.append("салют")
+        else:
+            title.append("салют")
+        rows.append((" ".join(title), " ".join(description)))
+    index, search_index = build(rows)
+
+    results, truncated = search_index.search("салют фильм", limit=20)
+    # Перебор остановлен лимитом, но выдача из подходящих вариантов не пустая
+    assert truncated
+    assert len(results) == 20
+    assert all(slot < 600 for _, slot in results)